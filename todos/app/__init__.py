@@ -1,24 +1,42 @@
-from fastapi import FastAPI
-from twilio.rest import Client as TwilioClient
-
-from .settings import get_settings
-from .initializers import (
-	register_database,
-	add_middlewares,
-	add_exception_handlers,
-	include_routers,
-)
-
-
-settings = get_settings()
-
-app = FastAPI()
-register_database(app)
-add_middlewares(app)
-add_exception_handlers(app)
-include_routers(app)
-
-app.state.twilio_client = TwilioClient(
-	settings.TWILIO_ACCOUNT_SID,
-	settings.TWILIO_AUTH_TOKEN,
-)
+"""The application is made by `create_app` on first access to `app`, as
+`gunicorn app:app` and the tests do. The SMS worker, migrations and
+other tools import modules of the package without making it."""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+	from fastapi import FastAPI
+
+	app: FastAPI
+
+
+def create_app() -> FastAPI:
+	from fastapi import FastAPI
+
+	from .initializers import (
+		register_database,
+		register_worker_pools,
+		add_middlewares,
+		register_metrics,
+		add_exception_handlers,
+		include_routers,
+	)
+
+	rv = FastAPI()
+	register_database(rv)
+	register_worker_pools(rv)
+	add_middlewares(rv)
+	register_metrics(rv)
+	add_exception_handlers(rv)
+	include_routers(rv)
+	return rv
+
+
+def __getattr__(name: str) -> Any:
+	if name == "app":
+		global app
+		app = create_app()
+		return app
+	raise AttributeError("module %r has no attribute %r" % (__name__, name))
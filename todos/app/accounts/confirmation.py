@@ -0,0 +1,138 @@
+"""Stores of phone number confirmation codes. The one to use is chosen
+with `CONFIRMATION_CODE_STORE`."""
+
+import secrets
+import importlib
+from abc import ABC, abstractmethod
+from enum import Enum
+from datetime import datetime, timezone
+
+from tortoise.transactions import in_transaction
+
+from .models import ConfirmationCode
+from ..helpers import TTLCache
+from ..settings import get_settings
+
+
+settings = get_settings()
+
+
+class CodeCheck(str, Enum):
+	VALID = "valid"
+	INVALID = "invalid"
+	# The code was not issued or has expired
+	MISSING = "missing"
+	# The last attempt was invalid, so the code was discarded
+	EXHAUSTED = "exhausted"
+
+
+def _check_code(issued_code: str, attempts: int, code: str, /) -> CodeCheck:
+	""":param attempts: Attempts including the current one"""
+
+	if secrets.compare_digest(issued_code, code):
+		return CodeCheck.VALID
+	elif attempts >= settings.CONFIRMATION_CODE_MAX_ATTEMPTS:
+		return CodeCheck.EXHAUSTED
+	return CodeCheck.INVALID
+
+
+class ConfirmationCodeStore(ABC):
+	"""Keeps the last issued code of every user until it is confirmed,
+	expires or runs out of attempts."""
+
+	async def issue(self, user_id: int, /) -> str:
+		""":return: A new code, which replaces the previous one"""
+
+		code = secrets.token_hex(3)
+		await self._save(user_id, code)
+		return code
+
+	@abstractmethod
+	async def check(self, user_id: int, code: str, /) -> CodeCheck:
+		"""Counts the attempt. Valid codes are discarded."""
+
+	@abstractmethod
+	async def _save(self, user_id: int, code: str, /) -> None:
+		pass
+
+
+class _MemoryEntry:
+	__slots__ = ("code", "attempts")
+
+	def __init__(self, code: str, /) -> None:
+		self.code = code
+		self.attempts = 0
+
+
+class MemoryConfirmationCodeStore(ConfirmationCodeStore):
+	"""Keeps codes in the memory of the process, so it is usable only with
+	a single server process."""
+
+	def __init__(self) -> None:
+		self._entries: TTLCache[int, _MemoryEntry] = TTLCache(
+			settings.CONFIRMATION_CODE_MEMORY_MAX_SIZE,
+			settings.CONFIRMATION_CODE_TTL.total_seconds(),
+		)
+
+	async def check(self, user_id: int, code: str, /) -> CodeCheck:
+		entry = self._entries.get(user_id)
+		if entry is None:
+			return CodeCheck.MISSING
+
+		entry.attempts += 1
+		rv = _check_code(entry.code, entry.attempts, code)
+		if rv != CodeCheck.INVALID:
+			self._entries.delete(user_id)
+		return rv
+
+	def clear(self) -> None:
+		self._entries.clear()
+
+	async def _save(self, user_id: int, code: str, /) -> None:
+		self._entries.set(user_id, _MemoryEntry(code))
+
+
+class DatabaseConfirmationCodeStore(ConfirmationCodeStore):
+	"""Keeps codes in the database, so they are shared by all server
+	processes and nodes."""
+
+	async def check(self, user_id: int, code: str, /) -> CodeCheck:
+		connection_name = ConfirmationCode._meta.default_connection
+		async with in_transaction(connection_name) as connection:
+			entry = await ConfirmationCode.filter(
+				user_id=user_id,
+				expires_at__gt=datetime.now(timezone.utc),
+			).select_for_update().using_db(connection).first()
+			if entry is None:
+				return CodeCheck.MISSING
+
+			entry.attempts += 1  # type: ignore
+			rv = _check_code(entry.code, entry.attempts, code)
+			if rv == CodeCheck.INVALID:
+				await entry.save(using_db=connection, update_fields=("attempts",))
+			else:
+				await entry.delete(using_db=connection)
+
+		return rv
+
+	async def _save(self, user_id: int, code: str, /) -> None:
+		connection_name = ConfirmationCode._meta.default_connection
+		async with in_transaction(connection_name) as connection:
+			# It also removes the expired code of the user
+			await ConfirmationCode.filter(user_id=user_id) \
+				.using_db(connection).delete()
+			await ConfirmationCode.create(
+				user_id=user_id,
+				code=code,
+				expires_at=datetime.now(timezone.utc)
+				+ settings.CONFIRMATION_CODE_TTL,
+				using_db=connection,
+			)
+
+
+def make_confirmation_code_store() -> ConfirmationCodeStore:
+	module_name, class_name = settings.CONFIRMATION_CODE_STORE.rsplit(".", 1)
+	return getattr(importlib.import_module(module_name), class_name)()
+
+
+confirmation_code_store = make_confirmation_code_store()
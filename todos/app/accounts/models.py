@@ -1,19 +1,41 @@
 from __future__ import annotations
 
-from typing import Any
-from datetime import datetime
+from typing import Any, Dict, Optional
 
-import jwt
-from tortoise import fields, Tortoise
+from tortoise import Tortoise, fields
 from tortoise.validators import MinLengthValidator, RegexValidator
 from bcrypt import hashpw, checkpw, gensalt
 
+from ..tokens import encode_token
 from ..settings import get_settings
-from ..helpers import BaseModel, send_sms
+from ..helpers import BaseModel, TTLCache, WorkerPool
+from ..sms.models import SmsMessage
 
 
 settings = get_settings()
 
+# Field values of recently fetched active users by their ids
+user_cache: TTLCache[int, Dict[str, Any]] = TTLCache(
+	settings.USER_CACHE_MAX_SIZE,
+	settings.USER_CACHE_TTL.total_seconds(),
+)
+# Postgres channel of the ids of saved users, see `listen_for_user_changes`
+USER_CHANGES_CHANNEL = "user_changes"
+
+# Bcrypt takes hundreds of milliseconds, which must not block the event loop
+password_hashing_pool = WorkerPool(
+	settings.PASSWORD_HASHING_WORKERS,
+	use_processes=settings.PASSWORD_HASHING_USE_PROCESSES,
+)
+
+
+def _hash_password(password: str, /) -> str:
+	return hashpw(password.encode(), gensalt()).decode()
+
+
+def _check_password(password: str, hashed_password: str, /) -> bool:
+	return checkpw(password.encode(), hashed_password.encode())
+
 
 class User(BaseModel):
 	phone_number = fields.CharField(
@@ -28,6 +50,8 @@ class User(BaseModel):
 	)
 	is_active = fields.BooleanField(default=True)
 	phone_number_is_confirmed = fields.BooleanField(default=False)
+	# Incremented to revoke all the tokens of the user
+	token_version = fields.IntField(default=0)
 
 	# todos: fields.ReverseRelation[Todo]
 
@@ -37,6 +61,38 @@ class User(BaseModel):
 	def __repr__(self) -> str:
 		return "<User phone_number=\"%s\">" % self.phone_number
 
+	@classmethod
+	async def get_active(cls, id: int, /) -> User:
+		"""Gets an active user, using a recently cached snapshot of its
+		fields if there is one. Each call returns a new object.
+
+		:raise DoesNotExist: If there is no active user with this id
+		"""
+
+		snapshot = user_cache.get(id)
+		if snapshot is not None:
+			return cls._init_from_db(**snapshot)
+
+		rv = await cls.get(id=id, is_active=True)
+		user_cache.set(id, {
+			field: getattr(rv, field)
+			for field in cls._meta.db_fields
+		})
+		return rv
+
+	async def save(self, *args: Any, **kwargs: Any) -> None:
+		await super().save(*args, **kwargs)
+		user_cache.delete(self.id)
+
+		# Other processes drop the user from their caches once it is
+		# committed, so deactivation and revoked tokens apply at once.
+		connection = kwargs.get("using_db") or self._choose_db(True)
+		if connection.capabilities.dialect == "postgres":
+			await connection.execute_query(
+				"SELECT pg_notify($1, $2)",
+				[USER_CHANGES_CHANNEL, str(self.id)],
+			)
+
 	async def delete(*args: Any, **kwargs: Any) -> None:
 		raise RuntimeError(
 			"You cannot delete a user. Use `.deactivate` instead.",
@@ -44,28 +100,77 @@ class User(BaseModel):
 
 	async def deactivate(self) -> None:
 		self.is_active = False  # type: ignore
-		await self.save(update_fields=("is_active",))
+		self.revoke_tokens()
+		await self.save(update_fields=("is_active", "token_version"))
+
+	def revoke_tokens(self) -> None:
+		"""Invalidates all the tokens of the user once it is saved."""
+		self.token_version += 1  # type: ignore
 
 	def set_password(self, password: str, /) -> None:
-		self.password \
-			= hashpw(password.encode(), gensalt()).decode()  # type: ignore
+		self.password = _hash_password(password)  # type: ignore
 
 	def check_password(self, password: str, /) -> bool:
-		return checkpw(password.encode(), self.password.encode())
+		return _check_password(password, self.password)
+
+	async def set_password_async(self, password: str, /) -> None:
+		# Bound first, so that the result type is inferred from the function
+		hashed_password = await password_hashing_pool.run(
+			_hash_password, password,
+		)
+		self.password = hashed_password  # type: ignore
+
+	async def check_password_async(self, password: str, /) -> bool:
+		return await password_hashing_pool.run(
+			_check_password, password, self.password,
+		)
 
 	def generate_token(self) -> str:
-		expires_at = datetime.utcnow() + settings.TOKEN_MAX_AGE
-		data = {'id': self.id, 'exp': expires_at}
+		return encode_token(
+			self.id,
+			self.token_version,
+			bool(self.phone_number_is_confirmed),
+		)
+
+	async def send_sms(self, message: str, /) -> None:
+		"""Puts the message into the outbox, see `app.sms.worker`."""
+		await SmsMessage.enqueue(self.phone_number, message)
+
+
+def _on_user_changed(payload: Optional[str], /) -> None:
+	if payload is None:
+		# Changes may have been missed
+		user_cache.clear()
+	else:
+		user_cache.delete(int(payload))
+
+
+async def listen_for_user_changes() -> None:
+	"""Drops users saved by other processes from `user_cache`. Only
+	Postgres connections notify of saved users, see `app.database`, other
+	processes see changes on other databases after `USER_CACHE_TTL`."""
 
-		return jwt.encode(
-			data,
-			settings.SECRET_KEY,
-			settings.JWT_ALGORITHM,
-		).decode()
+	assert User._meta.default_connection is not None
+	connection = Tortoise.get_connection(User._meta.default_connection)
+	if hasattr(connection, "listen"):
+		await connection.listen(  # type: ignore
+			USER_CHANGES_CHANNEL, _on_user_changed,
+		)
+
+
+class ConfirmationCode(BaseModel):
+	"""Phone number confirmation codes of
+	`app.accounts.confirmation.DatabaseConfirmationCodeStore`."""
 
-	def send_sms(self, message: str, /) -> None:
-		send_sms(self.phone_number, message)
+	user = fields.OneToOneField(
+		"models.User", related_name=False, on_delete=fields.CASCADE,
+	)
+	code = fields.CharField(max_length=16)
+	attempts = fields.IntField(default=0)
+	expires_at = fields.DatetimeField()
+
+	def __repr__(self) -> str:
+		return "<ConfirmationCode user_id=%s>" % self.user_id  # type: ignore
 
 
 from ..todos.models import Todo  # noqa
-Tortoise.init_models(("app.accounts.models",), "models")
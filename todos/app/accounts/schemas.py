@@ -1,15 +1,26 @@
-from typing import Any, Dict
+from datetime import datetime
+from typing import Any, Dict, List
 
-from tortoise.contrib.pydantic import pydantic_model_creator
 from pydantic import BaseModel, Field, root_validator
 
-from .models import User
 from ..settings import get_settings
+from ..todos.schemas import TodoOut
 
 
 settings = get_settings()
 
-UserOut = pydantic_model_creator(User, name="UserOut", exclude=("password",))
+
+class UserOut(BaseModel):
+	id: int
+	created_at: datetime
+	updated_at: datetime
+	phone_number: str = Field(..., max_length=17)
+	is_active: bool = True
+	phone_number_is_confirmed: bool = False
+	todos: List[TodoOut]
+
+	class Config:
+		orm_mode = True
 
 
 class UserInBase(BaseModel):
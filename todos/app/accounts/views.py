@@ -1,21 +1,41 @@
-import secrets
-from typing import Dict
+from typing import Any, Dict
 
-from fastapi import Body, status, Depends, Request, HTTPException, \
-	BackgroundTasks
+from fastapi import Body, status, Depends, Response, HTTPException
 from . import router, schemas
 from .models import User
+from .confirmation import CodeCheck, confirmation_code_store
 from .. import schemas as common_schemas
+from ..tokens import get_public_jwks
 from ..settings import get_settings
+from ..serializers import get_fields, serialize, make_response
 from ..dependencies import (
+	limit_rate,
+	get_client_ip,
 	get_user_from_form_data,
 	get_user_from_token,
 	get_not_confirmed_user_from_token,
+	get_phone_number_from_token,
+	get_phone_number_from_form_data,
 )
 
 
 settings = get_settings()
 
+_USER_FIELDS = tuple(
+	field for field in get_fields(schemas.UserOut) if field != "todos"
+)
+_USER_TODO_FIELDS = get_fields(schemas.UserOut.__fields__['todos'].type_)
+
+
+async def _serialize_user(user: User, /) -> Dict[str, Any]:
+	# `UserOut` includes all the todos of the user
+	return {
+		**serialize(user, _USER_FIELDS),
+		'todos': await user.todos.all().values(  # type: ignore
+			*_USER_TODO_FIELDS,
+		),
+	}
+
 
 async def _validate_phone_number_unique(phone_number: str, /) -> None:
 	if await User.filter(phone_number=phone_number).exists():
@@ -30,79 +50,122 @@ async def _validate_phone_number_unique(phone_number: str, /) -> None:
 )
 async def create_user(
 	data: schemas.UserInCreate,
-) -> schemas.UserOut:  # type: ignore
+) -> Response:
 	await _validate_phone_number_unique(data.phone_number)
 
 	new_user = User(
 		phone_number=data.phone_number,
 		phone_number_is_confirmed=True,
 	)
-	new_user.set_password(data.password)
+	await new_user.set_password_async(data.password)
 	await new_user.save()
 
-	return await schemas.UserOut.from_tortoise_orm(new_user)
+	return make_response(
+		await _serialize_user(new_user),
+		schemas.UserOut,
+		status_code=status.HTTP_201_CREATED,
+	)
 
 
-@router.post("/token/", response_model=schemas.Token)
+# Limits go before the other dependencies, so that they are checked
+# before passwords are hashed and messages are sent.
+@router.post("/token/", response_model=schemas.Token, dependencies=(
+	Depends(limit_rate(
+		"token:ip", "TOKEN_RATE_LIMIT_PER_IP", get_client_ip,
+	)),
+	Depends(limit_rate(
+		"token:phone_number",
+		"TOKEN_RATE_LIMIT_PER_PHONE_NUMBER",
+		get_phone_number_from_form_data,
+	)),
+))
 async def generate_token(
 	user: User = Depends(get_user_from_form_data),
 ) -> Dict[str, str]:
 	return {'access_token': user.generate_token(), 'token_type': "bearer"}
 
 
+@router.get("/token/keys/")
+async def get_token_keys() -> Dict[str, Any]:
+	"""JSON Web Key Set to validate tokens with, empty unless tokens are
+	signed with an asymmetric algorithm."""
+	return get_public_jwks()
+
+
 @router.get("/profile/", response_model=schemas.UserOut)
 async def get_profile(
 	user: User = Depends(get_user_from_token),
-) -> schemas.UserOut:  # type: ignore
-	return await schemas.UserOut.from_tortoise_orm(user)
+) -> Response:
+	return make_response(await _serialize_user(user), schemas.UserOut)
 
 
 @router.put("/profile/", response_model=schemas.UserOut)
 async def update_profile(
 	data: schemas.UserInUpdate,
 	user: User = Depends(get_user_from_token),
-) -> schemas.UserOut:  # type: ignore
+) -> Response:
 	if data.phone_number != user.phone_number:
 		await _validate_phone_number_unique(data.phone_number)
 
 		if user.phone_number_is_confirmed:
 			user.phone_number_is_confirmed = False  # type: ignore
+			# Their tokens claim the phone number is confirmed
+			user.revoke_tokens()
 
 	user.update_from_dict(data.dict())
 	await user.save()
 
-	return await schemas.UserOut.from_tortoise_orm(user)
+	return make_response(await _serialize_user(user), schemas.UserOut)
 
 
 @router.post(
 	"/phone-number/confirm/ask/",
 	response_model=common_schemas.Message,
+	dependencies=(
+		Depends(limit_rate(
+			"confirm_ask:ip",
+			"CONFIRM_ASK_RATE_LIMIT_PER_IP",
+			get_client_ip,
+		)),
+		Depends(limit_rate(
+			"confirm_ask:phone_number",
+			"CONFIRM_ASK_RATE_LIMIT_PER_PHONE_NUMBER",
+			get_phone_number_from_token,
+		)),
+	),
 )
 async def ask_confirm_phone_number(
-	request: Request,
-	background_tasks: BackgroundTasks,
 	user: User = Depends(get_not_confirmed_user_from_token),
 ) -> Dict[str, str]:
-	code = request.session['confirm_code'] = secrets.token_hex(3)
-	background_tasks.add_task(user.send_sms, "Confirmation code: %s" % code)
+	code = await confirmation_code_store.issue(user.id)
+	await user.send_sms("Confirmation code: %s" % code)
 	return {'message': "A confirmation code was sent to your phone."}
 
 
-@router.post("/phone-number/confirm/", response_model=common_schemas.Message)
+@router.post(
+	"/phone-number/confirm/",
+	response_model=common_schemas.Message,
+	dependencies=(Depends(limit_rate(
+		"confirm:ip", "CONFIRM_RATE_LIMIT_PER_IP", get_client_ip,
+	)),),
+)
 async def confirm_phone_number(
-	request: Request,
 	data: schemas.PhoneNumberConfirm,
 	user: User = Depends(get_not_confirmed_user_from_token),
 ) -> Dict[str, str]:
-	code = request.session.get("confirm_code")
+	check = await confirmation_code_store.check(user.id, data.code)
 
-	if code is None:
+	if check == CodeCheck.MISSING:
 		raise HTTPException(status.HTTP_403_FORBIDDEN,
 							"You did not ask for phone number confirmation.")
-	elif data.code != code:
+	elif check == CodeCheck.EXHAUSTED:
+		raise HTTPException(
+			status.HTTP_429_TOO_MANY_REQUESTS,
+			"Too many invalid codes. Ask for a new one.",
+		)
+	elif check == CodeCheck.INVALID:
 		raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid code.")
 
-	del request.session['confirm_code']
 	user.phone_number_is_confirmed = True  # type: ignore
 	await user.save(update_fields=("phone_number_is_confirmed",))
 
@@ -114,8 +177,9 @@ async def change_password(
 	data: schemas.PasswordChange,
 	user: User = Depends(get_user_from_token),
 ) -> Dict[str, str]:
-	user.set_password(data.new_password)
-	await user.save(update_fields=("password",))
+	await user.set_password_async(data.new_password)
+	user.revoke_tokens()
+	await user.save(update_fields=("password", "token_version"))
 
 	return {'message': "Your password has been successfully changed."}
 
@@ -125,7 +189,7 @@ async def deactivate_user(
 	password: str = Body(..., embed=True),
 	user: User = Depends(get_user_from_token),
 ) -> Dict[str, str]:
-	if not user.check_password(password):
+	if not await user.check_password_async(password):
 		raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid password.")
 
 	await user.deactivate()
@@ -0,0 +1,146 @@
+"""Tortoise engine for Postgres that collects statistics of the connection
+pool and listens for notifications. `initializers.register_database` uses
+it instead of `tortoise.backends.asyncpg`."""
+
+from __future__ import annotations
+
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List, Tuple, Callable, Optional
+
+import asyncpg
+from tortoise.backends.asyncpg.client import AsyncpgDBClient
+from tortoise.backends.base.client import PoolConnectionWrapper
+
+
+class _TimedPoolConnectionWrapper(PoolConnectionWrapper):
+	def __init__(self, client: StatsAsyncpgDBClient, /) -> None:
+		super().__init__(client._pool)
+		self.client = client
+
+	async def __aenter__(self) -> Any:
+		started_at = time.monotonic()
+		self.client.waiting += 1
+		try:
+			return await super().__aenter__()
+		finally:
+			wait_time = time.monotonic() - started_at
+			self.client.waiting -= 1
+			self.client.acquires += 1
+			self.client.total_acquire_time += wait_time
+			self.client.max_acquire_time \
+				= max(self.client.max_acquire_time, wait_time)
+
+
+logger = logging.getLogger(__name__)
+
+# Delay between attempts to reopen the connection of listeners
+_LISTENER_RECONNECT_DELAY = 1.0
+
+
+class StatsAsyncpgDBClient(AsyncpgDBClient):
+	def __init__(self, *args: Any, **kwargs: Any) -> None:
+		super().__init__(*args, **kwargs)
+		self.waiting = 0
+		self.acquires = 0
+		self.total_acquire_time = 0.0
+		self.max_acquire_time = 0.0
+
+		self._listeners: List[Tuple[str, Callable[[Optional[str]], None]]] \
+			= []
+		self._listener_connection: Optional[asyncpg.Connection] = None
+		self._reconnect_task: Optional[asyncio.Task[None]] = None
+
+	async def listen(
+		self, channel: str, callback: Callable[[Optional[str]], None], /,
+	) -> None:
+		"""Calls `callback` with the payloads of `NOTIFY` on the channel,
+		and with `None` once notifications may have been missed, as the
+		connection was lost and reopened. Listeners have a connection of
+		their own, which is closed with the pool."""
+
+		self._listeners.append((channel, callback))
+		if self._listener_connection is None:
+			await self._open_listener_connection()
+		else:
+			await self._add_listener(channel, callback)
+
+	async def _open_listener_connection(self) -> None:
+		connection = await asyncpg.connect(
+			host=self.host,
+			port=self.port,
+			user=self.user,
+			password=self.password,
+			database=self.database,
+			timeout=self.extra.get("timeout", 60),
+		)
+		connection.add_termination_listener(self._on_listener_terminated)
+		self._listener_connection = connection
+		for channel, callback in self._listeners:
+			await self._add_listener(channel, callback)
+
+	async def _add_listener(
+		self, channel: str, callback: Callable[[Optional[str]], None], /,
+	) -> None:
+		await self._listener_connection.add_listener(  # type: ignore
+			channel, lambda *args: callback(args[3]),
+		)
+
+	def _on_listener_terminated(self, connection: Any) -> None:
+		if connection is self._listener_connection:
+			self._listener_connection = None
+			self._reconnect_task = asyncio.create_task(self._reconnect())
+
+	async def _reconnect(self) -> None:
+		while True:
+			await asyncio.sleep(_LISTENER_RECONNECT_DELAY)
+			try:
+				await self._open_listener_connection()
+			except Exception:
+				logger.exception("Failed to reopen the listeners")
+				# The connection may have been opened before a listener
+				# failed to be added, and would leak with the next attempt
+				connection, self._listener_connection \
+					= self._listener_connection, None
+				if connection is not None:
+					connection.terminate()
+				continue
+
+			for _, callback in self._listeners:
+				callback(None)
+			return
+
+	async def _close(self) -> None:
+		self._listeners.clear()
+		if self._reconnect_task is not None:
+			self._reconnect_task.cancel()
+			self._reconnect_task = None
+		connection, self._listener_connection \
+			= self._listener_connection, None
+		if connection is not None:
+			await connection.close()
+		await super()._close()
+
+	def acquire_connection(self) -> _TimedPoolConnectionWrapper:
+		return _TimedPoolConnectionWrapper(self)
+
+	def pool_stats(self) -> Dict[str, float]:
+		size = idle = 0
+		if self._pool is not None:
+			size = self._pool.get_size()
+			idle = self._pool.get_idle_size()
+
+		return {
+			'size': size,
+			'idle': idle,
+			'in_use': size - idle,
+			'max_size': self.pool_maxsize,
+			'waiting': self.waiting,
+			'acquires': self.acquires,
+			'total_acquire_time': self.total_acquire_time,
+			'max_acquire_time': self.max_acquire_time,
+		}
+
+
+client_class = StatsAsyncpgDBClient
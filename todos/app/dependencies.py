@@ -1,30 +1,41 @@
 from __future__ import annotations
 
+import secrets
+from math import ceil
+from typing import Union, Callable, Awaitable
+
 import jwt
 from tortoise.exceptions import DoesNotExist
-from fastapi import Form, status, Depends, HTTPException
+from fastapi import Form, status, Header, Depends, Request, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 
+from .tokens import TokenClaims, decode_token
 from .settings import get_settings
+from .ratelimit.backends import rate_limit_backend
 
 
 settings = get_settings()
 token_scheme = OAuth2PasswordBearer(tokenUrl=settings.TOKEN_URL)
 
 
-async def _get_user_from_token(token: str, /) -> User:
-	algorithms = (settings.JWT_ALGORITHM,)
+def _decode_token(token: str, /) -> TokenClaims:
+	try:
+		return decode_token(token)
+	except jwt.InvalidTokenError:
+		raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid token.")
 
+
+async def _get_user_from_token(token: str, /) -> User:
+	claims = _decode_token(token)
 	try:
-		token_data = jwt.decode(
-			token,
-			settings.SECRET_KEY,
-			algorithms=algorithms,
-		)
-		return await User.get(id=token_data['id'], is_active=True)
-	except (jwt.DecodeError, jwt.ExpiredSignatureError, DoesNotExist):
+		rv = await User.get_active(claims['id'])
+	except DoesNotExist:
 		raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid token.")
 
+	if rv.token_version != claims['ver']:
+		raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid token.")
+	return rv
+
 
 async def get_user_from_token(token: str = Depends(token_scheme)) -> User:
 	return await _get_user_from_token(token)
@@ -45,6 +56,19 @@ async def get_not_confirmed_user_from_token(
 async def get_confirmed_user_from_token(
 	token: str = Depends(token_scheme),
 ) -> User:
+	"""With `TOKEN_TRUST_CLAIMS` tokens of confirmed users give partial
+	users with the fields of the claims only, which cannot be saved."""
+
+	if settings.TOKEN_TRUST_CLAIMS:
+		claims = _decode_token(token)
+		if claims['confirmed']:
+			return User._init_from_db(
+				id=claims['id'],
+				is_active=True,
+				phone_number_is_confirmed=True,
+				token_version=claims['ver'],
+			)
+
 	rv = await _get_user_from_token(token)
 	if not rv.phone_number_is_confirmed:
 		raise HTTPException(
@@ -59,7 +83,7 @@ async def get_user_from_form_data(
 	password: str = Form(..., min_length=6, max_length=255),
 ) -> User:
 	rv = await User.get_or_none(phone_number=phone_number, is_active=True)
-	if rv is not None and rv.check_password(password):
+	if rv is not None and await rv.check_password_async(password):
 		return rv
 
 	raise HTTPException(
@@ -68,5 +92,68 @@ async def get_user_from_form_data(
 	)
 
 
+def get_client_ip(request: Request) -> str:
+	# Gunicorn takes it from `X-Forwarded-For` of nginx
+	return request.client.host
+
+
+def get_phone_number_from_form_data(
+	phone_number: str = Form(..., min_length=10, max_length=17),
+) -> str:
+	return phone_number
+
+
+async def get_phone_number_from_token(
+	token: str = Depends(token_scheme),
+) -> str:
+	return (await _get_user_from_token(token)).phone_number
+
+
+def limit_rate(
+	scope: str,
+	limit_setting: str,
+	get_key: Callable[..., Union[str, Awaitable[str]]],
+	/,
+) -> Callable[..., Awaitable[None]]:
+	"""Makes a dependency that answers 429 when the requests with the same
+	key exceed the limit in the scope.
+
+	:param limit_setting: Name of the setting with the number of requests
+	per period, which is read on every request, so that it can be changed
+	after the routes are made
+	:param get_key: Dependency that gets the key of the request
+	"""
+
+	getattr(settings, limit_setting)  # Fails early on a wrong name
+
+	async def dependency(key: str = Depends(get_key)) -> None:
+		requests, period = getattr(settings, limit_setting)
+		retry_after = await rate_limit_backend.hit(
+			"%s:%s" % (scope, key), requests, period,
+		)
+		if retry_after is not None:
+			raise HTTPException(
+				status.HTTP_429_TOO_MANY_REQUESTS,
+				"Too many requests. Try again later.",
+				headers={'Retry-After': str(ceil(retry_after))},
+			)
+
+	return dependency
+
+
 # Circular imports
 from .accounts.models import User
+
+
+def check_health_token(authorization: str = Header("")) -> None:
+	"""Answers 404 unless the request has `HEALTH_TOKEN` as a bearer
+	token, so that the internals are hidden even if nginx is bypassed."""
+
+	scheme, _, token = authorization.partition(" ")
+	is_valid = settings.HEALTH_TOKEN is not None \
+		and scheme.lower() == "bearer" \
+		and secrets.compare_digest(
+			token.encode("latin-1"), settings.HEALTH_TOKEN.encode("latin-1"),
+		)
+	if not is_valid:
+		raise HTTPException(status.HTTP_404_NOT_FOUND, "Not Found")
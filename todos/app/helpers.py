@@ -1,62 +1,306 @@
 from __future__ import annotations
 
+import os
+import time
+import asyncio
 import secrets
+import binascii
+from io import BytesIO
+from pathlib import Path
 from math import ceil
-from typing import Optional, TypedDict
+from hashlib import md5
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
+from functools import partial
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor, \
+	ProcessPoolExecutor
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from typing import (
+	Any,
+	Dict,
+	List,
+	Tuple,
+	Callable,
+	Iterator,
+	Generic,
+	TypeVar,
+	Optional,
+	TypedDict,
+)
 
-from PIL import Image
 from tortoise import models, fields
 from tortoise.queryset import QuerySet
+from tortoise.query_utils import Q
 from fastapi import status, Request, UploadFile, HTTPException
 
-from . import app
 from .settings import get_settings
 
 
 settings = get_settings()
 
+Key = TypeVar("Key")
+Value = TypeVar("Value")
+Result = TypeVar("Result")
 
-def send_sms(to: str, message: str) -> None:
-	app.state.twilio_client.messages.create(
-		to, from_=settings.TWILIO_MOBILE_NUMBER, body=message,
-	)
+
+# Formats in which image variants can be saved
+IMAGE_FORMAT_EXTENSIONS = {'JPEG': "jpg", 'WEBP': "webp"}
+IMAGE_FORMAT_CONTENT_TYPES = {'JPEG': "image/jpeg", 'WEBP': "image/webp"}
+
+
+def make_image_variant_filename(
+	filename: str, width: Optional[int], format: str, /,
+) -> str:
+	"""Makes a filename of a derived image, e.g. `abc_w128.webp` for
+	`abc.jpg`. Without `width` the variant has the full size."""
+
+	stem = filename.rsplit(".", 1)[0]
+	if width is not None:
+		stem += "_w%d" % width
+	return stem + "." + IMAGE_FORMAT_EXTENSIONS[format]
+
+
+def _iter_image_variant_filenames(filename: str, /) -> Iterator[str]:
+	for format in settings.IMAGES_VARIANT_FORMATS:
+		yield make_image_variant_filename(filename, None, format)
+	for width in settings.IMAGES_VARIANT_WIDTHS:
+		yield make_image_variant_filename(filename, width, "JPEG")
+		for format in settings.IMAGES_VARIANT_FORMATS:
+			yield make_image_variant_filename(filename, width, format)
 
 
 def delete_image(filename: str, /) -> None:
 	settings.IMAGES_DIR.joinpath(filename).unlink()
 
+	# Small source images do not have all the variants
+	for variant_filename in _iter_image_variant_filenames(filename):
+		settings.IMAGES_DIR.joinpath(variant_filename).unlink(missing_ok=True)
 
-def save_image(image: UploadFile, /) -> str:
-	"""Generates a filename for the image and saves the image below it.
-	If the size of the transferred image was larger than `IMAGES_MAX_SIZE`,
-	then it will be equated to it.
 
-	:return: Generated filename
+def _parse_accept(accept: str, /) -> Dict[str, float]:
+	""":return: Qualities of the media ranges of the `Accept` header"""
+
+	rv = {}
+	for media_range in accept.split(","):
+		media_type, *params = media_range.split(";")
+		quality = 1.0
+		for param in params:
+			name, _, value = param.partition("=")
+			if name.strip().lower() == "q":
+				try:
+					quality = float(value)
+				except ValueError:
+					quality = 0.0
+		rv[media_type.strip().lower()] = quality
+	return rv
+
+
+def choose_image_format(accept: str, /) -> str:
+	""":return: The first of `IMAGES_VARIANT_FORMATS` that the client
+	explicitly accepts or JPEG. Wildcards are not enough, as they are sent
+	by clients that do not decode every image format."""
+
+	qualities = _parse_accept(accept)
+	return next((
+		format
+		for format in settings.IMAGES_VARIANT_FORMATS
+		if qualities.get(IMAGE_FORMAT_CONTENT_TYPES[format], 0.0) > 0.0
+	), "JPEG")
+
+
+def get_image_variant(
+	filename: str, width: Optional[int], format: str, /,
+) -> Tuple[Path, str]:
+	"""Chooses the smallest saved variant of the image in the `format` that
+	is at least `width` wide. The original JPEG is the fallback.
+
+	:return: Path and content type of the variant
 	"""
 
+	widths: List[Optional[int]] = [None]
+	if width is not None:
+		widths[:0] = sorted(
+			w for w in settings.IMAGES_VARIANT_WIDTHS if w >= width
+		)
+
+	for variant_width in widths:
+		path = settings.IMAGES_DIR.joinpath(
+			make_image_variant_filename(filename, variant_width, format),
+		)
+		if path.exists():
+			return path, IMAGE_FORMAT_CONTENT_TYPES[format]
+
+	return settings.IMAGES_DIR.joinpath(filename), "image/jpeg"
+
+
+def _generate_image_filename() -> str:
+	while True:
+		# Generate unique save path for image
+		filename = secrets.token_hex(16) + ".jpg"
+		if not settings.IMAGES_DIR.joinpath(filename).exists():
+			return filename
+
+
+def _validate_image_content_type(image: UploadFile, /) -> None:
 	if image.content_type not in settings.IMAGES_ALLOWED_CONTENT_TYPES:
 		raise HTTPException(
 			status.HTTP_400_BAD_REQUEST,
 			"Invalid content type.",
 		)
 
-	while True:
-		# Generate unique save path for image
-		filename = secrets.token_hex(16) + ".jpg"
-		save_path = settings.IMAGES_DIR.joinpath(filename)
-		if not save_path.exists():
-			break
 
-	with Image.open(image.file) as new_image:
+def _process_image(
+	data: bytes,
+	save_path: str,
+	max_size: Tuple[int, int],
+	variant_widths: Tuple[int, ...],
+	variant_formats: Tuple[str, ...],
+	/,
+) -> None:
+	"""Decodes, shrinks and saves the image with all its variants.
+	It is picklable, so it can be run in another process."""
+
+	# Pillow takes long to import and only workers that process images
+	# need it
+	from PIL import Image
+
+	path = Path(save_path)
+
+	def save_variant(image: Image.Image, width: Optional[int]) -> None:
+		for format in ("JPEG", *variant_formats):
+			if width is None and format == "JPEG":
+				continue
+			image.save(
+				path.with_name(
+					make_image_variant_filename(path.name, width, format),
+				),
+				format,
+				quality=85,
+			)
+
+	with Image.open(BytesIO(data)) as new_image:
+		# JPEG images are decoded right at a reduced scale if it is possible
+		new_image.draft("RGB", max_size)
+
 		# Small important corrections and saving
 		if new_image.mode != "RGB":
 			new_image = new_image.convert("RGB")
-		new_image.thumbnail(settings.IMAGES_MAX_SIZE, Image.LANCZOS)
+		new_image.thumbnail(max_size, Image.LANCZOS)
 		new_image.save(save_path, optimize=True, quality=95)
+		save_variant(new_image, None)
+
+		# Downscale step by step from the largest variant
+		for width in sorted(variant_widths, reverse=True):
+			if width >= new_image.width:
+				continue
+			new_image = new_image.copy()
+			new_image.thumbnail((width, new_image.height), Image.LANCZOS)
+			save_variant(new_image, width)
+
+
+def save_image(image: UploadFile, /) -> str:
+	"""Generates a filename for the image and saves the image below it.
+	If the size of the transferred image was larger than `IMAGES_MAX_SIZE`,
+	then it will be equated to it. Smaller variants and variants in other
+	formats are saved next to it.
+
+	:return: Generated filename
+	"""
+
+	_validate_image_content_type(image)
+	filename = _generate_image_filename()
+	_process_image(
+		image.file.read(),
+		str(settings.IMAGES_DIR.joinpath(filename)),
+		settings.IMAGES_MAX_SIZE,
+		settings.IMAGES_VARIANT_WIDTHS,
+		settings.IMAGES_VARIANT_FORMATS,
+	)
 
 	return filename
 
 
+async def save_image_async(image: UploadFile, /) -> str:
+	"""Does the same as `save_image`, but processes the image in
+	`image_processing_pool`.
+
+	:raise HTTPException: With 503 status if the pool is full
+	"""
+
+	_validate_image_content_type(image)
+	filename = _generate_image_filename()
+
+	try:
+		await image_processing_pool.run(
+			_process_image,
+			await image.read(),
+			str(settings.IMAGES_DIR.joinpath(filename)),
+			settings.IMAGES_MAX_SIZE,
+			settings.IMAGES_VARIANT_WIDTHS,
+			settings.IMAGES_VARIANT_FORMATS,
+		)
+	except WorkerPoolFullError:
+		raise HTTPException(
+			status.HTTP_503_SERVICE_UNAVAILABLE,
+			"Too many images are being processed. Try again later.",
+			headers={'Retry-After': "1"},
+		)
+
+	return filename
+
+
+def make_weak_etag(*parts: Any) -> str:
+	return 'W/"%s"' % md5(repr(parts).encode()).hexdigest()
+
+
+def format_http_date(value: datetime, /) -> str:
+	if value.tzinfo is None:
+		value = value.replace(tzinfo=timezone.utc)
+	return formatdate(value.timestamp(), usegmt=True)
+
+
+def is_not_modified(
+	request: Request,
+	etag: str,
+	last_modified: Optional[datetime] = None,
+	*,
+	immutable: bool = False,
+) -> bool:
+	"""Checks the `If-None-Match` and `If-Modified-Since` request headers.
+	An immutable resource is not modified since any date.
+
+	:return: Whether the resource can be answered with 304 status
+	"""
+
+	if_none_match = request.headers.get("if-none-match")
+	if if_none_match is not None:
+		# Weak comparison, as it is required for `If-None-Match`
+		etags = {
+			tag.strip().removeprefix("W/")
+			for tag in if_none_match.split(",")
+		}
+		return "*" in etags or etag.removeprefix("W/") in etags
+
+	if_modified_since = request.headers.get("if-modified-since")
+	if if_modified_since is None:
+		return False
+	elif immutable:
+		return True
+	elif last_modified is None:
+		return False
+
+	try:
+		since = parsedate_to_datetime(if_modified_since)
+	except (TypeError, ValueError):
+		return False
+	if since.tzinfo is None:
+		since = since.replace(tzinfo=timezone.utc)
+	if last_modified.tzinfo is None:
+		last_modified = last_modified.replace(tzinfo=timezone.utc)
+	return last_modified.replace(microsecond=0) <= since
+
+
 async def paginate(
 	queryset: QuerySet, view_url: str, current_page: int, per_page: int,
 ) -> PaginationResult:
@@ -72,7 +316,7 @@ async def paginate(
 
 	# On the first page, if there are no objects,
 	# we can place a corresponding inscription.
-	if await queryset.count() < 1 and current_page != 1:
+	if current_page > pages_count and current_page != 1:
 		raise HTTPException(status.HTTP_404_NOT_FOUND, "Page not found.")
 
 	view_url += "?page=%d"
@@ -96,6 +340,243 @@ class PaginationResult(TypedDict):
 	next_page_url: Optional[str]
 
 
+def _encode_cursor(obj: BaseModel, /, *, backwards: bool) -> str:
+	raw = "%s|%s|%d" % (
+		"p" if backwards else "n",
+		obj.created_at.isoformat(),
+		obj.id,
+	)
+	return urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, /) -> Tuple[bool, datetime, int]:
+	try:
+		raw = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+		direction, created_at, id = raw.split("|")
+		if direction not in ("n", "p"):
+			raise ValueError
+		return direction == "p", datetime.fromisoformat(created_at), int(id)
+	except (binascii.Error, UnicodeDecodeError, ValueError):
+		raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid cursor.")
+
+
+async def paginate_by_cursor(
+	queryset: QuerySet, view_url: str, cursor: str, per_page: int,
+) -> CursorPaginationResult:
+	"""Keyset pagination over `(created_at, id)` in descending order.
+	Unlike `paginate`, it does not count objects and does not use `OFFSET`,
+	so every page costs one query regardless of its depth.
+
+	:param cursor: Opaque cursor from a previous page or an empty string
+	for the first page
+	"""
+
+	if per_page < 1:
+		raise ValueError("`per_page` must be >= 1.")
+
+	backwards = False
+	if not cursor:
+		queryset = queryset.order_by("-created_at", "-id")
+	else:
+		backwards, created_at, id = _decode_cursor(cursor)
+		if backwards:
+			queryset = queryset.filter(
+				Q(created_at__gt=created_at)
+				| Q(created_at=created_at, id__gt=id),
+			).order_by("created_at", "id")
+		else:
+			queryset = queryset.filter(
+				Q(created_at__lt=created_at)
+				| Q(created_at=created_at, id__lt=id),
+			).order_by("-created_at", "-id")
+
+	# One extra object tells us whether there is a page behind this one
+	objects = await queryset.limit(per_page + 1)
+	has_more = len(objects) > per_page
+	objects = objects[:per_page]
+
+	if not objects and cursor:
+		raise HTTPException(status.HTTP_404_NOT_FOUND, "Page not found.")
+
+	if backwards:
+		objects.reverse()
+		has_previous, has_next = has_more, True
+	else:
+		has_previous, has_next = bool(cursor), has_more
+
+	previous_cursor = _encode_cursor(objects[0], backwards=True) \
+		if has_previous else None
+	next_cursor = _encode_cursor(objects[-1], backwards=False) \
+		if has_next else None
+
+	view_url += "?cursor=%s"
+	return {
+		'objects': objects,
+		'previous_cursor': previous_cursor,
+		'next_cursor': next_cursor,
+		'previous_page_url': view_url % previous_cursor
+		if previous_cursor is not None else None,
+		'next_page_url': view_url % next_cursor
+		if next_cursor is not None else None,
+	}
+
+
+class CursorPaginationResult(TypedDict):
+	objects: List[models.Model]
+	previous_cursor: Optional[str]
+	next_cursor: Optional[str]
+	previous_page_url: Optional[str]
+	next_page_url: Optional[str]
+
+
+class TTLCache(Generic[Key, Value]):
+	"""Bounded in-process LRU cache whose entries expire after `ttl` seconds.
+	Hits and misses are counted so that the cache can be sized.
+	"""
+
+	def __init__(self, max_size: int, ttl: float) -> None:
+		self.max_size = max_size
+		self.ttl = ttl
+		self.hits = 0
+		self.misses = 0
+		self._data: OrderedDict[Key, Tuple[float, Value]] = OrderedDict()
+
+	def __len__(self) -> int:
+		return len(self._data)
+
+	def get(self, key: Key, /) -> Optional[Value]:
+		item = self._data.get(key)
+		if item is None or item[0] < time.monotonic():
+			if item is not None:
+				del self._data[key]
+			self.misses += 1
+			return None
+
+		self._data.move_to_end(key)
+		self.hits += 1
+		return item[1]
+
+	def set(self, key: Key, value: Value, /) -> None:
+		if self.max_size < 1:
+			return
+
+		self._data[key] = (time.monotonic() + self.ttl, value)
+		self._data.move_to_end(key)
+		while len(self._data) > self.max_size:
+			self._data.popitem(last=False)
+
+	def delete(self, key: Key, /) -> None:
+		self._data.pop(key, None)
+
+	def clear(self) -> None:
+		self._data.clear()
+
+	def stats(self) -> Dict[str, int]:
+		return {'hits': self.hits, 'misses': self.misses, 'size': len(self)}
+
+
+class WorkerPoolFullError(RuntimeError):
+	pass
+
+
+class WorkerPool:
+	"""Runs blocking functions outside of the event loop. At most
+	`max_workers` functions run at the same time, the rest wait in a queue.
+	Processes are useful for functions that hold the GIL.
+
+	The executor is created on first use, so a pool created at import time
+	is safe to inherit by forked workers.
+	"""
+
+	def __init__(
+		self,
+		max_workers: Optional[int] = None,
+		*,
+		use_processes: bool = False,
+		max_queue_size: Optional[int] = None,
+	) -> None:
+		self.max_workers = max_workers or os.cpu_count() or 1
+		self.use_processes = use_processes
+		self.max_queue_size = max_queue_size
+
+		self.queued = 0
+		self.running = 0
+		self.completed = 0
+		self.max_queued = 0
+		self.total_wait_time = 0.0
+
+		self._executor: Optional[Executor] = None
+		self._semaphore: Optional[asyncio.Semaphore] = None
+		self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+	async def run(self, func: Callable[..., Result], /, *args: Any) -> Result:
+		""":raise WorkerPoolFullError: If all workers are busy and
+		`max_queue_size` functions are already waiting"""
+
+		semaphore = self._get_semaphore()
+		if (
+			self.max_queue_size is not None
+			and semaphore.locked()
+			and self.queued >= self.max_queue_size
+		):
+			raise WorkerPoolFullError("The worker pool queue is full.")
+
+		self.queued += 1
+		self.max_queued = max(self.max_queued, self.queued)
+		queued_at = time.monotonic()
+		try:
+			await semaphore.acquire()
+		finally:
+			self.queued -= 1
+		self.total_wait_time += time.monotonic() - queued_at
+
+		self.running += 1
+		try:
+			return await asyncio.get_running_loop().run_in_executor(
+				self._get_executor(), partial(func, *args),
+			)
+		finally:
+			self.running -= 1
+			self.completed += 1
+			semaphore.release()
+
+	def shutdown(self) -> None:
+		if self._executor is not None:
+			self._executor.shutdown()
+			self._executor = None
+
+	def stats(self) -> Dict[str, float]:
+		return {
+			'queued': self.queued,
+			'running': self.running,
+			'completed': self.completed,
+			'max_queued': self.max_queued,
+			'total_wait_time': self.total_wait_time,
+		}
+
+	def _get_executor(self) -> Executor:
+		if self._executor is None:
+			executor_class = ProcessPoolExecutor \
+				if self.use_processes else ThreadPoolExecutor
+			self._executor = executor_class(self.max_workers)
+		return self._executor
+
+	def _get_semaphore(self) -> asyncio.Semaphore:
+		# A semaphore is bound to the loop it was first used in
+		loop = asyncio.get_running_loop()
+		if self._semaphore is None or self._loop is not loop:
+			self._semaphore = asyncio.Semaphore(self.max_workers)
+			self._loop = loop
+		return self._semaphore
+
+
+image_processing_pool = WorkerPool(
+	settings.IMAGES_PROCESSING_WORKERS,
+	use_processes=settings.IMAGES_PROCESSING_USE_PROCESSES,
+	max_queue_size=settings.IMAGES_PROCESSING_MAX_QUEUE_SIZE,
+)
+
+
 class BaseModel(models.Model):
 	id = fields.IntField(pk=True)
 	created_at = fields.DatetimeField(auto_now_add=True)
@@ -1,24 +1,104 @@
+from copy import deepcopy
+from typing import Any, Dict, Optional
+
 from fastapi import FastAPI, Response, Request
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from tortoise.exceptions import ValidationError
 from tortoise.contrib.fastapi import register_tortoise
-from starlette.middleware.sessions import SessionMiddleware
+from tortoise.backends.base.config_generator import expand_db_url
 from traceback import format_exc, format_exception
 
 from . import main, accounts, todos
+from .helpers import image_processing_pool
 from .settings import get_settings
+from .profiling import ProfilingMiddleware
+from .replicas import REPLICA_CONNECTION, ReplicaRouter, \
+	ReplicaRoutingMiddleware
+from .tokens import token_cache
+from .todos.search import create_search_index
+from .todos.models import image_owner_cache
+from .accounts.models import user_cache, password_hashing_pool, \
+	listen_for_user_changes
 
 
 settings = get_settings()
 
 
+def make_database_config(
+	pool_max_size: Optional[int] = None, /,
+) -> Dict[str, Any]:
+	"""Applies the pool settings to Postgres connections of `TORTOISE_ORM`
+	and makes them collect pool statistics, see `app.database`.
+	`pool_max_size` overrides `DB_POOL_MAX_SIZE`.
+	Routes reads to the replica connection if there is one."""
+
+	rv = deepcopy(settings.TORTOISE_ORM)
+	if REPLICA_CONNECTION in rv['connections']:
+		rv['routers'] = [ReplicaRouter]
+
+	for name, connection in rv['connections'].items():
+		if isinstance(connection, str):
+			connection = rv['connections'][name] = expand_db_url(connection)
+		if connection['engine'] != "tortoise.backends.asyncpg":
+			continue
+
+		connection['engine'] = "app.database"
+		connection['credentials'].update({
+			'minsize': settings.DB_POOL_MIN_SIZE,
+			'maxsize': pool_max_size or settings.DB_POOL_MAX_SIZE,
+			'max_inactive_connection_lifetime':
+				settings.DB_POOL_MAX_INACTIVE_CONNECTION_LIFETIME
+				.total_seconds(),
+			'statement_cache_size': settings.DB_STATEMENT_CACHE_SIZE,
+			'timeout': settings.DB_CONNECT_TIMEOUT.total_seconds(),
+			'command_timeout': settings.DB_COMMAND_TIMEOUT.total_seconds(),
+		})
+
+	return rv
+
+
 def register_database(app: FastAPI, /) -> None:
-	register_tortoise(app, settings.TORTOISE_ORM, add_exception_handlers=True)
+	register_tortoise(
+		app, make_database_config(), add_exception_handlers=True,
+	)
+	# After the connections are opened at startup
+	app.add_event_handler("startup", create_search_index)
+	app.add_event_handler("startup", listen_for_user_changes)
+
+
+def register_worker_pools(app: FastAPI, /) -> None:
+	"""Stops the workers that the pools start on first use."""
+
+	@app.on_event("shutdown")
+	def shutdown_worker_pools() -> None:
+		image_processing_pool.shutdown()
+		password_hashing_pool.shutdown()
+
+
+def register_metrics(app: FastAPI, /) -> None:
+	"""Times requests and database queries, see `app.metrics`."""
+
+	if settings.METRICS_ENABLED:
+		# prometheus_client is imported only if there are metrics
+		from .metrics import MetricsMiddleware, instrument_database, \
+			instrument_caches, instrument_worker_pools
+
+		# The outermost middleware, so that it times the others too
+		app.add_middleware(MetricsMiddleware)
+		instrument_database(make_database_config())
+		instrument_caches({
+			'tokens': token_cache,
+			'users': user_cache,
+			'image_owners': image_owner_cache,
+		})
+		instrument_worker_pools({
+			'password_hashing': password_hashing_pool,
+			'image_processing': image_processing_pool,
+		})
 
 
 def add_middlewares(app: FastAPI, /) -> None:
-	app.add_middleware(SessionMiddleware, secret_key=settings.SECRET_KEY)
 	app.add_middleware(
 		CORSMiddleware,
 		allow_origins=settings.ALLOW_ORIGINS,
@@ -27,6 +107,22 @@ def add_middlewares(app: FastAPI, /) -> None:
 		allow_headers=("*",),
 	)
 
+	if REPLICA_CONNECTION in settings.TORTOISE_ORM['connections']:
+		app.add_middleware(
+			ReplicaRoutingMiddleware,
+			stickiness=settings.DB_REPLICA_STICKINESS.total_seconds(),
+		)
+
+	if settings.PROFILING_SAMPLE_RATE > 0 or settings.PROFILING_TOKEN:
+		app.add_middleware(
+			ProfilingMiddleware,
+			directory=settings.PROFILING_DIR,
+			sample_rate=settings.PROFILING_SAMPLE_RATE,
+			header=settings.PROFILING_HEADER,
+			token=settings.PROFILING_TOKEN,
+			interval=settings.PROFILING_INTERVAL.total_seconds(),
+		)
+
 
 def include_routers(app: FastAPI, /) -> None:
 	app.include_router(main.router)
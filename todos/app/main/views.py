@@ -1,9 +1,17 @@
-from fastapi import status, Depends, HTTPException
+from typing import Dict, Optional
+
+from fastapi import Query, status, Depends, Request, Response, \
+	HTTPException
 from fastapi.responses import FileResponse
+from tortoise import Tortoise
 
 from . import router
+from ..helpers import choose_image_format, get_image_variant, \
+	is_not_modified
 from ..settings import get_settings
-from ..dependencies import get_confirmed_user_from_token
+from ..dependencies import get_confirmed_user_from_token, \
+	check_health_token
+from ..todos.models import Todo
 from ..accounts.models import User
 
 
@@ -12,14 +20,75 @@ settings = get_settings()
 
 @router.get("/media/images/{filename}/", response_class=FileResponse)
 async def get_image(
+	request: Request,
 	filename: str,
+	w: Optional[int] = Query(None, ge=1),
 	user: User = Depends(get_confirmed_user_from_token),
-) -> FileResponse:
-	image_path = settings.IMAGES_DIR.joinpath(filename)
-	if not (
-		image_path.exists()
-		and user.todos.filter(image_filename=filename).exists()  # type: ignore
-	):
+) -> Response:
+	"""Serves the smallest variant of the image that is at least `w` wide,
+	in WebP if the client accepts it. With
+	`IMAGES_ACCEL_REDIRECT_PREFIX` the file itself is sent by nginx.
+
+	Saved images never change, so a cached one is always up to date.
+	"""
+
+	if not await Todo.is_image_owner(user.id, filename):
+		raise HTTPException(status.HTTP_404_NOT_FOUND, "Image not found.")
+
+	format = choose_image_format(request.headers.get("accept", ""))
+	headers = {
+		'Vary': "Accept",
+		'Cache-Control': "private, max-age=31536000, immutable",
+		'ETag': '"%s-%s-%s"' % (filename, w or "", format.lower()),
+	}
+	if is_not_modified(request, headers['ETag'], immutable=True):
+		return Response(
+			status_code=status.HTTP_304_NOT_MODIFIED,
+			headers=headers,
+		)
+
+	if not settings.IMAGES_DIR.joinpath(filename).exists():
 		raise HTTPException(status.HTTP_404_NOT_FOUND, "Image not found.")
 
-	return FileResponse(str(image_path))
+	variant_path, media_type = get_image_variant(filename, w, format)
+
+	if settings.IMAGES_ACCEL_REDIRECT_PREFIX is not None:
+		headers['X-Accel-Redirect'] \
+			= settings.IMAGES_ACCEL_REDIRECT_PREFIX + variant_path.name
+		return Response(media_type=media_type, headers=headers)
+
+	return FileResponse(
+		str(variant_path),
+		media_type=media_type,
+		headers=headers,
+	)
+
+
+@router.get(
+	"/health/database/", dependencies=[Depends(check_health_token)],
+)
+async def get_database_health() -> Dict[str, Dict[str, float]]:
+	"""Connection pool statistics of every connection that collects them,
+	to see the pool saturation under load."""
+
+	rv = {}
+	for name in settings.TORTOISE_ORM['connections']:
+		try:
+			connection = Tortoise.get_connection(name)
+		except KeyError:  # Not initialized yet
+			continue
+		pool_stats = getattr(connection, "pool_stats", None)
+		if pool_stats is not None:
+			rv[name] = pool_stats()
+	return rv
+
+
+@router.get("/metrics", response_class=Response)
+async def get_metrics() -> Response:
+	"""Metrics in the Prometheus text format, see `app.metrics`."""
+
+	from prometheus_client import CONTENT_TYPE_LATEST
+
+	from ..metrics import render_metrics
+
+	return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,280 @@
+"""Prometheus metrics of requests and database queries, which are
+exposed at `/metrics` by `app.main.views.get_metrics`.
+
+Gunicorn workers write them to files in `PROMETHEUS_MULTIPROC_DIR`, see
+`supervisor.conf` and `gunicorn.conf.py`, so that every scrape sees the
+metrics of all the workers."""
+
+import os
+import re
+import sys
+import time
+import importlib
+from functools import wraps
+from typing import Any, Dict, Type, Tuple, Callable, Iterator, Awaitable
+
+from prometheus_client import (
+	REGISTRY,
+	Gauge,
+	Counter,
+	Histogram,
+	CollectorRegistry,
+	multiprocess,
+	generate_latest,
+)
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+from .helpers import TTLCache, WorkerPool, WorkerPoolFullError
+
+
+REQUEST_DURATION = Histogram(
+	"http_request_duration_seconds",
+	"Time of handling requests.",
+	("method", "route", "status"),
+)
+REQUESTS_IN_PROGRESS = Gauge(
+	"http_requests_in_progress",
+	"Requests that are being handled.",
+	multiprocess_mode="livesum",
+)
+RESPONSE_SIZE = Histogram(
+	"http_response_size_bytes",
+	"Sizes of response bodies.",
+	("route",),
+	buckets=(100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000),
+)
+DB_QUERY_DURATION = Histogram(
+	"db_query_duration_seconds",
+	"Time of database queries.",
+	("connection", "operation", "table"),
+	buckets=(
+		0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1,
+	),
+)
+CACHE_REQUESTS = Counter(
+	"cache_requests_total",
+	"Lookups of in-process caches.",
+	("cache", "result"),
+)
+CACHE_SIZE = Gauge(
+	"cache_size",
+	"Entries of in-process caches.",
+	("cache",),
+	multiprocess_mode="livesum",
+)
+WORKER_POOL_QUEUED = Gauge(
+	"worker_pool_queued",
+	"Functions waiting for workers of worker pools.",
+	("pool",),
+	multiprocess_mode="livesum",
+)
+WORKER_POOL_MAX_QUEUED = Gauge(
+	"worker_pool_max_queued",
+	"Most functions that waited for workers at once.",
+	("pool",),
+	multiprocess_mode="max",
+)
+WORKER_POOL_WAIT = Counter(
+	"worker_pool_wait_seconds",
+	"Time that functions waited for workers of worker pools.",
+	("pool",),
+)
+WORKER_POOL_COMPLETED = Counter(
+	"worker_pool_completed",
+	"Functions run by worker pools.",
+	("pool",),
+)
+WORKER_POOL_REJECTED = Counter(
+	"worker_pool_rejected",
+	"Functions rejected by worker pools whose queues were full.",
+	("pool",),
+)
+
+_OPERATIONS = {"select", "insert", "update", "delete"}
+_TABLE_RE = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+\"?(\w+)", re.IGNORECASE)
+# Other methods are labeled "other", so that clients cannot make series
+_HTTP_METHODS = frozenset((
+	"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS",
+))
+_QUERY_METHODS = (
+	"execute_insert", "execute_many", "execute_query", "execute_query_dict",
+)
+
+
+class MetricsMiddleware:
+	"""Records the time, the status and the body size of every request by
+	the name of the view that handled it."""
+
+	def __init__(self, app: ASGIApp) -> None:
+		self.app = app
+		# Looking up metrics by labels takes longer than observing them
+		self._metrics: Dict[Tuple[str, str, int], Tuple[Any, Any]] = {}
+
+	async def __call__(
+		self, scope: Scope, receive: Receive, send: Send,
+	) -> None:
+		if scope['type'] != "http":
+			await self.app(scope, receive, send)
+			return
+
+		status_code = 500
+		size = 0
+
+		async def send_with_metrics(message: Message) -> None:
+			nonlocal status_code, size
+			if message['type'] == "http.response.start":
+				status_code = message['status']
+			elif message['type'] == "http.response.body":
+				size += len(message.get("body", b""))
+			await send(message)
+
+		REQUESTS_IN_PROGRESS.inc()
+		started_at = time.perf_counter()
+		try:
+			await self.app(scope, receive, send_with_metrics)
+		finally:
+			elapsed = time.perf_counter() - started_at
+			REQUESTS_IN_PROGRESS.dec()
+
+			# The router puts the matched view into the scope
+			endpoint = scope.get("endpoint")
+			method = scope['method']
+			labels = (
+				method if method in _HTTP_METHODS else "other",
+				getattr(endpoint, "__name__", "unmatched"),
+				status_code,
+			)
+
+			metrics = self._metrics.get(labels)
+			if metrics is None:
+				metrics = self._metrics[labels] = (
+					REQUEST_DURATION.labels(*labels),
+					RESPONSE_SIZE.labels(labels[1]),
+				)
+			metrics[0].observe(elapsed)
+			metrics[1].observe(size)
+
+
+def _time_query(method: Callable[..., Any], /) -> Callable[..., Any]:
+	@wraps(method)
+	async def wrapper(self: Any, query: str, *args: Any, **kwargs: Any) -> Any:
+		started_at = time.perf_counter()
+		try:
+			return await method(self, query, *args, **kwargs)
+		finally:
+			elapsed = time.perf_counter() - started_at
+
+			operation = query.lstrip()[:6].lower()
+			if operation not in _OPERATIONS:
+				operation = "other"
+			match = _TABLE_RE.search(query)
+
+			DB_QUERY_DURATION.labels(
+				self.connection_name,
+				operation,
+				match.group(1) if match is not None else "",
+			).observe(elapsed)
+
+	wrapper._timed = True  # type: ignore
+	return wrapper
+
+
+def _iter_client_classes(client_class: Type[Any], /) -> Iterator[Type[Any]]:
+	for cls in client_class.__mro__:
+		yield cls
+		# Transactions use their own clients
+		wrapper = getattr(sys.modules[cls.__module__], "TransactionWrapper", None)
+		if wrapper is not None:
+			yield wrapper
+
+
+def instrument_database(config: Dict[str, Any], /) -> None:
+	"""Makes the clients of the Tortoise config time their queries.
+
+	:param config: Config with expanded connections, see
+	`app.initializers.make_database_config`
+	"""
+
+	for connection in config['connections'].values():
+		engine = importlib.import_module(connection['engine'])
+		for cls in _iter_client_classes(engine.client_class):  # type: ignore
+			for name in _QUERY_METHODS:
+				method = cls.__dict__.get(name)
+				if method is not None and not hasattr(method, "_timed"):
+					setattr(cls, name, _time_query(method))
+
+
+def _count_lookups(
+	name: str, cache: TTLCache[Any, Any], /,
+) -> Callable[[Any], Any]:
+	get = cache.get
+	hits = CACHE_REQUESTS.labels(name, "hit")
+	misses = CACHE_REQUESTS.labels(name, "miss")
+	size = CACHE_SIZE.labels(name)
+
+	@wraps(get)
+	def wrapper(key: Any, /) -> Any:
+		rv = get(key)
+		(misses if rv is None else hits).inc()
+		size.set(len(cache))
+		return rv
+
+	wrapper._counted = True  # type: ignore
+	return wrapper
+
+
+def instrument_caches(caches: Dict[str, TTLCache[Any, Any]], /) -> None:
+	"""Counts hits and misses of the caches by their names. The caches
+	count them too, see `TTLCache.stats`, but every process its own."""
+
+	for name, cache in caches.items():
+		if not hasattr(cache.get, "_counted"):
+			cache.get = _count_lookups(name, cache)  # type: ignore
+
+
+def _observe_pool(
+	name: str, pool: WorkerPool, /,
+) -> Callable[..., Awaitable[Any]]:
+	run = pool.run
+	queued = WORKER_POOL_QUEUED.labels(name)
+	max_queued = WORKER_POOL_MAX_QUEUED.labels(name)
+	wait = WORKER_POOL_WAIT.labels(name)
+	completed = WORKER_POOL_COMPLETED.labels(name)
+	rejected = WORKER_POOL_REJECTED.labels(name)
+	# Counters are increased by the changes of the totals of the pool
+	observed = pool.stats()
+
+	@wraps(run)
+	async def wrapper(func: Callable[..., Any], /, *args: Any) -> Any:
+		try:
+			return await run(func, *args)
+		except WorkerPoolFullError:
+			rejected.inc()
+			raise
+		finally:
+			stats = pool.stats()
+			queued.set(stats['queued'])
+			max_queued.set(stats['max_queued'])
+			wait.inc(stats['total_wait_time'] - observed['total_wait_time'])
+			completed.inc(stats['completed'] - observed['completed'])
+			observed.update(stats)
+
+	wrapper._observed = True  # type: ignore
+	return wrapper
+
+
+def instrument_worker_pools(pools: Dict[str, WorkerPool], /) -> None:
+	"""Exports `WorkerPool.stats` of the pools by their names. They are
+	updated whenever functions of the pools finish."""
+
+	for name, pool in pools.items():
+		if not hasattr(pool.run, "_observed"):
+			pool.run = _observe_pool(name, pool)  # type: ignore
+
+
+def render_metrics() -> bytes:
+	registry = REGISTRY
+	if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+		registry = CollectorRegistry()
+		multiprocess.MultiProcessCollector(registry)
+	return generate_latest(registry)
@@ -0,0 +1,275 @@
+"""Sampling profiler of single requests. `ProfilingMiddleware` profiles
+`PROFILING_SAMPLE_RATE` of requests and the requests whose
+`PROFILING_HEADER` carries `PROFILING_TOKEN`. Every profile is written to
+`PROFILING_DIR/<view name>/` as collapsed stacks, one `frames count` line
+per stack, the format of `flamegraph.pl`.
+
+Run `python -m app.profiling --help` to aggregate them by views into
+collapsed stacks or speedscope (https://www.speedscope.app) files.
+
+A thread samples the stack of the event loop thread every
+`PROFILING_INTERVAL`, but only while profiled requests are in progress.
+When the task of a profiled request is suspended, its coroutine chain is
+recorded instead, ending with an `[await]` frame, so profiles show the
+wall time of requests. Code that holds the GIL lets the thread sample
+it only every `sys.getswitchinterval()`, 5 ms by default."""
+
+import sys
+import json
+import time
+import random
+import asyncio
+import secrets
+import argparse
+import threading
+from pathlib import Path
+from types import FrameType
+from collections import Counter
+from typing import Any, Dict, Tuple, Optional, Sequence
+
+from starlette.types import ASGIApp, Scope, Receive, Send
+
+
+Stack = Tuple[str, ...]
+
+
+def _format_frame(frame: FrameType, /) -> str:
+	code = frame.f_code
+	# No semicolons, which separate frames in collapsed stacks
+	return "%s (%s:%d)" % (
+		code.co_name, code.co_filename.replace(";", ","), code.co_firstlineno,
+	)
+
+
+def _get_frame_stack(frame: Optional[FrameType], /) -> Stack:
+	rv = []
+	while frame is not None:
+		rv.append(_format_frame(frame))
+		frame = frame.f_back
+	return tuple(reversed(rv))
+
+
+def _get_coroutine_stack(task: "asyncio.Task[Any]", /) -> Stack:
+	rv = []
+	awaitable: Any = task.get_coro()
+	while awaitable is not None:
+		frame = getattr(awaitable, "cr_frame", None) \
+			or getattr(awaitable, "gi_frame", None)
+		if frame is None:
+			break
+		rv.append(_format_frame(frame))
+		awaitable = getattr(awaitable, "cr_await", None) \
+			or getattr(awaitable, "gi_yieldfrom", None)
+	rv.append("[await]")
+	return tuple(rv)
+
+
+class _Sampler(threading.Thread):
+	def __init__(self, loop: asyncio.AbstractEventLoop, interval: float) -> None:
+		super().__init__(name="profiling-sampler", daemon=True)
+		self.loop = loop
+		self.interval = interval
+		self.sessions: Dict["asyncio.Task[Any]", Counter[Stack]] = {}
+		self._loop_thread_id = threading.get_ident()
+		self._active = threading.Event()
+		self._stopped = False
+
+	def start_session(self, task: "asyncio.Task[Any]", /) -> Counter[Stack]:
+		rv = self.sessions[task] = Counter()
+		self._active.set()
+		return rv
+
+	def stop_session(self, task: "asyncio.Task[Any]", /) -> None:
+		del self.sessions[task]
+		if not self.sessions:
+			self._active.clear()
+
+	def stop(self) -> None:
+		self._stopped = True
+		self._active.set()
+
+	def run(self) -> None:
+		while True:
+			self._active.wait()
+			if self._stopped:
+				return
+			time.sleep(self.interval)
+
+			# The event loop thread is paused while this thread holds the GIL
+			frame = sys._current_frames().get(self._loop_thread_id)
+			current_task = asyncio.current_task(self.loop)
+			for task, stacks in list(self.sessions.items()):
+				if task is current_task:
+					stacks[_get_frame_stack(frame)] += 1
+				else:
+					stacks[_get_coroutine_stack(task)] += 1
+
+
+def _write_profile(directory: Path, stacks: Counter[Stack], /) -> None:
+	directory.mkdir(parents=True, exist_ok=True)
+	path = directory.joinpath("%d-%s.collapsed" % (
+		time.time() * 1000, secrets.token_hex(4),
+	))
+	path.write_text("".join(
+		"%s %d\n" % (";".join(stack), count)
+		for stack, count in stacks.items()
+	))
+
+
+class ProfilingMiddleware:
+	def __init__(
+		self,
+		app: ASGIApp,
+		directory: Path,
+		sample_rate: float,
+		header: str,
+		token: Optional[str],
+		interval: float,
+	) -> None:
+		self.app = app
+		self.directory = directory
+		self.sample_rate = sample_rate
+		self.header = header.lower().encode("latin-1")
+		self.token = token
+		self.interval = interval
+		self._sampler: Optional[_Sampler] = None
+
+	async def __call__(
+		self, scope: Scope, receive: Receive, send: Send,
+	) -> None:
+		if scope['type'] != "http" or not self._should_profile(scope):
+			await self.app(scope, receive, send)
+			return
+
+		# A sampler only sees the tasks of the loop it was started for
+		loop = asyncio.get_running_loop()
+		if self._sampler is None or self._sampler.loop is not loop:
+			if self._sampler is not None:
+				self._sampler.stop()
+			self._sampler = _Sampler(loop, self.interval)
+			self._sampler.start()
+
+		task = asyncio.current_task()
+		assert task is not None
+		stacks = self._sampler.start_session(task)
+		try:
+			await self.app(scope, receive, send)
+		finally:
+			self._sampler.stop_session(task)
+
+		if stacks:
+			# The router puts the matched view into the scope
+			endpoint = scope.get("endpoint")
+			directory = self.directory.joinpath(
+				getattr(endpoint, "__name__", "unmatched"),
+			)
+			await asyncio.get_running_loop().run_in_executor(
+				None, _write_profile, directory, stacks,
+			)
+
+	def _should_profile(self, scope: Scope, /) -> bool:
+		if self.token is not None:
+			for name, value in scope['headers']:
+				if name == self.header:
+					return secrets.compare_digest(
+						value, self.token.encode("latin-1"),
+					)
+		return random.random() < self.sample_rate
+
+
+def read_profiles(directory: Path, /) -> Dict[str, Tuple[int, Counter[Stack]]]:
+	""":return: Numbers of profiles and their summed stacks by view names"""
+
+	rv = {}
+	for route_directory in sorted(directory.iterdir()):
+		stacks: Counter[Stack] = Counter()
+		paths = list(route_directory.glob("*.collapsed"))
+		for path in paths:
+			for line in path.read_text().splitlines():
+				stack, count = line.rsplit(" ", 1)
+				stacks[tuple(stack.split(";"))] += int(count)
+		rv[route_directory.name] = (len(paths), stacks)
+	return rv
+
+
+def make_speedscope(name: str, stacks: Counter[Stack], /) -> Dict[str, Any]:
+	frames: Dict[str, int] = {}
+	samples = []
+	for stack in stacks:
+		samples.append([frames.setdefault(frame, len(frames)) for frame in stack])
+
+	total = sum(stacks.values())
+	return {
+		'$schema': "https://www.speedscope.app/file-format-schema.json",
+		'name': name,
+		'exporter': "app.profiling",
+		'shared': {'frames': [{'name': frame} for frame in frames]},
+		'profiles': [{
+			'type': "sampled",
+			'name': name,
+			'unit': "none",
+			'startValue': 0,
+			'endValue': total,
+			'samples': samples,
+			'weights': list(stacks.values()),
+		}],
+	}
+
+
+def _get_self_counts(stacks: Counter[Stack], /) -> Counter[str]:
+	rv: Counter[str] = Counter()
+	for stack, count in stacks.items():
+		rv[stack[-1]] += count
+	return rv
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+	from .settings import get_settings
+
+	parser = argparse.ArgumentParser(
+		prog="python -m app.profiling",
+		description="Aggregates request profiles by views.",
+	)
+	parser.add_argument(
+		"directory", nargs="?", type=Path, default=get_settings().PROFILING_DIR,
+		help="Directory of profiles, `PROFILING_DIR` by default",
+	)
+	parser.add_argument("-r", "--route", help="Only this view")
+	parser.add_argument(
+		"-o", "--output", type=Path,
+		help="Directory to write aggregated profiles to",
+	)
+	parser.add_argument(
+		"-f", "--format", choices=("collapsed", "speedscope"),
+		default="speedscope",
+	)
+	parser.add_argument(
+		"-t", "--top", type=int, default=10,
+		help="Number of frames with the most own samples to print",
+	)
+	args = parser.parse_args(argv)
+
+	for route, (profiles_count, stacks) in read_profiles(args.directory).items():
+		if args.route is not None and route != args.route:
+			continue
+
+		total = sum(stacks.values())
+		print("%s: %d profiles, %d samples" % (route, profiles_count, total))
+		for frame, count in _get_self_counts(stacks).most_common(args.top):
+			print("  %5.1f%%  %s" % (count / total * 100, frame))
+
+		if args.output is not None:
+			args.output.mkdir(parents=True, exist_ok=True)
+			if args.format == "collapsed":
+				args.output.joinpath(route + ".collapsed").write_text("".join(
+					"%s %d\n" % (";".join(stack), count)
+					for stack, count in stacks.items()
+				))
+			else:
+				args.output.joinpath(route + ".speedscope.json").write_text(
+					json.dumps(make_speedscope(route, stacks)),
+				)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,114 @@
+"""Backends keep token buckets of rate limits. The one to use is chosen
+with `RATE_LIMIT_BACKEND`.
+
+A bucket is stored as a single timestamp, the theoretical arrival time of
+the next request (GCRA). Every request moves it forward by the period
+divided by the number of requests, and it may run ahead of the current
+time by at most the period. This is a token bucket with continuous refill,
+so the window slides and every update is O(1)."""
+
+import time
+import random
+import importlib
+from abc import ABC, abstractmethod
+from datetime import timedelta
+from collections import OrderedDict
+from typing import Tuple, Optional
+
+from tortoise.transactions import in_transaction
+
+from .models import RateLimitBucket
+from ..settings import get_settings
+
+
+settings = get_settings()
+
+
+def _hit(
+	tat: float, now: float, requests: int, period: float, /,
+) -> Tuple[float, Optional[float]]:
+	""":return: New theoretical arrival time and seconds to wait if the
+	request is over the limit"""
+
+	new_tat = max(tat, now) + period / requests
+	if new_tat - now > period:
+		return tat, new_tat - now - period
+	return new_tat, None
+
+
+class RateLimitBackend(ABC):
+	@abstractmethod
+	async def hit(
+		self, key: str, requests: int, period: timedelta, /,
+	) -> Optional[float]:
+		"""Counts a request unless it is over the limit.
+
+		:return: Seconds to wait if the request is over the limit
+		"""
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+	"""Keeps buckets in the memory of the process, so every server process
+	has its own limits. The least recently used buckets are evicted, which
+	are the idle ones unless there are more than
+	`RATE_LIMIT_MEMORY_MAX_SIZE` active keys."""
+
+	def __init__(self) -> None:
+		self.max_size = settings.RATE_LIMIT_MEMORY_MAX_SIZE
+		self._tats: OrderedDict[str, float] = OrderedDict()
+
+	async def hit(
+		self, key: str, requests: int, period: timedelta, /,
+	) -> Optional[float]:
+		now = time.monotonic()
+		tat, retry_after = _hit(
+			self._tats.get(key, now), now, requests, period.total_seconds(),
+		)
+
+		self._tats[key] = tat
+		self._tats.move_to_end(key)
+		while len(self._tats) > self.max_size:
+			self._tats.popitem(last=False)
+
+		return retry_after
+
+	def clear(self) -> None:
+		self._tats.clear()
+
+
+class DatabaseRateLimitBackend(RateLimitBackend):
+	"""Keeps buckets in the database, so the limits are shared by all server
+	processes and nodes. Idle buckets are deleted now and then."""
+
+	# Chance of deleting idle buckets on a request
+	cleanup_probability = 0.01
+
+	async def hit(
+		self, key: str, requests: int, period: timedelta, /,
+	) -> Optional[float]:
+		now = time.time()
+		# Created separately, as a failed insert would abort the transaction
+		await RateLimitBucket.get_or_create(key=key, defaults={'tat': now})
+
+		connection_name = RateLimitBucket._meta.default_connection
+		async with in_transaction(connection_name) as connection:
+			bucket = await RateLimitBucket.filter(key=key) \
+				.select_for_update().using_db(connection).get()
+			tat, retry_after = _hit(
+				bucket.tat, now, requests, period.total_seconds(),
+			)
+			if retry_after is None:
+				bucket.tat = tat  # type: ignore
+				await bucket.save(using_db=connection, update_fields=("tat",))
+
+		if random.random() < self.cleanup_probability:
+			await RateLimitBucket.filter(tat__lt=now).delete()
+		return retry_after
+
+
+def make_rate_limit_backend() -> RateLimitBackend:
+	module_name, class_name = settings.RATE_LIMIT_BACKEND.rsplit(".", 1)
+	return getattr(importlib.import_module(module_name), class_name)()
+
+
+rate_limit_backend = make_rate_limit_backend()
@@ -0,0 +1,14 @@
+from tortoise import fields
+
+from ..helpers import BaseModel
+
+
+class RateLimitBucket(BaseModel):
+	"""Buckets of `app.ratelimit.backends.DatabaseRateLimitBackend`."""
+
+	key = fields.CharField(max_length=100, unique=True)
+	# Theoretical arrival time of the next request, a UNIX timestamp
+	tat = fields.FloatField()
+
+	def __repr__(self) -> str:
+		return "<RateLimitBucket key=\"%s\">" % self.key
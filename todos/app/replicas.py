@@ -0,0 +1,97 @@
+"""Routing of read queries to the optional `replica` connection of
+`TORTOISE_ORM`. Writes, transactions and all queries of requests that
+may write go to the primary. The clients that have written something read
+from the primary for `DB_REPLICA_STICKINESS` afterwards, so they always see
+their own writes regardless of replication lag."""
+
+import math
+import time
+from contextvars import ContextVar
+from typing import Any, Type, Optional
+
+from tortoise import models
+from tortoise.transactions import get_connection
+from tortoise.backends.base.client import BaseTransactionWrapper
+from starlette.types import Send, Scope, ASGIApp, Message, Receive
+from starlette.requests import cookie_parser
+from starlette.datastructures import MutableHeaders
+
+
+REPLICA_CONNECTION = "replica"
+_SAFE_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+
+_read_from_primary: ContextVar[bool] = ContextVar(
+	"read_from_primary", default=False,
+)
+
+
+class ReplicaRouter:
+	def db_for_read(self, model: Type[models.Model]) -> Optional[str]:
+		if _read_from_primary.get():
+			return None
+
+		# Reads of a transaction must see its writes
+		default_connection = model._meta.default_connection
+		if isinstance(
+			get_connection(default_connection), BaseTransactionWrapper,
+		):
+			return None
+
+		return REPLICA_CONNECTION
+
+	def db_for_write(self, model: Type[models.Model]) -> Optional[str]:
+		return None
+
+
+class ReplicaRoutingMiddleware:
+	cookie_name = "read_primary_until"
+
+	def __init__(self, app: ASGIApp, stickiness: float) -> None:
+		self.app = app
+		self.stickiness = stickiness
+
+	async def __call__(
+		self, scope: Scope, receive: Receive, send: Send,
+	) -> None:
+		if scope['type'] != "http":
+			await self.app(scope, receive, send)
+			return
+
+		unsafe = scope['method'] not in _SAFE_METHODS
+		if not (unsafe or self._is_sticky(scope)):
+			await self.app(scope, receive, send)
+			return
+
+		token = _read_from_primary.set(True)
+		try:
+			await self.app(
+				scope, receive, self._make_sticky(send) if unsafe else send,
+			)
+		finally:
+			_read_from_primary.reset(token)
+
+	def _is_sticky(self, scope: Scope, /) -> bool:
+		for name, value in scope['headers']:
+			if name == b"cookie":
+				until = cookie_parser(value.decode("latin-1")) \
+					.get(self.cookie_name)
+				try:
+					return until is not None and float(until) > time.time()
+				except ValueError:
+					return False
+		return False
+
+	def _make_sticky(self, send: Send, /) -> Send:
+		async def send_with_cookie(message: Message) -> Any:
+			if message['type'] == "http.response.start":
+				MutableHeaders(scope=message).append(
+					"set-cookie",
+					"%s=%d; Max-Age=%d; Path=/; HttpOnly; SameSite=Lax" % (
+						self.cookie_name,
+						math.ceil(time.time() + self.stickiness),
+						math.ceil(self.stickiness),
+					),
+				)
+			await send(message)
+
+		return send_with_cookie
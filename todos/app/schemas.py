@@ -12,7 +12,10 @@ class Message(BaseModel):
 
 
 class Pagination(GenericModel, Generic[Model]):
-	pages_count: int
+	# `None` in cursor mode, cursors are `None` in page mode
+	pages_count: Optional[int]
+	previous_cursor: Optional[str]
+	next_cursor: Optional[str]
 	previous_page_url: Optional[str]
 	next_page_url: Optional[str]
 	results: List[Model]
@@ -0,0 +1,59 @@
+"""Fast rendering of responses. Views put the fields of models into plain
+dicts and render them with orjson, skipping both the conversion of models
+to pydantic models and the validation of `response_model`, which stays
+for the documentation only.
+
+With `SERIALIZATION_CHECK` every response is also rendered through its
+`response_model` the usual way, and any difference raises
+`SerializationMismatchError`."""
+
+from typing import Any, Dict, Type, Tuple, Optional
+
+from pydantic import BaseModel
+from tortoise import models
+from fastapi import status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from .settings import get_settings
+
+
+settings = get_settings()
+
+
+class SerializationMismatchError(RuntimeError):
+	pass
+
+
+def get_fields(schema: Type[BaseModel], /) -> Tuple[str, ...]:
+	""":return: Field names of the schema in the order of its JSON"""
+	return tuple(schema.__fields__)
+
+
+def serialize(obj: models.Model, fields: Tuple[str, ...], /) -> Dict[str, Any]:
+	return {field: getattr(obj, field) for field in fields}
+
+
+def make_response(
+	content: Any,
+	response_model: Type[BaseModel],
+	/,
+	*,
+	status_code: int = status.HTTP_200_OK,
+	headers: Optional[Dict[str, str]] = None,
+) -> ORJSONResponse:
+	""":param content: Data that `response_model` would render the same"""
+
+	rv = ORJSONResponse(content, status_code=status_code, headers=headers)
+
+	if settings.SERIALIZATION_CHECK:
+		expected = JSONResponse(
+			jsonable_encoder(response_model.parse_obj(content)),
+		).body
+		if rv.body != expected:
+			raise SerializationMismatchError(
+				"%s was rendered as %r instead of %r."
+				% (response_model.__name__, rv.body, expected),
+			)
+
+	return rv
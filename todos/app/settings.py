@@ -3,7 +3,7 @@ import sys
 from pathlib import Path
 from datetime import timedelta
 from functools import lru_cache
-from typing import Any, Set, Dict, Tuple, Union
+from typing import Any, Set, Dict, Tuple, Union, Optional
 
 from dotenv import load_dotenv
 from pydantic import BaseSettings
@@ -14,11 +14,20 @@ _BASE_DIR = Path(__file__).resolve().parent
 _MODEL_PATHS = (
 	"app.accounts.models",
 	"app.todos.models",
+	"app.sms.models",
+	"app.ratelimit.models",
 	"aerich.models",
 )
 
 load_dotenv(_BASE_DIR.parent.joinpath(".env"))
 
+# Production server workers, see `gunicorn.conf.py`
+_WORKERS = int(os.environ.get("WORKERS") or os.cpu_count() or 1)
+# Connections to Postgres that all the workers may open together
+_DB_MAX_CONNECTIONS = int(os.environ.get("DB_MAX_CONNECTIONS") or 80)
+# Connection pool of the SMS outbox worker, see `supervisor.conf`
+_SMS_DB_POOL_MAX_SIZE = 2
+
 
 def _make_tortoise_orm_config(uri: str) -> Dict[str, Any]:
 	return {
@@ -32,13 +41,21 @@ def _make_tortoise_orm_config(uri: str) -> Dict[str, Any]:
 	}
 
 
-_POSTGRES_TORTOISE_ORM = _make_tortoise_orm_config(
-	"postgres://%s:%s@db:5432/%s" % (
+def _make_postgres_uri(host: str) -> str:
+	return "postgres://%s:%s@%s:5432/%s" % (
 		os.environ['POSTGRES_USER'],
 		os.environ['POSTGRES_PASSWORD'],
+		host,
 		os.environ['POSTGRES_DB'],
-	),
-)
+	)
+
+
+_POSTGRES_TORTOISE_ORM = _make_tortoise_orm_config(_make_postgres_uri("db"))
+
+# Reads are sent to the replica if there is one, see `app.replicas`
+if os.environ.get("POSTGRES_REPLICA_HOST"):
+	_POSTGRES_TORTOISE_ORM['connections']['replica'] \
+		= _make_postgres_uri(os.environ['POSTGRES_REPLICA_HOST'])
 
 
 class Settings(BaseSettings):
@@ -50,20 +67,132 @@ class Settings(BaseSettings):
 	MEDIA_DIR: Path = _BASE_DIR.joinpath("media")
 	IMAGES_DIR: Path = MEDIA_DIR.joinpath("images")
 
+	WORKERS: int = _WORKERS
+	DB_MAX_CONNECTIONS: int = _DB_MAX_CONNECTIONS
 	TORTOISE_ORM: Dict[str, Any] = _POSTGRES_TORTOISE_ORM
+
+	# Postgres connection pool of every worker. Every worker also listens
+	# for notifications on a connection of its own, see `app.database`,
+	# and the SMS outbox worker has its own pool, so that
+	# `WORKERS * (DB_POOL_MAX_SIZE + 1) + SMS_DB_POOL_MAX_SIZE` is at most
+	# `DB_MAX_CONNECTIONS`.
+	DB_POOL_MIN_SIZE: int = 1
+	DB_POOL_MAX_SIZE: int = max(
+		1, (_DB_MAX_CONNECTIONS - _SMS_DB_POOL_MAX_SIZE) // _WORKERS - 1,
+	)
+	DB_POOL_MAX_INACTIVE_CONNECTION_LIFETIME: timedelta \
+		= timedelta(minutes=5)
+	# Set it to 0 behind PgBouncer in transaction mode
+	DB_STATEMENT_CACHE_SIZE: int = 100
+	DB_CONNECT_TIMEOUT: timedelta = timedelta(seconds=10)
+	DB_COMMAND_TIMEOUT: timedelta = timedelta(seconds=30)
+	# How long clients read from the primary after writing something
+	DB_REPLICA_STICKINESS: timedelta = timedelta(seconds=5)
+	METRICS_ENABLED: bool = True
+	# Bearer token of `/health/database/`, which is not found without it
+	HEALTH_TOKEN: Optional[str] = None
+	# Profiles of requests, see `app.profiling`. Requests whose
+	# `PROFILING_HEADER` equals `PROFILING_TOKEN` are always profiled.
+	PROFILING_SAMPLE_RATE: float = 0.0
+	PROFILING_HEADER: str = "X-Profile"
+	PROFILING_TOKEN: Optional[str] = None
+	PROFILING_INTERVAL: timedelta = timedelta(milliseconds=1)
+	PROFILING_DIR: Path = _BASE_DIR.parent.joinpath("profiles")
 	ALLOW_ORIGINS: Tuple[str, ...] = ("http://localhost:8000",)
 
 	JWT_ALGORITHM: str = "HS256"
+	# PEM keys of asymmetric algorithms, see `app.tokens`
+	JWT_PRIVATE_KEY: Optional[str] = None
+	JWT_PUBLIC_KEY: Optional[str] = None
 	TOKEN_URL: str = "/accounts/token/"
 	TOKEN_MAX_AGE: timedelta = timedelta(days=1)
-
+	# Routes of confirmed users take users from the claims of tokens
+	# without fetching them. Then deactivation and password changes revoke
+	# tokens on these routes only when they expire, so keep them short.
+	TOKEN_TRUST_CLAIMS: bool = False
+
+	# Every process has its own cache. Saved users are dropped from the
+	# caches of all the processes on Postgres, see
+	# `app.accounts.models.listen_for_user_changes`, on other databases
+	# the other processes see them only after `USER_CACHE_TTL`.
+	USER_CACHE_MAX_SIZE: int = 4096
+	USER_CACHE_TTL: timedelta = timedelta(seconds=30)
+
+	# Import path of a class from `app.accounts.confirmation`. Codes kept
+	# in memory are not shared by server processes.
+	CONFIRMATION_CODE_STORE: str \
+		= "app.accounts.confirmation.DatabaseConfirmationCodeStore"
+	CONFIRMATION_CODE_TTL: timedelta = timedelta(minutes=10)
+	CONFIRMATION_CODE_MAX_ATTEMPTS: int = 5
+	CONFIRMATION_CODE_MEMORY_MAX_SIZE: int = 65536
+
+	# Import path of a class from `app.ratelimit.backends`. Buckets kept
+	# in memory are not shared by server processes.
+	RATE_LIMIT_BACKEND: str \
+		= "app.ratelimit.backends.DatabaseRateLimitBackend"
+	RATE_LIMIT_MEMORY_MAX_SIZE: int = 65536
+	# Requests per period
+	TOKEN_RATE_LIMIT_PER_IP: Tuple[int, timedelta] \
+		= (30, timedelta(minutes=1))
+	TOKEN_RATE_LIMIT_PER_PHONE_NUMBER: Tuple[int, timedelta] \
+		= (10, timedelta(minutes=1))
+	CONFIRM_ASK_RATE_LIMIT_PER_IP: Tuple[int, timedelta] \
+		= (10, timedelta(hours=1))
+	CONFIRM_ASK_RATE_LIMIT_PER_PHONE_NUMBER: Tuple[int, timedelta] \
+		= (3, timedelta(hours=1))
+	CONFIRM_RATE_LIMIT_PER_IP: Tuple[int, timedelta] \
+		= (30, timedelta(hours=1))
+
+	# `None` means the number of CPUs
+	PASSWORD_HASHING_WORKERS: Optional[int] = None
+	PASSWORD_HASHING_USE_PROCESSES: bool = False
+
+	# If it is set, images are sent by nginx from this internal location
+	# and the application only authorizes requests to them.
+	IMAGES_ACCEL_REDIRECT_PREFIX: Optional[str] = None
+	IMAGES_OWNER_CACHE_MAX_SIZE: int = 4096
+	IMAGES_OWNER_CACHE_TTL: timedelta = timedelta(seconds=60)
 	IMAGES_MAX_SIZE: Tuple[int, int] = (1920, 1080)
+	# Widths of the downscaled variants, which are saved as JPEG and in
+	# every format of `IMAGES_VARIANT_FORMATS` ("WEBP"). Pillow has no
+	# AVIF encoder.
+	IMAGES_VARIANT_WIDTHS: Tuple[int, ...] = (128, 512)
+	IMAGES_VARIANT_FORMATS: Tuple[str, ...] = ("WEBP",)
+	# Uploads beyond the workers and the queue get 503 responses
+	IMAGES_PROCESSING_WORKERS: Optional[int] = None
+	IMAGES_PROCESSING_MAX_QUEUE_SIZE: Optional[int] = 16
+	IMAGES_PROCESSING_USE_PROCESSES: bool = True
 	IMAGES_ALLOWED_EXTENSIONS: Set[str] = {"jpeg", "jpg", "png"}
 	IMAGES_ALLOWED_CONTENT_TYPES: Set[str] = {
 		"image/%s" % ext for ext in IMAGES_ALLOWED_EXTENSIONS
 	}
 
+	# Renders every response through its `response_model` too and fails
+	# if it differs, see `app.serializers`.
+	SERIALIZATION_CHECK: bool = False
+
 	TODOS_PER_PAGE: int = 4
+	TODOS_BATCH_MAX_SIZE: int = 200
+	TODOS_SEARCH_PER_PAGE: int = 20
+	# Todos that are fetched and serialized at once during export
+	TODOS_EXPORT_CHUNK_SIZE: int = 1000
+
+	# Import path of a class from `app.sms.transports`
+	SMS_TRANSPORT: str = "app.sms.transports.TwilioSmsTransport"
+	SMS_BATCH_SIZE: int = 20
+	# Messages per second of every outbox worker
+	SMS_RATE_LIMIT: float = 10
+	SMS_MAX_ATTEMPTS: int = 5
+	# It is doubled after every failed attempt
+	SMS_RETRY_BACKOFF: timedelta = timedelta(seconds=10)
+	SMS_POLL_INTERVAL: timedelta = timedelta(seconds=1)
+	# Messages claimed by a worker that stopped are sent again after it
+	SMS_CLAIM_TIMEOUT: timedelta = timedelta(minutes=5)
+	# Point it to `tests/sms_stub.py` to send messages nowhere
+	SMS_API_URL: str = "https://api.twilio.com"
+	SMS_TIMEOUT: timedelta = timedelta(seconds=10)
+	SMS_MAX_CONCURRENT_REQUESTS: int = 10
+	SMS_DB_POOL_MAX_SIZE: int = _SMS_DB_POOL_MAX_SIZE
 
 	TWILIO_ACCOUNT_SID: str
 	TWILIO_AUTH_TOKEN: str
@@ -81,6 +210,12 @@ class TestingSettings(Settings):
 	TORTOISE_ORM: Dict[str, Any] \
 		= _make_tortoise_orm_config("sqlite://:memory")
 
+	SMS_TRANSPORT: str = "app.sms.transports.FakeSmsTransport"
+	SERIALIZATION_CHECK: bool = True
+	HEALTH_TOKEN: Optional[str] = "testing"
+	PROFILING_TOKEN: Optional[str] = "testing"
+	PROFILING_DIR: Path = MEDIA_DIR.joinpath("profiles")
+
 
 @lru_cache()
 def get_settings() -> Union[TestingSettings, Settings]:
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+from enum import Enum
+from datetime import datetime, timezone
+
+from tortoise import fields
+
+from ..helpers import BaseModel
+
+
+class SmsStatus(str, Enum):
+	PENDING = "pending"
+	# Claimed by a worker until `send_after`, after which it is sent again
+	SENDING = "sending"
+	SENT = "sent"
+	FAILED = "failed"
+
+
+class SmsMessage(BaseModel):
+	"""Outbox of messages, which are sent by `app.sms.worker`."""
+
+	to = fields.CharField(max_length=17)
+	body = fields.TextField()
+	status = fields.CharEnumField(SmsStatus, default=SmsStatus.PENDING)
+	attempts = fields.IntField(default=0)
+	send_after = fields.DatetimeField()
+	last_error = fields.TextField(null=True)
+
+	class Meta:
+		ordering = ("send_after", "id")
+		indexes = (("status", "send_after"),)
+
+	def __repr__(self) -> str:
+		return "<SmsMessage to=\"%s\">" % self.to
+
+	@classmethod
+	async def enqueue(cls, to: str, body: str, /) -> SmsMessage:
+		return await cls.create(
+			to=to, body=body, send_after=datetime.now(timezone.utc),
+		)
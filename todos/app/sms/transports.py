@@ -0,0 +1,89 @@
+"""Transports deliver messages of the SMS outbox to a provider.
+The one to use is chosen with `SMS_TRANSPORT`."""
+
+import asyncio
+import importlib
+from abc import ABC, abstractmethod
+from typing import Any, List, Tuple
+
+import httpx
+
+from ..settings import get_settings
+
+
+settings = get_settings()
+
+
+class SmsTransportError(RuntimeError):
+	pass
+
+
+class SmsTransport(ABC):
+	@abstractmethod
+	async def send(self, to: str, body: str, /) -> None:
+		""":raise SmsTransportError: If the message was not accepted"""
+
+	async def close(self) -> None:
+		pass
+
+
+class TwilioSmsTransport(SmsTransport):
+	"""Asynchronous client of the Twilio messages API. Connections are kept
+	alive between messages, and at most `SMS_MAX_CONCURRENT_REQUESTS`
+	messages are sent at the same time.
+
+	:param client_options: Extra `httpx.AsyncClient` options
+	"""
+
+	def __init__(self, **client_options: Any) -> None:
+		self.client = httpx.AsyncClient(
+			base_url=settings.SMS_API_URL,
+			auth=(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN),
+			timeout=settings.SMS_TIMEOUT.total_seconds(),
+			limits=httpx.Limits(
+				max_connections=settings.SMS_MAX_CONCURRENT_REQUESTS,
+				max_keepalive_connections=settings.SMS_MAX_CONCURRENT_REQUESTS,
+			),
+			**client_options,
+		)
+		self._semaphore = asyncio.Semaphore(
+			settings.SMS_MAX_CONCURRENT_REQUESTS,
+		)
+
+	async def send(self, to: str, body: str, /) -> None:
+		url = "/2010-04-01/Accounts/%s/Messages.json" \
+			% settings.TWILIO_ACCOUNT_SID
+		data = {'To': to, 'From': settings.TWILIO_MOBILE_NUMBER, 'Body': body}
+
+		async with self._semaphore:
+			try:
+				response = await self.client.post(url, data=data)
+			except httpx.HTTPError as exc:
+				raise SmsTransportError(str(exc)) from exc
+
+		if response.is_error:
+			try:
+				message = response.json()['message']
+			except (ValueError, KeyError):
+				message = response.text
+			raise SmsTransportError(
+				"%d: %s" % (response.status_code, message),
+			)
+
+	async def close(self) -> None:
+		await self.client.aclose()
+
+
+class FakeSmsTransport(SmsTransport):
+	"""Keeps messages instead of sending them, for tests."""
+
+	def __init__(self) -> None:
+		self.sent: List[Tuple[str, str]] = []
+
+	async def send(self, to: str, body: str, /) -> None:
+		self.sent.append((to, body))
+
+
+def make_sms_transport() -> SmsTransport:
+	module_name, class_name = settings.SMS_TRANSPORT.rsplit(".", 1)
+	return getattr(importlib.import_module(module_name), class_name)()
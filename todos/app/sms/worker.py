@@ -0,0 +1,158 @@
+"""Sends messages of the SMS outbox. It runs as a separate process:
+`python -m app.sms.worker`. Several workers may run at the same time,
+as every batch is claimed with `SELECT ... FOR UPDATE SKIP LOCKED` in a
+short transaction, before the messages are sent."""
+
+import time
+import asyncio
+import logging
+from typing import List
+from datetime import datetime, timezone
+
+from tortoise import Tortoise
+from tortoise.expressions import F
+from tortoise.transactions import in_transaction
+
+from .models import SmsStatus, SmsMessage
+from .transports import SmsTransport, SmsTransportError, make_sms_transport
+from ..settings import get_settings
+from ..initializers import make_database_config
+
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class _RateLimiter:
+	def __init__(self, rate: float, /) -> None:
+		self.interval = 1 / rate
+		self._next_at = 0.0
+
+	async def wait(self) -> None:
+		# The slot is reserved before sleeping, so concurrent callers
+		# are spread over time too.
+		now = time.monotonic()
+		at = max(now, self._next_at)
+		self._next_at = at + self.interval
+		if at > now:
+			await asyncio.sleep(at - now)
+
+
+class SmsOutboxWorker:
+	def __init__(self, transport: SmsTransport, /) -> None:
+		self.transport = transport
+		self._rate_limiter = _RateLimiter(settings.SMS_RATE_LIMIT)
+
+	async def run(self) -> None:
+		while True:
+			try:
+				count = await self.drain_once()
+			except Exception:
+				# Claimed messages are sent again after `SMS_CLAIM_TIMEOUT`
+				logger.exception("Failed to drain the SMS outbox.")
+				await asyncio.sleep(settings.SMS_RETRY_BACKOFF.total_seconds())
+				continue
+
+			if count < settings.SMS_BATCH_SIZE:
+				await asyncio.sleep(settings.SMS_POLL_INTERVAL.total_seconds())
+
+	async def drain_once(self) -> int:
+		""":return: Number of processed messages"""
+
+		messages = await self._claim()
+
+		# The transport limits how many of them are sent at once. Every
+		# message is saved on its own, so a failure loses none of the
+		# others.
+		results = await asyncio.gather(
+			*map(self._send, messages), return_exceptions=True,
+		)
+		for message, result in zip(messages, results):
+			if isinstance(result, BaseException):
+				logger.error(
+					"Failed to save %r", message, exc_info=result,
+				)
+
+		return len(messages)
+
+	async def _claim(self) -> List[SmsMessage]:
+		"""Marks a batch of due messages as being sent and commits it, so
+		that no lock is held while they are sent. Every claim counts as an
+		attempt, so a message that stops workers is not sent forever."""
+
+		now = datetime.now(timezone.utc)
+		connection_name = SmsMessage._meta.default_connection
+		async with in_transaction(connection_name) as connection:
+			await SmsMessage.filter(
+				status=SmsStatus.SENDING,
+				send_after__lte=now,
+				attempts__gte=settings.SMS_MAX_ATTEMPTS,
+			).using_db(connection).update(
+				status=SmsStatus.FAILED,
+				last_error="The worker stopped while sending it.",
+			)
+
+			messages = await SmsMessage.filter(
+				status__in=(SmsStatus.PENDING, SmsStatus.SENDING),
+				send_after__lte=now,
+			).limit(settings.SMS_BATCH_SIZE) \
+				.select_for_update(skip_locked=True) \
+				.using_db(connection)
+			if not messages:
+				return messages
+
+			await SmsMessage.filter(
+				id__in=[m.id for m in messages],
+			).using_db(connection).update(
+				status=SmsStatus.SENDING,
+				attempts=F("attempts") + 1,
+				send_after=now + settings.SMS_CLAIM_TIMEOUT,
+			)
+
+		for message in messages:
+			message.attempts += 1  # type: ignore
+		return messages
+
+	async def _send(self, message: SmsMessage, /) -> None:
+		await self._rate_limiter.wait()
+
+		try:
+			await self.transport.send(message.to, message.body)
+		except Exception as exc:
+			if isinstance(exc, SmsTransportError):
+				logger.warning("Failed to send %r: %s", message, exc)
+			else:
+				logger.exception("Failed to send %r", message)
+			message.last_error = str(exc) or repr(exc)  # type: ignore
+
+			if message.attempts >= settings.SMS_MAX_ATTEMPTS:
+				message.status = SmsStatus.FAILED  # type: ignore
+			else:
+				# Exponential backoff
+				message.status = SmsStatus.PENDING  # type: ignore
+				message.send_after = datetime.now(timezone.utc) \
+					+ settings.SMS_RETRY_BACKOFF * 2 ** (message.attempts - 1)
+		else:
+			message.status = SmsStatus.SENT  # type: ignore
+			message.last_error = None  # type: ignore
+
+		await message.save(
+			update_fields=("status", "send_after", "last_error"),
+		)
+
+
+async def main() -> None:
+	await Tortoise.init(
+		config=make_database_config(settings.SMS_DB_POOL_MAX_SIZE),
+	)
+	transport = make_sms_transport()
+	try:
+		await SmsOutboxWorker(transport).run()
+	finally:
+		await transport.close()
+		await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+	logging.basicConfig(level=logging.INFO)
+	asyncio.run(main())
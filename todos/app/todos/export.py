@@ -0,0 +1,84 @@
+"""Export of all the todos of a user. Rows are fetched in chunks by the
+`(owner_id, created_at, id)` index and serialized as they are, without
+models, so memory use does not depend on the number of todos."""
+
+import csv
+import json
+from enum import Enum
+from io import StringIO
+from datetime import datetime
+from typing import Any, Dict, List, Optional, AsyncIterator
+
+from tortoise.query_utils import Q
+
+from .models import Todo
+
+
+FIELDS = ("id", "created_at", "updated_at", "image_filename", "title", "text")
+
+
+async def _iter_rows(
+	owner_id: int, chunk_size: int, /,
+) -> AsyncIterator[List[Dict[str, Any]]]:
+	last: Optional[Dict[str, Any]] = None
+
+	while True:
+		queryset = Todo.filter(owner_id=owner_id)
+		if last is not None:
+			queryset = queryset.filter(
+				Q(created_at__lt=last['created_at'])
+				| Q(created_at=last['created_at'], id__lt=last['id']),
+			)
+
+		rows = await queryset.order_by("-created_at", "-id") \
+			.limit(chunk_size).values(*FIELDS)
+		if not rows:
+			return
+
+		yield rows
+		last = rows[-1]
+
+
+def _serialize_value(value: Any, /) -> Any:
+	return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _serialize_ndjson(rows: List[Dict[str, Any]], /) -> str:
+	return "".join(
+		json.dumps(
+			{key: _serialize_value(value) for key, value in row.items()},
+			ensure_ascii=False,
+		) + "\n"
+		for row in rows
+	)
+
+
+def _serialize_csv(rows: List[Dict[str, Any]], /) -> str:
+	buffer = StringIO()
+	csv.writer(buffer).writerows(
+		[_serialize_value(row[field]) for field in FIELDS] for row in rows
+	)
+	return buffer.getvalue()
+
+
+class ExportFormat(str, Enum):
+	NDJSON = "ndjson"
+	CSV = "csv"
+
+
+MEDIA_TYPES = {
+	ExportFormat.NDJSON: "application/x-ndjson",
+	ExportFormat.CSV: "text/csv; charset=utf-8",
+}
+
+
+async def export_todos(
+	owner_id: int, format: ExportFormat, chunk_size: int, /,
+) -> AsyncIterator[str]:
+	serialize = _serialize_ndjson
+	if format == ExportFormat.CSV:
+		serialize = _serialize_csv
+		yield _serialize_csv([dict(zip(FIELDS, FIELDS))])
+
+	async for rows in _iter_rows(owner_id, chunk_size):
+		yield serialize(rows)
@@ -1,12 +1,38 @@
 from __future__ import annotations
 
-from typing import Any, Type
+import asyncio
+from datetime import timedelta
+from typing import Any, Dict, List, Type, Iterable, Optional, \
+	Collection
 
 from fastapi import UploadFile
-from tortoise import fields, Tortoise
+from tortoise import fields, timezone
 from tortoise.signals import pre_delete
+from tortoise.exceptions import DoesNotExist
+from tortoise.transactions import in_transaction
 
-from ..helpers import BaseModel, delete_image, save_image
+from ..helpers import BaseModel, TTLCache, delete_image, save_image, \
+	save_image_async
+from ..settings import get_settings
+
+
+settings = get_settings()
+
+# Owner ids of recently checked images by their filenames
+image_owner_cache: TTLCache[str, int] = TTLCache(
+	settings.IMAGES_OWNER_CACHE_MAX_SIZE,
+	settings.IMAGES_OWNER_CACHE_TTL.total_seconds(),
+)
+
+
+def _delete_image(filename: str, /) -> None:
+	delete_image(filename)
+	image_owner_cache.delete(filename)
+
+
+def _delete_images(filenames: Iterable[str], /) -> None:
+	for filename in filenames:
+		_delete_image(filename)
 
 
 class Todo(BaseModel):
@@ -14,12 +40,17 @@ class Todo(BaseModel):
 		"models.User", related_name="todos",
 		on_delete=fields.CASCADE,
 	)
-	image_filename = fields.CharField(40, null=True)
+	image_filename = fields.CharField(40, null=True, unique=True)
 	title = fields.CharField(140, index=True)
 	text = fields.TextField()
 
 	class Meta:
-		ordering = ("-created_at",)
+		ordering = ("-created_at", "-id")
+		# Lets owner's todos be read already in the order above. Tortoise
+		# cannot declare descending columns, so the migration creates it
+		# with "created_at" DESC, "id" DESC, and schemas generated for
+		# tests have it ascending, which is scanned backwards the same.
+		indexes = (("owner_id", "created_at", "id"),)
 
 	class PydanticMeta:
 		exclude = ("owner", "owner_id")
@@ -27,20 +58,171 @@ class Todo(BaseModel):
 	def __repr__(self) -> str:
 		return "<Todo title=\"%s\">" % self.title
 
-	def set_image(self, image: UploadFile, /) -> None:
-		if self.image_filename is not None:
-			delete_image(self.image_filename)
+	@classmethod
+	async def is_image_owner(cls, owner_id: int, filename: str, /) -> bool:
+		"""Checks it with one lookup by the unique index of image filenames.
+		Only positive results are cached, as images do not change owners.
+		"""
+
+		if image_owner_cache.get(filename) == owner_id:
+			return True
+
+		rv = await cls.filter(
+			image_filename=filename, owner_id=owner_id,
+		).exists()
+		if rv:
+			image_owner_cache.set(filename, owner_id)
+		return rv
+
+	@classmethod
+	async def create_batch(
+		cls, owner_id: int, items: Iterable[Dict[str, Any]], /,
+	) -> List[Todo]:
+		"""Creates todos with one query.
+
+		:return: Created todos in the order of `items`
+		"""
+
+		connection = cls._choose_db(True)
+		executor = connection.executor_class(model=cls, db=connection)
+		# Every todo is a microsecond older than the previous one, so that
+		# the listing, newest first, keeps the order of items
+		now = timezone.now()
+		todos = [
+			cls(
+				owner_id=owner_id,
+				created_at=now - timedelta(microseconds=i),
+				**item,
+			)
+			for i, item in enumerate(items)
+		]
+
+		# `bulk_create` does not return primary keys, so the todos are
+		# inserted with `RETURNING`, which Postgres and SQLite 3.35+ have
+		query = connection.query_class.into(cls._meta.basetable).columns(*(
+			cls._meta.fields_db_projection[field]
+			for field in executor.regular_columns
+		))
+		values: List[Any] = []
+		for todo in todos:
+			parameters = []
+			for field in executor.regular_columns:
+				parameters.append(executor.parameter(len(values)))
+				values.append(
+					executor.column_map[field](getattr(todo, field), todo),
+				)
+			query = query.insert(*parameters)
+
+		rows = await connection.execute_query_dict(
+			"%s RETURNING \"id\", \"created_at\"" % query, values,
+		)
+		# Neither the order of ids nor of the returned rows is defined, so
+		# the rows are matched to the todos by their creation times
+		to_python = cls._meta.fields_map['created_at'].to_python_value
+		rows.sort(key=lambda row: to_python(row['created_at']), reverse=True)
+		for todo, row in zip(todos, rows):
+			todo.id = row['id']
+			todo._saved_in_db = True
+		return todos
+
+	@classmethod
+	async def update_batch(
+		cls, owner_id: int, items: Dict[int, Dict[str, Any]], /,
+	) -> List[Todo]:
+		"""Updates todos of the owner in one transaction, all or none of them.
 
+		:param items: New field values by todo ids
+		:raise DoesNotExist: If some of the todos do not exist
+		"""
+
+		connection_name = cls._meta.default_connection
+		async with in_transaction(connection_name) as connection:
+			todos = await cls.filter(owner_id=owner_id, id__in=list(items)) \
+				.order_by("id").select_for_update().using_db(connection)
+			if len(todos) != len(items):
+				raise DoesNotExist("Some of the todos do not exist.")
+
+			for todo in todos:
+				todo.update_from_dict(items[todo.id])
+				await todo.save(
+					using_db=connection,
+					update_fields=(*items[todo.id], "updated_at"),
+				)
+
+		return todos
+
+	@classmethod
+	async def delete_batch(cls, owner_id: int, ids: Collection[int], /) -> None:
+		"""Deletes todos of the owner with one query, all or none of them.
+		There are no delete signals, so the images are deleted here together.
+
+		:raise DoesNotExist: If some of the todos do not exist
+		"""
+
+		ids = set(ids)
+		table = cls._meta.basetable
+		# `QuerySet.delete` adds the default ordering, which Postgres and
+		# SQLite do not accept in `DELETE` statements.
+		query = cls._meta.basequery.where(
+			(table.owner_id == owner_id) & table.id.isin(list(ids)),
+		).delete()
+
+		connection_name = cls._meta.default_connection
+		async with in_transaction(connection_name) as connection:
+			# Deleted todos are counted by the returned rows, as SQLite
+			# counts the changes made by the search triggers too.
+			rows = await connection.execute_query_dict(
+				"%s RETURNING \"image_filename\"" % query,
+			)
+			if len(rows) != len(ids):
+				raise DoesNotExist("Some of the todos do not exist.")
+
+		await asyncio.get_running_loop().run_in_executor(
+			None,
+			_delete_images,
+			[
+				row['image_filename'] for row in rows
+				if row['image_filename'] is not None
+			],
+		)
+
+	def set_image(self, image: UploadFile, /) -> None:
+		old_filename = self.image_filename
 		self.image_filename = save_image(image)  # type: ignore
 
+		if old_filename is not None:
+			_delete_image(old_filename)
+
+	async def save_with_image_async(
+		self, image: Optional[UploadFile], /,
+	) -> None:
+		"""Saves the todo with the new image, if there is one. The old image
+		is deleted only once the todo is saved, and the new one if it is not,
+		so that `image_filename` always points at an existing file."""
+
+		if image is None:
+			await self.save()
+			return
+
+		old_filename = self.image_filename
+		self.image_filename = await save_image_async(image)  # type: ignore
+		try:
+			await self.save()
+		except BaseException:
+			_delete_image(self.image_filename)  # type: ignore
+			self.image_filename = old_filename
+			raise
+
+		if old_filename is not None:
+			_delete_image(old_filename)
+
 
 @pre_delete(Todo)
 async def _delete_image_before_delete(
 	sender: Type[Todo], instance: Todo, *args: Any,
 ) -> None:
 	if instance.image_filename is not None:
-		delete_image(instance.image_filename)
+		_delete_image(instance.image_filename)
 
 
 from ..accounts.models import User  # noqa
-Tortoise.init_models(("app.todos.models",), "models")
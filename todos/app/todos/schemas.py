@@ -1,13 +1,26 @@
-from typing import Any, Dict, Tuple, Optional
+from datetime import datetime
+from typing import Any, Dict, List, Tuple, Optional
 
 from fastapi import Form, File, UploadFile
-from tortoise.contrib.pydantic import pydantic_model_creator
+from pydantic import BaseModel, Field, validator
 
-from .models import Todo
 from .. import schemas as common_schemas
+from ..settings import get_settings
 
 
-TodoOut = pydantic_model_creator(Todo, name="TodoOut")
+settings = get_settings()
+
+
+class TodoOut(BaseModel):
+	id: int
+	created_at: datetime
+	updated_at: datetime
+	image_filename: Optional[str] = Field(None, max_length=40)
+	title: str = Field(..., max_length=140)
+	text: str
+
+	class Config:
+		orm_mode = True
 
 
 class TodoInForm:
@@ -31,3 +44,48 @@ class TodoInForm:
 
 class TodosOut(common_schemas.Pagination[TodoOut]):  # type: ignore
 	pass
+
+
+class TodoIn(BaseModel):
+	title: str = Field(..., min_length=4, max_length=140)
+	text: str = Field(..., min_length=5, max_length=1000)
+
+
+class TodoInBatchUpdate(TodoIn):
+	id: int
+
+
+class TodosInBatchCreate(BaseModel):
+	todos: List[TodoIn] = Field(
+		..., min_items=1, max_items=settings.TODOS_BATCH_MAX_SIZE,
+	)
+
+
+class TodosInBatchUpdate(BaseModel):
+	todos: List[TodoInBatchUpdate] = Field(
+		..., min_items=1, max_items=settings.TODOS_BATCH_MAX_SIZE,
+	)
+
+	@validator("todos")
+	def validate_ids_unique(
+		cls, todos: List[TodoInBatchUpdate],
+	) -> List[TodoInBatchUpdate]:
+		if len({todo.id for todo in todos}) != len(todos):
+			raise ValueError("Ids must be unique.")
+		return todos
+
+
+class TodosInBatchDelete(BaseModel):
+	ids: List[int] = Field(
+		..., min_items=1, max_items=settings.TODOS_BATCH_MAX_SIZE,
+	)
+
+	@validator("ids")
+	def validate_ids_unique(cls, ids: List[int]) -> List[int]:
+		if len(set(ids)) != len(ids):
+			raise ValueError("Ids must be unique.")
+		return ids
+
+
+class TodosBatchOut(BaseModel):
+	results: List[TodoOut]  # type: ignore
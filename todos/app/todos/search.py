@@ -0,0 +1,149 @@
+"""Full-text search over titles and texts of todos. Postgres matches the
+generated `todo.search_vector` column through its GIN index, see the
+migrations. SQLite, which the tests use, has an FTS5 table instead, which
+`create_search_index` creates and fills at startup and triggers keep up to
+date. Other databases are not supported."""
+
+import re
+import binascii
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import lru_cache
+from typing import Any, List, Tuple, Optional
+
+from fastapi import status, HTTPException
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+from .models import Todo
+
+
+# Must match the configuration of `todo.search_vector`
+_POSTGRES_CONFIG = "english"
+
+_POSTGRES_QUERY = """
+SELECT * FROM (
+	SELECT %%s, ts_rank_cd("todo"."search_vector", "query") AS "rank"
+	FROM "todo", plainto_tsquery('%s', $1) AS "query"
+	WHERE "todo"."owner_id" = $2 AND "todo"."search_vector" @@ "query"
+) AS "matches"
+WHERE $3::real IS NULL OR ("rank", "id") < ($3::real, $4::int)
+ORDER BY "rank" DESC, "id" DESC
+LIMIT $5
+""" % _POSTGRES_CONFIG
+
+# Titles weigh as much as in Postgres, where they are in the "A" group
+_SQLITE_QUERY = """
+SELECT * FROM (
+	SELECT %s, -bm25("todo_fts", 10.0, 1.0) AS "rank"
+	FROM "todo_fts" JOIN "todo" ON "todo"."id" = "todo_fts"."rowid"
+	WHERE "todo_fts" MATCH ? AND "todo"."owner_id" = ?
+) AS "matches"
+WHERE ? IS NULL OR ("rank", "id") < (?, ?)
+ORDER BY "rank" DESC, "id" DESC
+LIMIT ?
+"""
+
+
+@lru_cache()
+def _get_columns() -> str:
+	# Foreign keys of the model are known once Tortoise is initialized
+	return ", ".join('"todo"."%s"' % column for column in (
+		Todo._meta.fields_db_projection.values()
+	))
+
+
+_SQLITE_INDEX_SCRIPT = """
+CREATE VIRTUAL TABLE "todo_fts" USING fts5(
+	"title", "text", content="todo", content_rowid="id", tokenize="porter"
+);
+CREATE TRIGGER "todo_fts_insert" AFTER INSERT ON "todo" BEGIN
+	INSERT INTO "todo_fts" ("rowid", "title", "text")
+	VALUES (new."id", new."title", new."text");
+END;
+CREATE TRIGGER "todo_fts_delete" AFTER DELETE ON "todo" BEGIN
+	INSERT INTO "todo_fts" ("todo_fts", "rowid", "title", "text")
+	VALUES ('delete', old."id", old."title", old."text");
+END;
+CREATE TRIGGER "todo_fts_update" AFTER UPDATE ON "todo" BEGIN
+	INSERT INTO "todo_fts" ("todo_fts", "rowid", "title", "text")
+	VALUES ('delete', old."id", old."title", old."text");
+	INSERT INTO "todo_fts" ("rowid", "title", "text")
+	VALUES (new."id", new."title", new."text");
+END;
+INSERT INTO "todo_fts" ("todo_fts") VALUES ('rebuild');
+"""
+
+
+def encode_search_cursor(rank: float, id: int, /) -> str:
+	raw = "%r|%d" % (rank, id)
+	return urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_search_cursor(cursor: str, /) -> Tuple[float, int]:
+	try:
+		raw = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+		rank, id = raw.split("|")
+		return float(rank), int(id)
+	except (binascii.Error, UnicodeDecodeError, ValueError):
+		raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid cursor.")
+
+
+def _check_dialect(connection: BaseDBAsyncClient, /) -> str:
+	dialect = connection.capabilities.dialect
+	if dialect not in {"postgres", "sqlite"}:
+		raise RuntimeError(
+			"Search of todos supports Postgres and SQLite, not %s." % dialect,
+		)
+	return dialect
+
+
+async def create_search_index() -> None:
+	"""Creates the FTS5 table on SQLite once the schema exists. Postgres
+	has its index from the migrations."""
+
+	connection = Todo._choose_db(True)
+	if _check_dialect(connection) != "sqlite":
+		return
+
+	_, rows = await connection.execute_query(
+		"SELECT 1 FROM sqlite_master WHERE name = 'todo_fts'",
+	)
+	if not rows:
+		await connection.execute_script(_SQLITE_INDEX_SCRIPT)
+
+
+def _make_sqlite_match(query: str, /) -> Optional[str]:
+	# Every word is quoted, so that it is not taken for FTS5 syntax
+	words = re.findall(r"\w+", query)
+	return " ".join('"%s"' % word for word in words) if words else None
+
+
+async def search_todos(
+	owner_id: int,
+	query: str,
+	after: Optional[Tuple[float, int]],
+	limit: int,
+	/,
+) -> List[Tuple[Todo, float]]:
+	"""Finds todos of the owner that contain all the words of the query.
+
+	:param after: Rank and id of the last todo of the previous page
+	:return: Todos with their ranks, the most relevant first
+	"""
+
+	connection = Todo._choose_db()
+	rank, id = after or (None, None)
+	values: List[Any]
+
+	if _check_dialect(connection) == "postgres":
+		sql = _POSTGRES_QUERY
+		values = [query, owner_id, rank, id, limit]
+	else:
+		match = _make_sqlite_match(query)
+		if match is None:
+			return []
+
+		sql = _SQLITE_QUERY
+		values = [match, owner_id, rank, rank, id, limit]
+
+	_, rows = await connection.execute_query(sql % _get_columns(), values)
+	return [(Todo._init_from_db(**dict(row)), row['rank']) for row in rows]
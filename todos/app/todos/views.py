@@ -1,37 +1,97 @@
-from typing import Any, Dict
+from datetime import datetime
+from urllib.parse import urlencode
+from typing import Any, Dict, Optional
 
 from fastapi import Query, status, Depends, Request, Response
+from fastapi.responses import StreamingResponse
 
 from . import router, schemas
 from .models import Todo
-from ..helpers import paginate
+from .export import MEDIA_TYPES, ExportFormat, export_todos
+from .search import search_todos, encode_search_cursor, decode_search_cursor
+from ..helpers import paginate, paginate_by_cursor, make_weak_etag, \
+	is_not_modified, format_http_date
 from ..settings import get_settings
+from ..serializers import get_fields, serialize, make_response
 from ..dependencies import get_confirmed_user_from_token
 from ..accounts.models import User
 
 
 settings = get_settings()
 
+_TODO_FIELDS = get_fields(schemas.TodoOut)
+# Keys of pagination in the order of their JSON, all `None` by default
+_EMPTY_PAGINATION = dict.fromkeys(get_fields(schemas.TodosOut))
+
+
+def _make_cache_headers(
+	etag: str, last_modified: Optional[datetime] = None,
+) -> Dict[str, str]:
+	# Todos can change at any time, so clients must revalidate them
+	rv = {'Cache-Control': "private, no-cache", 'ETag': etag}
+	if last_modified is not None:
+		rv['Last-Modified'] = format_http_date(last_modified)
+	return rv
+
 
 @router.get("/", response_model=schemas.TodosOut)
 async def get_todos(
 	request: Request,
 	page: int = Query(1, ge=1, alias="page"),
+	cursor: Optional[str] = Query(None, alias="cursor"),
 	user: User = Depends(get_confirmed_user_from_token),
-) -> schemas.TodosOut:
+) -> Response:
+	"""Pass an empty `cursor` to switch from page mode to cursor mode,
+	in which pages are fetched in constant time."""
+
 	queryset = user.todos.all()  # type: ignore
-	pagination = await paginate(
-		queryset,
-		request.url_for("get_todos"),
-		page,
-		settings.TODOS_PER_PAGE,
-	)
-	results = await schemas.TodoOut.from_queryset(pagination['queryset'])
-	return schemas.TodosOut(
-		pages_count=pagination['pages_count'],
-		previous_page_url=pagination['previous_page_url'],
-		next_page_url=pagination['next_page_url'],
-		results=results,
+	pagination_data: Dict[str, Any]
+
+	if cursor is not None:
+		cursor_pagination = await paginate_by_cursor(
+			queryset,
+			request.url_for("get_todos"),
+			cursor,
+			settings.TODOS_PER_PAGE,
+		)
+		todos = [
+			serialize(todo, _TODO_FIELDS)
+			for todo in cursor_pagination['objects']
+		]
+		pagination_data = {
+			'previous_cursor': cursor_pagination['previous_cursor'],
+			'next_cursor': cursor_pagination['next_cursor'],
+			'previous_page_url': cursor_pagination['previous_page_url'],
+			'next_page_url': cursor_pagination['next_page_url'],
+		}
+	else:
+		pagination = await paginate(
+			queryset,
+			request.url_for("get_todos"),
+			page,
+			settings.TODOS_PER_PAGE,
+		)
+		todos = await pagination['queryset'].values(*_TODO_FIELDS)
+		pagination_data = {
+			'pages_count': pagination['pages_count'],
+			'previous_page_url': pagination['previous_page_url'],
+			'next_page_url': pagination['next_page_url'],
+		}
+
+	headers = _make_cache_headers(make_weak_etag(
+		pagination_data,
+		[(todo['id'], todo['updated_at']) for todo in todos],
+	))
+	if is_not_modified(request, headers['ETag']):
+		return Response(
+			status_code=status.HTTP_304_NOT_MODIFIED,
+			headers=headers,
+		)
+
+	return make_response(
+		{**_EMPTY_PAGINATION, **pagination_data, 'results': todos},
+		schemas.TodosOut,
+		headers=headers,
 	)
 
 
@@ -43,23 +103,137 @@ async def get_todos(
 async def create_todo(
 	data: schemas.TodoInForm = Depends(),
 	user: User = Depends(get_confirmed_user_from_token),
-) -> schemas.TodoOut:  # type: ignore
+) -> Response:
 	new_todo = Todo(owner=user, **data.dict(exclude=("image",)))
 
-	if data.image is not None:
-		new_todo.set_image(data.image)
+	await new_todo.save_with_image_async(data.image)
+	return make_response(
+		serialize(new_todo, _TODO_FIELDS),
+		schemas.TodoOut,
+		status_code=status.HTTP_201_CREATED,
+	)
+
+
+# Declared before the routes of single todos, whose paths match them too
+@router.get("/export/", response_class=StreamingResponse)
+async def export_todos_view(
+	format: ExportFormat = Query(ExportFormat.NDJSON),
+	user: User = Depends(get_confirmed_user_from_token),
+) -> StreamingResponse:
+	"""All the todos, one JSON object or CSV row per line."""
+
+	return StreamingResponse(
+		export_todos(user.id, format, settings.TODOS_EXPORT_CHUNK_SIZE),
+		media_type=MEDIA_TYPES[format],
+		headers={
+			'Content-Disposition':
+				"attachment; filename=\"todos.%s\"" % format.value,
+		},
+	)
+
+
+@router.get("/search/", response_model=schemas.TodosOut)
+async def search_todos_view(
+	request: Request,
+	q: str = Query(..., min_length=1, max_length=200),
+	cursor: Optional[str] = Query(None),
+	user: User = Depends(get_confirmed_user_from_token),
+) -> Response:
+	"""Todos that contain all the words of `q`, the most relevant first.
+	Pages are followed forwards only, with `next_page_url`."""
+
+	after = decode_search_cursor(cursor) if cursor else None
+	# One extra todo tells us whether there is a next page
+	found = await search_todos(
+		user.id, q, after, settings.TODOS_SEARCH_PER_PAGE + 1,
+	)
+
+	next_cursor = next_page_url = None
+	if len(found) > settings.TODOS_SEARCH_PER_PAGE:
+		found = found[:settings.TODOS_SEARCH_PER_PAGE]
+		last_todo, last_rank = found[-1]
+		next_cursor = encode_search_cursor(last_rank, last_todo.id)
+		next_page_url = request.url_for("search_todos_view") + "?" \
+			+ urlencode({'q': q, 'cursor': next_cursor})
+
+	return make_response(
+		{
+			**_EMPTY_PAGINATION,
+			'next_cursor': next_cursor,
+			'next_page_url': next_page_url,
+			'results': [serialize(todo, _TODO_FIELDS) for todo, _ in found],
+		},
+		schemas.TodosOut,
+	)
+
+
+@router.post(
+	"/batch/",
+	response_model=schemas.TodosBatchOut,
+	status_code=status.HTTP_201_CREATED,
+)
+async def create_todos_batch(
+	data: schemas.TodosInBatchCreate,
+	user: User = Depends(get_confirmed_user_from_token),
+) -> Response:
+	todos = await Todo.create_batch(
+		user.id, [todo.dict() for todo in data.todos],
+	)
+	return make_response(
+		{'results': [serialize(todo, _TODO_FIELDS) for todo in todos]},
+		schemas.TodosBatchOut,
+		status_code=status.HTTP_201_CREATED,
+	)
 
-	await new_todo.save()
-	return await schemas.TodoOut.from_tortoise_orm(new_todo)
+
+@router.put("/batch/", response_model=schemas.TodosBatchOut)
+async def update_todos_batch(
+	data: schemas.TodosInBatchUpdate,
+	user: User = Depends(get_confirmed_user_from_token),
+) -> Response:
+	todos = await Todo.update_batch(user.id, {
+		todo.id: todo.dict(exclude={"id"}) for todo in data.todos
+	})
+	return make_response(
+		{'results': [serialize(todo, _TODO_FIELDS) for todo in todos]},
+		schemas.TodosBatchOut,
+	)
+
+
+@router.post(
+	"/batch/delete/",
+	response_class=Response,
+	status_code=status.HTTP_204_NO_CONTENT,
+)
+async def delete_todos_batch(
+	data: schemas.TodosInBatchDelete,
+	user: User = Depends(get_confirmed_user_from_token),
+) -> Response:
+	await Todo.delete_batch(user.id, data.ids)
+	return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
 @router.get("/{id}/", response_model=schemas.TodoOut)
 async def get_todo(
+	request: Request,
 	id: int,
 	user: User = Depends(get_confirmed_user_from_token),
-) -> schemas.TodoOut:  # type: ignore
+) -> Response:
 	todo = await user.todos.all().get(id=id)  # type: ignore
-	return await schemas.TodoOut.from_tortoise_orm(todo)
+
+	headers = _make_cache_headers(
+		make_weak_etag(todo.id, todo.updated_at),
+		todo.updated_at,
+	)
+	if is_not_modified(request, headers['ETag'], todo.updated_at):
+		return Response(
+			status_code=status.HTTP_304_NOT_MODIFIED,
+			headers=headers,
+		)
+
+	return make_response(
+		serialize(todo, _TODO_FIELDS), schemas.TodoOut, headers=headers,
+	)
 
 
 @router.put("/{id}/", response_model=schemas.TodoOut)
@@ -67,15 +241,12 @@ async def update_todo(
 	id: int,
 	data: schemas.TodoInForm = Depends(),
 	user: User = Depends(get_confirmed_user_from_token),
-) -> schemas.TodoOut:  # type: ignore
+) -> Response:
 	todo = await user.todos.all().get(id=id)  # type: ignore
 	todo.update_from_dict(data.dict(exclude=("image",)))
 
-	if data.image is not None:
-		todo.set_image(data.image)
-
-	await todo.save()
-	return await schemas.TodoOut.from_tortoise_orm(todo)
+	await todo.save_with_image_async(data.image)
+	return make_response(serialize(todo, _TODO_FIELDS), schemas.TodoOut)
 
 
 @router.delete(
@@ -0,0 +1,137 @@
+"""Access tokens, which are JWTs signed with `SECRET_KEY` by default.
+With an asymmetric `JWT_ALGORITHM`, such as RS256 or EdDSA, they are
+signed with `JWT_PRIVATE_KEY` instead, and nginx or other nodes can
+validate them with `JWT_PUBLIC_KEY`, which is published at
+`/accounts/token/keys/`, without any secret. Only the nodes that issue
+tokens need the private key.
+
+Tokens carry the confirmation status of the phone number of the user
+and the version of the user's tokens, which is incremented to revoke
+all of them. Validated claims are cached by token signatures, so most
+requests only look tokens up."""
+
+import json
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Tuple, Optional, TypedDict
+
+import jwt
+from jwt.algorithms import get_default_algorithms
+
+from .helpers import TTLCache
+from .settings import get_settings
+
+
+settings = get_settings()
+
+# HMAC algorithms sign with `SECRET_KEY`, all the others are asymmetric
+_SYMMETRIC_ALGORITHMS = {"HS256", "HS384", "HS512"}
+
+
+class TokenClaims(TypedDict):
+	id: int
+	# Version of the user's tokens, see `User.token_version`
+	ver: int
+	# Whether the phone number was confirmed when the token was issued
+	confirmed: bool
+	exp: int
+
+
+# Claims of recently validated tokens by their signatures
+token_cache: TTLCache[str, TokenClaims] = TTLCache(
+	settings.USER_CACHE_MAX_SIZE,
+	settings.USER_CACHE_TTL.total_seconds(),
+)
+
+
+@lru_cache()
+def _get_keys() -> Tuple[Optional[Any], Any]:
+	"""Parses the keys once, as parsing PEM keys takes longer than
+	verifying signatures.
+
+	:return: Signing key, which is `None` for nodes that only validate
+	tokens, and verifying key
+	"""
+
+	algorithm = get_default_algorithms()[settings.JWT_ALGORITHM]
+	if settings.JWT_ALGORITHM in _SYMMETRIC_ALGORITHMS:
+		key = algorithm.prepare_key(settings.SECRET_KEY)
+		return key, key
+
+	private_key = None
+	if settings.JWT_PRIVATE_KEY is not None:
+		private_key = algorithm.prepare_key(settings.JWT_PRIVATE_KEY)
+
+	if settings.JWT_PUBLIC_KEY is not None:
+		public_key = algorithm.prepare_key(settings.JWT_PUBLIC_KEY)
+	elif private_key is not None:
+		public_key = private_key.public_key()
+	else:
+		raise RuntimeError(
+			"Set JWT_PUBLIC_KEY or JWT_PRIVATE_KEY to use %s."
+			% settings.JWT_ALGORITHM,
+		)
+
+	return private_key, public_key
+
+
+def encode_token(id: int, version: int, confirmed: bool, /) -> str:
+	private_key, _ = _get_keys()
+	if private_key is None:
+		raise RuntimeError("Set JWT_PRIVATE_KEY to issue tokens.")
+
+	return jwt.encode(
+		{
+			'id': id,
+			'ver': version,
+			'confirmed': confirmed,
+			'exp': datetime.utcnow() + settings.TOKEN_MAX_AGE,
+		},
+		private_key,
+		settings.JWT_ALGORITHM,
+	)
+
+
+def decode_token(token: str, /) -> TokenClaims:
+	""":raise jwt.InvalidTokenError: If the token is invalid or expired"""
+
+	# Signatures cover the rest of tokens, so they identify them
+	signature = token.rpartition(".")[2]
+	claims = token_cache.get(signature)
+	if claims is not None:
+		if claims['exp'] > time.time():
+			return claims
+		token_cache.delete(signature)
+		raise jwt.ExpiredSignatureError
+
+	data = jwt.decode(
+		token,
+		_get_keys()[1],
+		algorithms=[settings.JWT_ALGORITHM],
+		options={'require': ["exp"]},
+	)
+	claims = {
+		'id': data['id'],
+		# Tokens issued before the claims were added
+		'ver': data.get("ver", 0),
+		'confirmed': data.get("confirmed", False),
+		'exp': data['exp'],
+	}
+	token_cache.set(signature, claims)
+	return claims
+
+
+def get_public_jwks() -> Dict[str, Any]:
+	""":return: JSON Web Key Set of the public key, empty for symmetric
+	algorithms"""
+
+	if settings.JWT_ALGORITHM in _SYMMETRIC_ALGORITHMS:
+		return {'keys': []}
+
+	algorithm = get_default_algorithms()[settings.JWT_ALGORITHM]
+	return {'keys': [{
+		**json.loads(algorithm.to_jwk(_get_keys()[1])),
+		'alg': settings.JWT_ALGORITHM,
+		'use': "sig",
+	}]}
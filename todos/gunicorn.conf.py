@@ -0,0 +1,40 @@
+"""Production server settings, see `supervisor.conf`. Send `HUP` to the
+master process to gracefully restart the workers with the new code."""
+
+import os
+import shutil
+import multiprocessing
+
+
+bind = "0.0.0.0:80"
+
+# Keep it in sync with `Settings.WORKERS`, which sizes connection pools
+workers = int(os.environ.get("WORKERS") or multiprocessing.cpu_count())
+# Uses uvloop and httptools, as they are installed with `uvicorn[standard]`
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Every worker imports the application itself, so no connections are
+# shared between processes and `HUP` reloads the code.
+preload_app = False
+
+timeout = 60
+graceful_timeout = 30
+keepalive = 75
+max_requests = 10000
+max_requests_jitter = 1000
+
+forwarded_allow_ips = "*"
+
+
+def on_starting(server):
+	# Metrics of previous runs, see `app.metrics`
+	path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+	if path:
+		shutil.rmtree(path, ignore_errors=True)
+		os.makedirs(path)
+
+
+def child_exit(server, worker):
+	if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+		from prometheus_client import multiprocess
+		multiprocess.mark_process_dead(worker.pid)
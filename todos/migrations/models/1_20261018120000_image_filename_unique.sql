@@ -0,0 +1,4 @@
+-- upgrade --
+CREATE UNIQUE INDEX "uid_todo_image_f_5d934b" ON "todo" ("image_filename");
+-- downgrade --
+DROP INDEX "uid_todo_image_f_5d934b";
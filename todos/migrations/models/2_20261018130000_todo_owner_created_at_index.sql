@@ -0,0 +1,4 @@
+-- upgrade --
+CREATE INDEX "idx_todo_owner_i_67b869" ON "todo" ("owner_id", "created_at" DESC, "id" DESC);
+-- downgrade --
+DROP INDEX "idx_todo_owner_i_67b869";
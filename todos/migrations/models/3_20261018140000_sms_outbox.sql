@@ -0,0 +1,17 @@
+-- upgrade --
+CREATE TABLE IF NOT EXISTS "smsmessage" (
+	"id" SERIAL NOT NULL PRIMARY KEY,
+	"created_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+	"updated_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+	"to" VARCHAR(17) NOT NULL,
+	"body" TEXT NOT NULL,
+	"status" VARCHAR(7) NOT NULL  DEFAULT 'pending',
+	"attempts" INT NOT NULL  DEFAULT 0,
+	"send_after" TIMESTAMPTZ NOT NULL,
+	"last_error" TEXT
+);
+CREATE INDEX IF NOT EXISTS "idx_smsmessage_status_bde06e" ON "smsmessage" ("status", "send_after");
+COMMENT ON COLUMN "smsmessage"."status" IS 'PENDING: pending\nSENT: sent\nFAILED: failed';
+COMMENT ON TABLE "smsmessage" IS 'Outbox of messages, which are sent by `app.sms.worker`.';
+-- downgrade --
+DROP TABLE IF EXISTS "smsmessage";
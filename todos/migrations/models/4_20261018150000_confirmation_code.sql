@@ -0,0 +1,13 @@
+-- upgrade --
+CREATE TABLE IF NOT EXISTS "confirmationcode" (
+	"id" SERIAL NOT NULL PRIMARY KEY,
+	"created_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+	"updated_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+	"code" VARCHAR(16) NOT NULL,
+	"attempts" INT NOT NULL  DEFAULT 0,
+	"expires_at" TIMESTAMPTZ NOT NULL,
+	"user_id" INT NOT NULL UNIQUE REFERENCES "user" ("id") ON DELETE CASCADE
+);
+COMMENT ON TABLE "confirmationcode" IS 'Phone number confirmation codes of `app.accounts.confirmation.DatabaseConfirmationCodeStore`.';
+-- downgrade --
+DROP TABLE IF EXISTS "confirmationcode";
@@ -0,0 +1,9 @@
+-- upgrade --
+ALTER TABLE "todo" ADD COLUMN "search_vector" TSVECTOR GENERATED ALWAYS AS (
+	setweight(to_tsvector('english', "title"), 'A')
+	|| setweight(to_tsvector('english', "text"), 'B')
+) STORED;
+CREATE INDEX "idx_todo_search__94660b" ON "todo" USING GIN ("search_vector");
+-- downgrade --
+DROP INDEX "idx_todo_search__94660b";
+ALTER TABLE "todo" DROP COLUMN "search_vector";
@@ -0,0 +1,11 @@
+-- upgrade --
+CREATE TABLE IF NOT EXISTS "ratelimitbucket" (
+	"id" SERIAL NOT NULL PRIMARY KEY,
+	"created_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+	"updated_at" TIMESTAMPTZ NOT NULL  DEFAULT CURRENT_TIMESTAMP,
+	"key" VARCHAR(100) NOT NULL UNIQUE,
+	"tat" DOUBLE PRECISION NOT NULL
+);
+COMMENT ON TABLE "ratelimitbucket" IS 'Buckets of `app.ratelimit.backends.DatabaseRateLimitBackend`.';
+-- downgrade --
+DROP TABLE IF EXISTS "ratelimitbucket";
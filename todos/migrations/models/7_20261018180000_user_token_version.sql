@@ -0,0 +1,4 @@
+-- upgrade --
+ALTER TABLE "user" ADD "token_version" INT NOT NULL  DEFAULT 0;
+-- downgrade --
+ALTER TABLE "user" DROP COLUMN "token_version";
@@ -0,0 +1,5 @@
+-- upgrade --
+COMMENT ON COLUMN "smsmessage"."status" IS 'PENDING: pending\nSENDING: sending\nSENT: sent\nFAILED: failed';
+-- downgrade --
+UPDATE "smsmessage" SET "status" = 'pending' WHERE "status" = 'sending';
+COMMENT ON COLUMN "smsmessage"."status" IS 'PENDING: pending\nSENT: sent\nFAILED: failed';
@@ -0,0 +1,56 @@
+"""Time and peak memory of exporting 100k todos. The memory must not grow
+with the number of todos, the time is inflated by `tracemalloc` several
+times. It is not collected by default, run it with
+`pytest -s tests/benchmarks/bench_export.py`."""
+
+import time
+import tracemalloc
+
+import pytest
+from httpx import AsyncClient
+
+from app.settings import get_settings
+from app.todos.models import Todo
+from app.todos.export import ExportFormat, export_todos
+from app.accounts.models import User
+
+
+settings = get_settings()
+
+TODOS_COUNTS = (10_000, 100_000)
+
+
+@pytest.mark.asyncio
+async def test_export_todos(
+	client: AsyncClient,
+	test_confirmed_user: User,
+) -> None:
+	created_count = 0
+
+	for todos_count in TODOS_COUNTS:
+		await Todo.bulk_create(
+			[
+				Todo(owner=test_confirmed_user, title="title", text="text " * 50)
+				for _ in range(todos_count - created_count)
+			],
+			batch_size=10_000,
+		)
+		created_count = todos_count
+
+		for format in ExportFormat:
+			tracemalloc.start()
+			started_at = time.perf_counter()
+			size = 0
+			async for chunk in export_todos(
+				test_confirmed_user.id, format,
+				settings.TODOS_EXPORT_CHUNK_SIZE,
+			):
+				size += len(chunk)
+			elapsed = time.perf_counter() - started_at
+			_, peak = tracemalloc.get_traced_memory()
+			tracemalloc.stop()
+
+			print("\n%d todos, %s: %.1fs, %.1f MB exported, %.1f MB peak" % (
+				todos_count, format.value, elapsed, size / 2 ** 20,
+				peak / 2 ** 20,
+			))
@@ -0,0 +1,50 @@
+"""Cost of the image ownership check of `get_image` as the todo table
+grows. It is not collected by default, run it with
+`pytest -s tests/benchmarks/bench_image_ownership.py`."""
+
+import time
+import secrets
+from typing import List
+
+import pytest
+from httpx import AsyncClient
+
+from app.todos.models import Todo, image_owner_cache
+from app.accounts.models import User
+
+
+TABLE_SIZES = (1_000, 10_000, 100_000)
+LOOKUPS_COUNT = 500
+
+
+@pytest.mark.asyncio
+async def test_image_ownership_lookup(
+	client: AsyncClient,
+	test_confirmed_user: User,
+) -> None:
+	filenames: List[str] = []
+
+	for table_size in TABLE_SIZES:
+		todos = [
+			Todo(
+				owner=test_confirmed_user,
+				title="title",
+				text="text",
+				image_filename=secrets.token_hex(16) + ".jpg",
+			)
+			for _ in range(table_size - len(filenames))
+		]
+		await Todo.bulk_create(todos)
+		filenames.extend(todo.image_filename for todo in todos)
+
+		started_at = time.perf_counter()
+		for i in range(LOOKUPS_COUNT):
+			image_owner_cache.clear()
+			assert await Todo.is_image_owner(
+				test_confirmed_user.id, filenames[i * 997 % len(filenames)],
+			)
+		elapsed = time.perf_counter() - started_at
+
+		print("\n%d todos: %.1f us per lookup" % (
+			table_size, elapsed / LOOKUPS_COUNT * 1_000_000,
+		))
@@ -0,0 +1,80 @@
+"""Time the application spends on an image request when it sends the
+file with `FileResponse` and when it only authorizes it and hands it over
+with `X-Accel-Redirect`. There is no nginx here, so the redirected
+requests end at the application and this measures nothing about serving
+files with sendfile. To compare what clients see, run
+`tests/benchmarks/load.py --base-url` against the compose stack, with
+and without `IMAGES_ACCEL_REDIRECT_PREFIX` on the server.
+
+It is not collected by default, run it with
+`pytest -s tests/benchmarks/bench_images.py`."""
+
+import os
+import time
+from io import BytesIO
+from typing import Dict
+
+import pytest
+from PIL import Image
+from httpx import AsyncClient
+from fastapi import UploadFile
+
+from app import app
+from app.settings import get_settings
+from app.todos.models import Todo
+from app.accounts.models import User
+from ..utils import make_auth_header
+
+
+settings = get_settings()
+
+REQUESTS_COUNT = 200
+
+
+async def _measure_time(
+	client: AsyncClient, url: str, headers: Dict[str, str],
+) -> float:
+	""":return: Milliseconds per request"""
+
+	started_at = time.perf_counter()
+	for _ in range(REQUESTS_COUNT):
+		response = await client.get(url, headers=headers)
+		assert response.status_code == 200
+	return (time.perf_counter() - started_at) / REQUESTS_COUNT * 1000
+
+
+@pytest.mark.asyncio
+async def test_image_request_time(
+	client: AsyncClient,
+	test_confirmed_user: User,
+	monkeypatch: pytest.MonkeyPatch,
+) -> None:
+	# Noise does not compress, so the image is close to its real size
+	image_io = BytesIO()
+	Image.frombytes("RGB", (1920, 1080), os.urandom(1920 * 1080 * 3)) \
+		.save(image_io, "JPEG", quality=95)
+	image_io.seek(0)
+
+	todo = Todo(owner=test_confirmed_user, title="title", text="text")
+	todo.set_image(UploadFile("image.jpg", image_io, "image/jpeg"))
+	await todo.save()
+
+	url = app.url_path_for("get_image", filename=todo.image_filename)
+	headers = make_auth_header(test_confirmed_user)
+
+	async with client:
+		file_response_time = await _measure_time(client, url, headers)
+		monkeypatch.setattr(
+			settings, "IMAGES_ACCEL_REDIRECT_PREFIX", "/protected/images/",
+		)
+		accel_redirect_time = await _measure_time(client, url, headers)
+
+	print(
+		"\nIn the application, FileResponse: %.2f ms, "
+		"X-Accel-Redirect: %.2f ms (%d bytes)"
+		% (
+			file_response_time,
+			accel_redirect_time,
+			settings.IMAGES_DIR.joinpath(todo.image_filename).stat().st_size,
+		),
+	)
@@ -0,0 +1,49 @@
+"""Overhead of `MetricsMiddleware` per request, measured around an ASGI
+application that does nothing. It is not collected by default, run it
+with `pytest -s tests/benchmarks/bench_metrics.py`."""
+
+import time
+from typing import Tuple
+
+import pytest
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+from app.metrics import MetricsMiddleware
+
+
+REQUESTS_COUNT = 100_000
+
+
+async def _endpoint(scope: Scope, receive: Receive, send: Send) -> None:
+	pass
+
+
+async def _app(scope: Scope, receive: Receive, send: Send) -> None:
+	scope['endpoint'] = _endpoint
+	await send({'type': "http.response.start", 'status': 200, 'headers': []})
+	await send({'type': "http.response.body", 'body': b"{}"})
+
+
+async def _receive() -> Message:
+	return {'type': "http.request", 'body': b""}
+
+
+async def _send(message: Message) -> None:
+	pass
+
+
+@pytest.mark.asyncio
+async def test_metrics_middleware_overhead() -> None:
+	scope = {'type': "http", 'method': "GET"}
+
+	apps: Tuple[ASGIApp, ...] = (_app, MetricsMiddleware(_app))
+	timings = []
+	for app in apps:
+		started_at = time.perf_counter()
+		for _ in range(REQUESTS_COUNT):
+			await app(dict(scope), _receive, _send)
+		timings.append((time.perf_counter() - started_at) / REQUESTS_COUNT)
+
+	print("\nMetrics overhead: %.1f us per request" % (
+		(timings[1] - timings[0]) * 1_000_000,
+	))
@@ -0,0 +1,92 @@
+"""Latency of the first page of todo search over 1M synthetic todos of one
+owner, compared with a `LIKE` scan. Tests run on SQLite, so it measures
+the FTS5 fallback; on Postgres look at `EXPLAIN ANALYZE` of the query in
+`app.todos.search` instead. It is not collected by default, run it with
+`pytest -s tests/benchmarks/bench_search.py`."""
+
+import os
+import time
+import random
+
+import pytest
+from httpx import AsyncClient
+from tortoise import timezone
+from tortoise.query_utils import Q
+
+from app.settings import get_settings
+from app.todos.models import Todo
+from app.todos.search import search_todos
+from app.accounts.models import User
+
+
+settings = get_settings()
+
+TODOS_COUNT = int(os.environ.get("BENCH_SEARCH_TODOS", 1_000_000))
+BATCH_SIZE = 10_000
+SEARCHES_COUNT = 20
+# Frequent words make large result sets, rare ones small
+VOCABULARY = ["word%d" % i for i in range(5_000)]
+QUERIES = ("word1", "word10 word20", "word4999")
+
+
+def _make_words(count: int, /) -> str:
+	# Zipf-like distribution, as in natural texts
+	return " ".join(
+		VOCABULARY[int(random.paretovariate(1.2)) % len(VOCABULARY)]
+		for _ in range(count)
+	)
+
+
+@pytest.mark.asyncio
+async def test_search_todos(
+	client: AsyncClient,
+	test_confirmed_user: User,
+) -> None:
+	random.seed(0)
+	connection = Todo._meta.db
+	now = timezone.now().isoformat()
+
+	started_at = time.perf_counter()
+	for _ in range(TODOS_COUNT // BATCH_SIZE):
+		await connection.execute_many(
+			"INSERT INTO \"todo\" (\"created_at\", \"updated_at\","
+			" \"owner_id\", \"title\", \"text\") VALUES (?, ?, ?, ?, ?)",
+			[
+				[now, now, test_confirmed_user.id, _make_words(4),
+					_make_words(30)]
+				for _ in range(BATCH_SIZE)
+			],
+		)
+	# The triggers index them as they are inserted
+	print("\nInserted and indexed %d todos in %.1fs" % (
+		TODOS_COUNT, time.perf_counter() - started_at,
+	))
+
+	for query in QUERIES:
+		started_at = time.perf_counter()
+		for _ in range(SEARCHES_COUNT):
+			found = await search_todos(
+				test_confirmed_user.id, query, None,
+				settings.TODOS_SEARCH_PER_PAGE,
+			)
+		search_time = (time.perf_counter() - started_at) / SEARCHES_COUNT
+
+		started_at = time.perf_counter()
+		filters = [
+			Q(title__icontains=word) | Q(text__icontains=word)
+			for word in query.split()
+		]
+		scanned = await Todo.filter(*filters) \
+			.limit(settings.TODOS_SEARCH_PER_PAGE)
+		scan_time = time.perf_counter() - started_at
+
+		print(
+			"%r: search %.1f ms (%d found), LIKE scan %.1f ms (%d found)"
+			% (
+				query,
+				search_time * 1000,
+				len(found),
+				scan_time * 1000,
+				len(scanned),
+			),
+		)
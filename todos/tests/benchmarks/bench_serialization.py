@@ -0,0 +1,68 @@
+"""Rendering of todo pages through pydantic schemas, as FastAPI does with
+`response_model`, and through `app.serializers`.
+It is not collected by default, run it with
+`pytest -s tests/benchmarks/bench_serialization.py`."""
+
+import time
+
+import pytest
+from httpx import AsyncClient
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app import serializers
+from app.todos import schemas
+from app.todos.models import Todo
+from app.accounts.models import User
+
+
+PAGE_SIZES = (4, 50, 500)
+REPEATS = 20
+
+
+async def _render_with_schemas(todos: list) -> bytes:
+	page = schemas.TodosOut(results=[
+		schemas.TodoOut.from_orm(todo) for todo in todos
+	])
+	# FastAPI validates the returned model again with `response_model`
+	page = schemas.TodosOut.parse_obj(jsonable_encoder(page))
+	return JSONResponse(jsonable_encoder(page)).body
+
+
+async def _render_fast(todos: list) -> bytes:
+	fields = serializers.get_fields(schemas.TodoOut)
+	return serializers.make_response(
+		{
+			**dict.fromkeys(serializers.get_fields(schemas.TodosOut)),
+			'results': [serializers.serialize(todo, fields) for todo in todos],
+		},
+		schemas.TodosOut,
+	).body
+
+
+@pytest.mark.asyncio
+async def test_serialization(
+	client: AsyncClient,
+	test_confirmed_user: User,
+	monkeypatch: pytest.MonkeyPatch,
+) -> None:
+	monkeypatch.setattr(serializers.settings, "SERIALIZATION_CHECK", False)
+	await Todo.bulk_create([
+		Todo(owner=test_confirmed_user, title="title-%d" % i, text="text " * 20)
+		for i in range(max(PAGE_SIZES))
+	])
+	all_todos = await Todo.all()
+
+	for page_size in PAGE_SIZES:
+		todos = all_todos[:page_size]
+		assert await _render_fast(todos) == await _render_with_schemas(todos)
+
+		for render in (_render_with_schemas, _render_fast):
+			started_at = time.perf_counter()
+			for _ in range(REPEATS):
+				await render(todos)
+			elapsed = (time.perf_counter() - started_at) / REPEATS
+
+			print("\n%d todos, %s: %.3f ms" % (
+				page_size, render.__name__, elapsed * 1000,
+			))
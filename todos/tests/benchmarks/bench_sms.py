@@ -0,0 +1,50 @@
+"""Throughput of the SMS outbox worker against a provider with a fixed
+latency, with different limits of concurrent requests. It is not
+collected by default, run it with `pytest -s tests/benchmarks/bench_sms.py`."""
+
+import time
+
+import pytest
+from httpx import AsyncClient
+
+from app.sms import transports, worker
+from app.sms.models import SmsMessage
+from app.sms.worker import SmsOutboxWorker
+from app.sms.transports import TwilioSmsTransport
+from ..sms_stub import app as sms_stub_app
+
+
+PROVIDER_LATENCY = 0.05
+MESSAGES_COUNT = 200
+CONCURRENCY_LIMITS = (1, 10, 50)
+
+
+@pytest.mark.asyncio
+async def test_sms_outbox_throughput(
+	client: AsyncClient,
+	monkeypatch: pytest.MonkeyPatch,
+) -> None:
+	monkeypatch.setattr(sms_stub_app.state, "latency", PROVIDER_LATENCY)
+	monkeypatch.setattr(worker.settings, "SMS_RATE_LIMIT", 10_000)
+	monkeypatch.setattr(worker.settings, "SMS_BATCH_SIZE", 50)
+
+	for limit in CONCURRENCY_LIMITS:
+		monkeypatch.setattr(
+			transports.settings, "SMS_MAX_CONCURRENT_REQUESTS", limit,
+		)
+		for i in range(MESSAGES_COUNT):
+			await SmsMessage.enqueue("+12223334455", "message-%d" % i)
+
+		transport = TwilioSmsTransport(app=sms_stub_app)
+		sms_worker = SmsOutboxWorker(transport)
+
+		started_at = time.perf_counter()
+		while await sms_worker.drain_once():
+			pass
+		elapsed = time.perf_counter() - started_at
+		await transport.close()
+
+		print(
+			"\nconcurrency=%d: %.2fs, %.0f messages/s"
+			% (limit, elapsed, MESSAGES_COUNT / elapsed),
+		)
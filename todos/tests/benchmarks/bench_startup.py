@@ -0,0 +1,59 @@
+"""Startup time of a new interpreter that imports parts of the package,
+and the slowest imports of the application by `python -X importtime`.
+It is not collected by default, run it with
+`pytest -s tests/benchmarks/bench_startup.py`."""
+
+import sys
+import time
+import subprocess
+from statistics import median
+
+from app.settings import get_settings
+
+
+settings = get_settings()
+
+REPEATS = 7
+CODES = (
+	"pass",
+	"import app.settings",
+	"import app.sms.worker",
+	"from app import app",
+)
+
+
+def _run(*args: str) -> str:
+	return subprocess.run(
+		(sys.executable, *args),
+		cwd=settings.BASE_DIR.parent,
+		capture_output=True,
+		text=True,
+		check=True,
+	).stderr
+
+
+def test_startup_time() -> None:
+	print()
+	for code in CODES:
+		timings = []
+		for _ in range(REPEATS):
+			started_at = time.perf_counter()
+			_run("-c", code)
+			timings.append(time.perf_counter() - started_at)
+		print("%-24s %.0f ms" % (code, median(timings) * 1000))
+
+	# Cumulative times of top-level modules and the ones they import
+	imports = []
+	output = _run("-X", "importtime", "-c", "from app import app")
+	for line in output.splitlines():
+		if not line.startswith("import time:"):
+			continue
+		_, column, name = line[len("import time:"):].split("|")
+		# The first line is the header
+		depth = len(name) - len(name.lstrip())
+		if column.strip().isdigit() and depth <= 3:
+			imports.append((int(column), name.strip()))
+
+	print("Slowest imports of `from app import app`:")
+	for cumulative, name in sorted(imports, reverse=True)[:10]:
+		print("  %6.1f ms  %s" % (cumulative / 1000, name))
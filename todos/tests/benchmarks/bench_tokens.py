@@ -0,0 +1,78 @@
+"""Time of validating a token with keys parsed on every call, as
+`jwt.decode` does with PEM keys, with the parsed keys of `app.tokens`
+and with its cache of validated tokens. It is not collected by default,
+run it with `pytest -s tests/benchmarks/bench_tokens.py`."""
+
+import time
+from typing import Any, Callable
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+from app import tokens
+from app.settings import get_settings
+
+
+settings = get_settings()
+
+REPEATS = 2000
+
+
+def _measure(func: Callable[[], Any]) -> float:
+	""":return: Microseconds per call"""
+
+	started_at = time.perf_counter()
+	for _ in range(REPEATS):
+		func()
+	return (time.perf_counter() - started_at) / REPEATS * 1_000_000
+
+
+def test_token_validation(monkeypatch: pytest.MonkeyPatch) -> None:
+	private_keys = {
+		'HS256': None,
+		'RS256': rsa.generate_private_key(65537, 2048),
+		'EdDSA': Ed25519PrivateKey.generate(),
+	}
+
+	print()
+	try:
+		for algorithm, private_key in private_keys.items():
+			monkeypatch.setattr(settings, "JWT_ALGORITHM", algorithm)
+			public_pem: Any = settings.SECRET_KEY
+			if private_key is not None:
+				monkeypatch.setattr(settings, "JWT_PRIVATE_KEY", (
+					private_key.private_bytes(
+						serialization.Encoding.PEM,
+						serialization.PrivateFormat.PKCS8,
+						serialization.NoEncryption(),
+					).decode()
+				))
+				public_pem = private_key.public_key().public_bytes(
+					serialization.Encoding.PEM,
+					serialization.PublicFormat.SubjectPublicKeyInfo,
+				)
+			tokens._get_keys.cache_clear()
+			token = tokens.encode_token(1, 0, True)
+
+			def decode_uncached() -> None:
+				tokens.token_cache.clear()
+				tokens.decode_token(token)
+
+			timings = (
+				_measure(lambda: jwt.decode(
+					token, public_pem, algorithms=[algorithm],
+				)),
+				_measure(decode_uncached),
+				_measure(lambda: tokens.decode_token(token)),
+			)
+			print(
+				"%s: %.1f us with PEM keys, %.1f us with parsed keys, "
+				"%.1f us cached" % (algorithm, *timings),
+			)
+	finally:
+		monkeypatch.undo()
+		tokens._get_keys.cache_clear()
+		tokens.token_cache.clear()
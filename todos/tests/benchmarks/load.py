@@ -0,0 +1,431 @@
+"""Load test of the main endpoints. Seeds confirmed users with todos and
+images, sends every endpoint `--requests` requests from `--concurrency`
+concurrent clients and reports their latency percentiles and requests
+per second as JSON. Endpoints that got slower than `--baseline` by more
+than `--tolerance` are printed and make the exit code 1.
+
+It drives the application in this process against an in-memory SQLite
+database by default:
+
+	python -m tests.benchmarks.load --baseline tests/benchmarks/baseline.json
+
+With `--base-url` it sends the requests over HTTP to a running server
+instead. The data is then seeded to `--db-url` and `IMAGES_DIR` of this
+process, which must be the database and the directory of the server.
+Seeded users cannot be deleted, so use a database for benchmarks only.
+
+Token requests are rate limited far below the rates of benchmarks, so
+the limits are lifted here and must be lifted on benchmarked servers
+with `TOKEN_RATE_LIMIT_PER_IP` and `TOKEN_RATE_LIMIT_PER_PHONE_NUMBER`,
+e.g. "[1000000000, 60]"."""
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from io import BytesIO
+from pathlib import Path
+from datetime import timedelta
+from tempfile import TemporaryDirectory
+from statistics import quantiles
+from typing import Any, Dict, List, Callable, Optional, Sequence, \
+	Awaitable, TypedDict
+
+import httpx
+from PIL import Image
+from fastapi import UploadFile
+from tortoise import Tortoise
+
+from app.helpers import save_image
+from app.settings import get_settings
+from app.todos.models import Todo
+from app.todos.search import create_search_index
+from app.accounts.models import User, _hash_password
+
+
+settings = get_settings()
+
+PASSWORD = "benchmark-password"
+# Rate limit of token requests that benchmarks do not reach
+UNLIMITED = (1_000_000_000, timedelta(minutes=1))
+ENDPOINTS = ("get_todos", "create_todo", "get_image", "generate_token")
+
+_WORDS = (
+	"buy", "call", "fix", "read", "write", "plan", "send", "check", "clean",
+	"book", "pay", "visit", "order", "review", "water", "walk", "cook",
+	"milk", "bread", "report", "invoice", "dentist", "plants", "dog",
+	"garage", "tickets", "mom", "taxes", "car", "email", "slides", "lunch",
+)
+
+
+class SeededUser(TypedDict):
+	phone_number: str
+	headers: Dict[str, str]
+	image_filenames: List[str]
+
+
+class EndpointResult(TypedDict):
+	requests: int
+	errors: int
+	rps: float
+	p50_ms: float
+	p95_ms: float
+	p99_ms: float
+
+
+Request = Callable[
+	[httpx.AsyncClient, random.Random, List[SeededUser]],
+	Awaitable[httpx.Response],
+]
+
+
+def _make_words(rng: random.Random, count: int, /) -> str:
+	return " ".join(rng.choice(_WORDS) for _ in range(count))
+
+
+def _make_image_io(rng: random.Random, /) -> BytesIO:
+	rv = BytesIO()
+	Image.new("RGB", (1024, 768), color=(
+		rng.randrange(256), rng.randrange(256), rng.randrange(256),
+	)).save(rv, "JPEG", quality=90)
+	rv.seek(0)
+	return rv
+
+
+async def seed(
+	rng: random.Random,
+	users_count: int,
+	todos_count: int,
+	images_count: int,
+	/,
+) -> List[SeededUser]:
+	"""Creates confirmed users with `todos_count` todos each, the first
+	`images_count` of which have images.
+
+	Phone numbers are unique to the run, so runs can share a database.
+	"""
+
+	# Hashing is slow on purpose, so all the users share the password hash
+	password_hash = _hash_password(PASSWORD)
+	run_id = random.SystemRandom().randrange(10_000)
+	rv: List[SeededUser] = []
+
+	for i in range(users_count):
+		user = User(
+			phone_number="+1555%04d%06d" % (run_id, i),
+			password=password_hash,
+			phone_number_is_confirmed=True,
+		)
+		await user.save()
+
+		image_filenames = [
+			save_image(UploadFile(
+				"image.jpg", _make_image_io(rng), "image/jpeg",
+			))
+			for _ in range(min(images_count, todos_count))
+		]
+		items = [
+			{
+				'title': _make_words(rng, 3),
+				'text': _make_words(rng, 20),
+				'image_filename':
+					image_filenames[j] if j < len(image_filenames) else None,
+			}
+			for j in range(todos_count)
+		]
+		for start in range(0, len(items), 1000):
+			await Todo.create_batch(user.id, items[start:start + 1000])
+
+		rv.append({
+			'phone_number': user.phone_number,
+			'headers': {'Authorization': "Bearer " + user.generate_token()},
+			'image_filenames': image_filenames,
+		})
+
+	return rv
+
+
+def _url_path_for(name: str, /, **params: Any) -> str:
+	# The application is made on first use, after `main` lifts the limits
+	from app import app
+
+	return app.url_path_for(name, **params)
+
+
+async def _get_todos(
+	client: httpx.AsyncClient, rng: random.Random, users: List[SeededUser],
+) -> httpx.Response:
+	return await client.get(
+		_url_path_for("get_todos"), headers=rng.choice(users)['headers'],
+	)
+
+
+async def _create_todo(
+	client: httpx.AsyncClient, rng: random.Random, users: List[SeededUser],
+) -> httpx.Response:
+	return await client.post(
+		_url_path_for("create_todo"),
+		data={'title': _make_words(rng, 3), 'text': _make_words(rng, 20)},
+		headers=rng.choice(users)['headers'],
+	)
+
+
+async def _get_image(
+	client: httpx.AsyncClient, rng: random.Random, users: List[SeededUser],
+) -> httpx.Response:
+	user = rng.choice([user for user in users if user['image_filenames']])
+	return await client.get(
+		_url_path_for(
+			"get_image", filename=rng.choice(user['image_filenames']),
+		),
+		headers=user['headers'],
+	)
+
+
+async def _generate_token(
+	client: httpx.AsyncClient, rng: random.Random, users: List[SeededUser],
+) -> httpx.Response:
+	return await client.post(_url_path_for("generate_token"), data={
+		'phone_number': rng.choice(users)['phone_number'],
+		'password': PASSWORD,
+	})
+
+
+REQUESTS: Dict[str, Request] = {
+	'get_todos': _get_todos,
+	'create_todo': _create_todo,
+	'get_image': _get_image,
+	'generate_token': _generate_token,
+}
+
+
+def _summarize(
+	latencies: List[float], errors: int, elapsed: float, /,
+) -> EndpointResult:
+	# Cut points between hundredths, so the 50th is the median
+	percentiles = quantiles(latencies, n=100, method="inclusive") \
+		if len(latencies) > 1 else latencies * 99
+	return {
+		'requests': len(latencies),
+		'errors': errors,
+		'rps': round(len(latencies) / elapsed, 1),
+		'p50_ms': round(percentiles[49] * 1000, 2),
+		'p95_ms': round(percentiles[94] * 1000, 2),
+		'p99_ms': round(percentiles[98] * 1000, 2),
+	}
+
+
+async def drive(
+	client: httpx.AsyncClient,
+	request: Request,
+	rng: random.Random,
+	users: List[SeededUser],
+	requests_count: int,
+	concurrency: int,
+	/,
+) -> EndpointResult:
+	"""Sends the requests from `concurrency` clients, each sending its next
+	request as soon as it gets a response."""
+
+	latencies: List[float] = []
+	errors = 0
+	remaining = requests_count
+
+	async def run_client() -> None:
+		nonlocal errors, remaining
+		while remaining > 0:
+			remaining -= 1
+			started_at = time.perf_counter()
+			response = await request(client, rng, users)
+			latencies.append(time.perf_counter() - started_at)
+			if response.is_error:
+				errors += 1
+
+	started_at = time.perf_counter()
+	await asyncio.gather(*(run_client() for _ in range(concurrency)))
+	return _summarize(latencies, errors, time.perf_counter() - started_at)
+
+
+async def run_benchmarks(
+	client: httpx.AsyncClient,
+	users: List[SeededUser],
+	*,
+	endpoints: Sequence[str] = ENDPOINTS,
+	requests_count: int,
+	concurrency: int,
+	random_seed: int = 0,
+) -> Dict[str, EndpointResult]:
+	rng = random.Random(random_seed)
+	rv = {}
+	for endpoint in endpoints:
+		# A few requests first, so that caches are warm
+		await drive(client, REQUESTS[endpoint], rng, users, concurrency, 1)
+		rv[endpoint] = await drive(
+			client, REQUESTS[endpoint], rng, users, requests_count, concurrency,
+		)
+	return rv
+
+
+def compare(
+	results: Dict[str, EndpointResult],
+	baseline: Dict[str, EndpointResult],
+	tolerance: float,
+	/,
+) -> List[str]:
+	""":return: Descriptions of the regressions from the baseline"""
+
+	rv = []
+	for endpoint, result in results.items():
+		base = baseline.get(endpoint)
+		if base is None:
+			continue
+
+		if result['errors'] > base['errors']:
+			rv.append("%s: %d errors instead of %d" % (
+				endpoint, result['errors'], base['errors'],
+			))
+		if result['rps'] < base['rps'] * (1 - tolerance):
+			rv.append("%s: %.1f rps instead of %.1f" % (
+				endpoint, result['rps'], base['rps'],
+			))
+		for key in ("p50_ms", "p95_ms", "p99_ms"):
+			if result[key] > base[key] * (1 + tolerance):  # type: ignore
+				rv.append("%s: %s %.2f instead of %.2f" % (
+					endpoint, key, result[key], base[key],  # type: ignore
+				))
+	return rv
+
+
+def _make_parser() -> argparse.ArgumentParser:
+	parser = argparse.ArgumentParser(
+		prog="python -m tests.benchmarks.load",
+		description="Measures the latency and the throughput of the API.",
+	)
+	parser.add_argument(
+		"--base-url",
+		help="URL of a running server, the application in this process "
+		"by default",
+	)
+	parser.add_argument(
+		"--db-url", default="sqlite://:memory:",
+		help="Database to seed, it must be the one of the server",
+	)
+	parser.add_argument("--users", type=int, default=20)
+	parser.add_argument(
+		"--todos", type=int, default=100, help="Todos of every user",
+	)
+	parser.add_argument(
+		"--images", type=int, default=2, help="Images of every user",
+	)
+	parser.add_argument(
+		"--endpoint", dest="endpoints", action="append", choices=ENDPOINTS,
+		help="Endpoint to measure, all of them by default",
+	)
+	parser.add_argument(
+		"--requests", type=int, default=200, help="Requests per endpoint",
+	)
+	parser.add_argument("--concurrency", type=int, default=10)
+	parser.add_argument("--seed", type=int, default=0, help="Random seed")
+	parser.add_argument(
+		"--output", type=Path, help="File to write the results to",
+	)
+	parser.add_argument("--baseline", type=Path)
+	parser.add_argument(
+		"--tolerance", type=float, default=0.25,
+		help="Allowed relative regression from the baseline",
+	)
+	parser.add_argument(
+		"--update-baseline", action="store_true",
+		help="Write the results to --baseline instead of comparing them",
+	)
+	return parser
+
+
+async def _main(args: argparse.Namespace) -> Dict[str, Any]:
+	await Tortoise.init(config={
+		**settings.TORTOISE_ORM,
+		'connections': {'default': args.db_url},
+	})
+	try:
+		if args.db_url.startswith("sqlite://"):
+			await Tortoise.generate_schemas(safe=True)
+			await create_search_index()
+		users = await seed(
+			random.Random(args.seed), args.users, args.todos, args.images,
+		)
+
+		if args.base_url is not None:
+			client = httpx.AsyncClient(
+				base_url=args.base_url,
+				limits=httpx.Limits(max_connections=args.concurrency),
+				timeout=60,
+			)
+		else:
+			from app import app
+
+			client = httpx.AsyncClient(app=app, base_url="http://benchmark")
+
+		async with client:
+			endpoints = await run_benchmarks(
+				client,
+				users,
+				endpoints=args.endpoints or ENDPOINTS,
+				requests_count=args.requests,
+				concurrency=args.concurrency,
+				random_seed=args.seed,
+			)
+	finally:
+		await Tortoise.close_connections()
+
+	return {
+		'target': args.base_url or "asgi",
+		'database': args.db_url.split("://")[0],
+		'python': "%d.%d" % sys.version_info[:2],
+		'users': args.users,
+		'todos': args.todos,
+		'images': args.images,
+		'concurrency': args.concurrency,
+		'endpoints': endpoints,
+	}
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+	args = _make_parser().parse_args(argv)
+	# Before the application is made, as its routes read them
+	settings.TOKEN_RATE_LIMIT_PER_IP = UNLIMITED
+	settings.TOKEN_RATE_LIMIT_PER_PHONE_NUMBER = UNLIMITED
+
+	if args.base_url is not None:
+		settings.IMAGES_DIR.mkdir(parents=True, exist_ok=True)
+		report = asyncio.run(_main(args))
+	else:
+		with TemporaryDirectory() as directory:
+			settings.IMAGES_DIR = Path(directory)
+			report = asyncio.run(_main(args))
+
+	text = json.dumps(report, indent=2) + "\n"
+	if args.output is not None:
+		args.output.write_text(text)
+	print(text, end="")
+
+	if args.baseline is None:
+		return
+	if args.update_baseline:
+		args.baseline.write_text(text)
+		return
+
+	regressions = compare(
+		report['endpoints'],
+		json.loads(args.baseline.read_text())['endpoints'],
+		args.tolerance,
+	)
+	for regression in regressions:
+		print(regression, file=sys.stderr)
+	if regressions:
+		sys.exit(1)
+
+
+if __name__ == "__main__":
+	main()
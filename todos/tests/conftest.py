@@ -1,4 +1,5 @@
 import shutil
+import asyncio
 from io import BytesIO
 from typing import Iterator
 
@@ -10,8 +11,10 @@ from tortoise.contrib.test import initializer, finalizer
 
 from app import app
 from app.settings import get_settings
-from app.todos.models import Todo
-from app.accounts.models import User
+from app.todos.models import Todo, image_owner_cache
+from app.todos.search import create_search_index
+from app.tokens import token_cache
+from app.accounts.models import User, user_cache
 from .utils import create_test_user
 
 
@@ -24,9 +27,16 @@ def client() -> Iterator[AsyncClient]:
 		settings.IMAGES_DIR.mkdir(parents=True)
 
 	initializer(settings.TORTOISE_ORM['apps']['models']['models'])
+	# As at startup, which the client does not run
+	asyncio.get_event_loop().run_until_complete(create_search_index())
 	yield AsyncClient(app=app, base_url="http://test")
 	finalizer()
 
+	# Ids are reused by the next test database
+	token_cache.clear()
+	user_cache.clear()
+	image_owner_cache.clear()
+
 	shutil.rmtree(settings.MEDIA_DIR)
 
 
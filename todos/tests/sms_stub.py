@@ -0,0 +1,41 @@
+"""Stand-in for the Twilio messages API. It accepts every message after
+`SMS_STUB_LATENCY` seconds and remembers it. Run it with
+`SMS_STUB_LATENCY=0.2 uvicorn tests.sms_stub:app --port 8001` and set
+`SMS_API_URL=http://localhost:8001` to try the SMS worker locally."""
+
+import os
+import asyncio
+import secrets
+from typing import Dict, List
+
+from fastapi import FastAPI, Form, status
+
+
+app = FastAPI()
+app.state.latency = float(os.environ.get("SMS_STUB_LATENCY", 0))
+app.state.messages = []
+
+
+@app.post(
+	"/2010-04-01/Accounts/{account_sid}/Messages.json",
+	status_code=status.HTTP_201_CREATED,
+)
+async def create_message(
+	account_sid: str,
+	to: str = Form(..., alias="To"),
+	from_: str = Form(..., alias="From"),
+	body: str = Form(..., alias="Body"),
+) -> Dict[str, str]:
+	await asyncio.sleep(app.state.latency)
+
+	message = {
+		'sid': "SM" + secrets.token_hex(16),
+		'account_sid': account_sid,
+		'to': to,
+		'from': from_,
+		'body': body,
+		'status': "queued",
+	}
+	messages: List[Dict[str, str]] = app.state.messages
+	messages.append(message)
+	return message
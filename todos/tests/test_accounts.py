@@ -1,10 +1,26 @@
+from typing import Callable
+from datetime import timedelta
+
 import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
 from fastapi import status
 from httpx import AsyncClient
+from tortoise import Tortoise
 
 from app import app
-from app.accounts.models import User
-from .utils import make_auth_header
+from app import tokens
+from app.settings import get_settings
+from app.sms.models import SmsMessage
+from app.todos.models import Todo
+from app.accounts.models import User, USER_CHANGES_CHANNEL, user_cache, \
+	listen_for_user_changes
+from app.ratelimit.backends import MemoryRateLimitBackend
+from app.accounts.confirmation import CodeCheck, MemoryConfirmationCodeStore
+from .utils import make_auth_header, create_test_user
+
+
+settings = get_settings()
 
 
 @pytest.mark.asyncio
@@ -52,6 +68,22 @@ async def test_generate_token_and_get_profile(
 	assert response.json()['phone_number'] == test_user.phone_number
 
 
+@pytest.mark.asyncio
+async def test_get_profile_with_todos(
+	client: AsyncClient, test_todo: Todo,
+) -> None:
+	url = app.url_path_for("get_profile")
+
+	async with client:
+		response = await client.get(
+			url, headers=make_auth_header(await test_todo.owner),
+		)
+
+	assert response.status_code == status.HTTP_200_OK
+	assert [todo['title'] for todo in response.json()['todos']] \
+		== [test_todo.title]
+
+
 @pytest.mark.asyncio
 async def test_change_password(client: AsyncClient, test_user) -> None:
 	url = app.url_path_for("change_password")
@@ -91,14 +123,245 @@ async def test_update_profile(
 @pytest.mark.asyncio
 async def test_deactivate_user(client: AsyncClient, test_user) -> None:
 	url = app.url_path_for("deactivate_user")
+	profile_url = app.url_path_for("get_profile")
+	headers = make_auth_header(test_user)
 
 	async with client:
+		await client.get(profile_url, headers=headers)
+		hits = user_cache.hits
 		response = await client.post(
 			url,
-			headers=make_auth_header(test_user),
+			headers=headers,
 			json={'password': "test-password"},
 		)
+		profile_response = await client.get(profile_url, headers=headers)
 
 	assert response.status_code == status.HTTP_200_OK
 	assert "message" in response.json()
 	assert not (await User.get(id=test_user.id)).is_active
+
+	# The cached user was used for deactivation and then invalidated
+	assert user_cache.hits == hits + 1
+	assert profile_response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_user_saved_by_another_process(
+	client: AsyncClient, test_user: User, monkeypatch: pytest.MonkeyPatch,
+) -> None:
+	listeners = []
+
+	class _Connection:
+		async def listen(self, channel: str, callback: Callable, /) -> None:
+			listeners.append((channel, callback))
+
+	monkeypatch.setattr(Tortoise, "get_connection", lambda _: _Connection())
+	await listen_for_user_changes()
+	[(channel, callback)] = listeners
+	assert channel == USER_CHANGES_CHANNEL
+
+	another_user = await create_test_user("+23334445566")
+	await User.get_active(test_user.id)
+	await User.get_active(another_user.id)
+
+	# Notified by Postgres of a user saved by another process
+	callback(str(test_user.id))
+	assert user_cache.get(test_user.id) is None
+	assert user_cache.get(another_user.id) is not None
+
+	# The listening connection was reopened
+	callback(None)
+	assert len(user_cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_confirm_phone_number(client: AsyncClient, test_user) -> None:
+	ask_url = app.url_path_for("ask_confirm_phone_number")
+	url = app.url_path_for("confirm_phone_number")
+	headers = make_auth_header(test_user)
+
+	async with client:
+		ask_response = await client.post(ask_url, headers=headers)
+		message = await SmsMessage.get(to=test_user.phone_number)
+		code = message.body.rsplit(" ", 1)[1]
+
+		invalid_response = await client.post(
+			url, headers=headers, json={'code': "000000"},
+		)
+		response = await client.post(url, headers=headers, json={'code': code})
+
+	# The code is kept on the server, not in a session cookie
+	assert "set-cookie" not in ask_response.headers
+	assert invalid_response.status_code == status.HTTP_400_BAD_REQUEST
+	assert response.status_code == status.HTTP_200_OK
+	assert (await User.get(id=test_user.id)).phone_number_is_confirmed
+
+
+@pytest.mark.asyncio
+async def test_confirmation_code_attempts() -> None:
+	store = MemoryConfirmationCodeStore()
+	code = await store.issue(1)
+
+	for _ in range(settings.CONFIRMATION_CODE_MAX_ATTEMPTS - 1):
+		assert await store.check(1, "000000") == CodeCheck.INVALID
+	assert await store.check(1, "000000") == CodeCheck.EXHAUSTED
+
+	# The code is discarded after the last attempt
+	assert await store.check(1, code) == CodeCheck.MISSING
+	assert await store.check(1, await store.issue(1)) == CodeCheck.VALID
+	assert await store.check(1, code) == CodeCheck.MISSING
+
+
+@pytest.mark.asyncio
+async def test_generate_token_rate_limit(client: AsyncClient) -> None:
+	url = app.url_path_for("generate_token")
+	data = {'phone_number': "+12223334455", 'password': "test-password"}
+	requests, _ = settings.TOKEN_RATE_LIMIT_PER_PHONE_NUMBER
+
+	async with client:
+		for _ in range(requests):
+			response = await client.post(url, data=data)
+			assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+		response = await client.post(url, data=data)
+		other_response = await client.post(
+			url, data={**data, 'phone_number': "+23334445566"},
+		)
+
+	assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+	assert int(response.headers['retry-after']) > 0
+	assert other_response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_memory_rate_limit_backend(
+	monkeypatch: pytest.MonkeyPatch,
+) -> None:
+	now = 1000.0
+	monkeypatch.setattr("time.monotonic", lambda: now)
+	backend = MemoryRateLimitBackend()
+	backend.max_size = 2
+	period = timedelta(seconds=60)
+
+	for _ in range(3):
+		assert await backend.hit("a", 3, period) is None
+	assert await backend.hit("a", 3, period) == 20
+
+	# A request is allowed again after a third of the period
+	now += 20
+	assert await backend.hit("a", 3, period) is None
+	assert await backend.hit("a", 3, period) == 20
+
+	# The least recently used key is evicted
+	await backend.hit("b", 3, period)
+	await backend.hit("c", 3, period)
+	assert await backend.hit("a", 3, period) is None
+
+
+@pytest.mark.asyncio
+async def test_tokens_are_revoked(
+	client: AsyncClient, test_confirmed_user: User,
+) -> None:
+	profile_url = app.url_path_for("get_profile")
+	headers = make_auth_header(test_confirmed_user)
+	claims = tokens.decode_token(headers['Authorization'].split()[1])
+	assert claims['ver'] == 0
+	assert claims['confirmed']
+
+	async with client:
+		response = await client.post(
+			app.url_path_for("change_password"),
+			headers=headers,
+			json={
+				'new_password': "new-password",
+				'new_password_confirm': "new-password",
+			},
+		)
+		assert response.status_code == status.HTTP_200_OK
+
+		response = await client.get(profile_url, headers=headers)
+		assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+		user = await User.get(id=test_confirmed_user.id)
+		response = await client.get(
+			profile_url, headers=make_auth_header(user),
+		)
+		assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.asyncio
+async def test_tokens_with_trusted_claims(
+	client: AsyncClient,
+	test_confirmed_user: User,
+	monkeypatch: pytest.MonkeyPatch,
+) -> None:
+	monkeypatch.setattr(settings, "TOKEN_TRUST_CLAIMS", True)
+	url = app.url_path_for("get_todos")
+	headers = make_auth_header(test_confirmed_user)
+	not_confirmed_headers = make_auth_header(
+		await create_test_user("+23334445566"),
+	)
+
+	async def get_active(*args) -> User:
+		raise AssertionError("The user was fetched.")
+
+	async with client:
+		not_confirmed_response = await client.get(
+			url, headers=not_confirmed_headers,
+		)
+		monkeypatch.setattr(User, "get_active", get_active)
+		response = await client.get(url, headers=headers)
+
+	assert not_confirmed_response.status_code == status.HTTP_403_FORBIDDEN
+	assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.asyncio
+async def test_tokens_with_asymmetric_keys(
+	client: AsyncClient,
+	test_confirmed_user: User,
+	monkeypatch: pytest.MonkeyPatch,
+) -> None:
+	private_key = Ed25519PrivateKey.generate()
+	private_pem = private_key.private_bytes(
+		serialization.Encoding.PEM,
+		serialization.PrivateFormat.PKCS8,
+		serialization.NoEncryption(),
+	).decode()
+	public_pem = private_key.public_key().public_bytes(
+		serialization.Encoding.PEM,
+		serialization.PublicFormat.SubjectPublicKeyInfo,
+	).decode()
+
+	monkeypatch.setattr(settings, "JWT_ALGORITHM", "EdDSA")
+	monkeypatch.setattr(settings, "JWT_PRIVATE_KEY", private_pem)
+	# Keys are cached, and the other tests must not get these ones
+	tokens._get_keys.cache_clear()
+	try:
+		token = test_confirmed_user.generate_token()
+		async with client:
+			profile_response = await client.get(
+				app.url_path_for("get_profile"),
+				headers={'Authorization': "Bearer " + token},
+			)
+			keys_response = await client.get(
+				app.url_path_for("get_token_keys"),
+			)
+
+		assert profile_response.status_code == status.HTTP_200_OK
+		[key] = keys_response.json()['keys']
+		assert key['kty'] == "OKP"
+		assert key['alg'] == "EdDSA"
+
+		# Nodes with the public key only validate tokens
+		monkeypatch.setattr(settings, "JWT_PRIVATE_KEY", None)
+		monkeypatch.setattr(settings, "JWT_PUBLIC_KEY", public_pem)
+		tokens._get_keys.cache_clear()
+		tokens.token_cache.clear()
+
+		assert tokens.decode_token(token)['id'] == test_confirmed_user.id
+		with pytest.raises(RuntimeError):
+			test_confirmed_user.generate_token()
+	finally:
+		monkeypatch.undo()
+		tokens._get_keys.cache_clear()
@@ -0,0 +1,160 @@
+import asyncio
+from typing import Any, List, Callable, Optional
+
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+from tortoise import Tortoise
+
+from app import app
+from app import database
+from app.database import StatsAsyncpgDBClient
+from app.settings import get_settings
+
+
+settings = get_settings()
+
+
+class _FakePool:
+	"""Pool of asyncpg connections, which are plain objects here."""
+
+	def __init__(self, size: int, /) -> None:
+		self.size = size
+		self._idle: List[object] = [object() for _ in range(size)]
+		self._released = asyncio.Condition()
+
+	def get_size(self) -> int:
+		return self.size
+
+	def get_idle_size(self) -> int:
+		return len(self._idle)
+
+	async def acquire(self) -> Any:
+		async with self._released:
+			await self._released.wait_for(lambda: bool(self._idle))
+			return self._idle.pop()
+
+	async def release(self, connection: Any) -> None:
+		async with self._released:
+			self._idle.append(connection)
+			self._released.notify()
+
+	async def close(self) -> None:
+		pass
+
+
+class _FakeConnection:
+	"""asyncpg connection, which only keeps its listeners."""
+
+	def __init__(self) -> None:
+		self.listeners: List[str] = []
+		self.on_terminated: Optional[Callable[[Any], None]] = None
+
+	def add_termination_listener(
+		self, callback: Callable[[Any], None], /,
+	) -> None:
+		self.on_terminated = callback
+
+	async def add_listener(self, channel: str, callback: Any, /) -> None:
+		self.listeners.append(channel)
+
+	def terminate(self) -> None:
+		if self.on_terminated is not None:
+			self.on_terminated(self)
+
+	async def close(self) -> None:
+		self.terminate()
+
+
+def _make_client(pool_size: int, /) -> StatsAsyncpgDBClient:
+	rv = StatsAsyncpgDBClient(
+		user="user",
+		password="password",
+		database="database",
+		host="localhost",
+		port=5432,
+		connection_name="default",
+		maxsize=pool_size,
+	)
+	rv._pool = _FakePool(pool_size)
+	return rv
+
+
+@pytest.mark.asyncio
+async def test_pool_stats() -> None:
+	client = _make_client(1)
+	assert client.pool_stats() == {
+		'size': 1,
+		'idle': 1,
+		'in_use': 0,
+		'max_size': 1,
+		'waiting': 0,
+		'acquires': 0,
+		'total_acquire_time': 0.0,
+		'max_acquire_time': 0.0,
+	}
+
+	async with client.acquire_connection():
+		stats = client.pool_stats()
+		assert (stats['in_use'], stats['idle']) == (1, 0)
+
+		# Waits for the connection in use
+		waiting = asyncio.ensure_future(
+			client.acquire_connection().__aenter__(),
+		)
+		await asyncio.sleep(0.01)
+		assert client.pool_stats()['waiting'] == 1
+
+	await waiting
+	stats = client.pool_stats()
+	assert stats['waiting'] == 0
+	assert stats['acquires'] == 2
+	assert stats['max_acquire_time'] >= 0.01
+	assert stats['total_acquire_time'] >= stats['max_acquire_time']
+
+
+@pytest.mark.asyncio
+async def test_get_database_health(
+	client: AsyncClient, monkeypatch: pytest.MonkeyPatch,
+) -> None:
+	monkeypatch.setattr(
+		Tortoise, "get_connection", lambda _: _make_client(4),
+	)
+	url = app.url_path_for("get_database_health")
+	headers = {'Authorization': "Bearer %s" % settings.HEALTH_TOKEN}
+
+	async with client:
+		response = await client.get(url, headers=headers)
+
+	assert response.status_code == status.HTTP_200_OK
+	assert {stats['max_size'] for stats in response.json().values()} == {4}
+
+
+@pytest.mark.asyncio
+async def test_listeners_reconnect(monkeypatch: pytest.MonkeyPatch) -> None:
+	connections: List[_FakeConnection] = []
+	failures: List[Exception] = []
+
+	async def connect(**kwargs: Any) -> _FakeConnection:
+		if failures:
+			raise failures.pop()
+		connections.append(_FakeConnection())
+		return connections[-1]
+
+	monkeypatch.setattr(database.asyncpg, "connect", connect)
+	monkeypatch.setattr(database, "_LISTENER_RECONNECT_DELAY", 0.0)
+	client = _make_client(1)
+	payloads: List[Optional[str]] = []
+	await client.listen("channel", payloads.append)
+	assert connections[-1].listeners == ["channel"]
+
+	# The first attempt to reconnect times out
+	failures.append(asyncio.TimeoutError())
+	connections[-1].terminate()
+	for _ in range(10):
+		await asyncio.sleep(0)
+
+	assert len(connections) == 2
+	assert connections[-1].listeners == ["channel"]
+	assert payloads == [None]
+	await client._close()
@@ -0,0 +1,107 @@
+import random
+import asyncio
+import threading
+
+import pytest
+from bcrypt import checkpw
+from fastapi import status
+from httpx import AsyncClient
+
+from app import app
+from app.todos.models import Todo
+from app.accounts import models as accounts_models
+from app.accounts.models import User, password_hashing_pool
+from .utils import make_auth_header
+from .benchmarks.load import ENDPOINTS, seed, compare, run_benchmarks
+
+
+@pytest.mark.asyncio
+async def test_todos_reads_during_login_storm(
+	client: AsyncClient,
+	test_confirmed_user: User,
+	monkeypatch: pytest.MonkeyPatch,
+) -> None:
+	"""Todo reads must not wait for password hashing of other requests,
+	which takes far longer than reads."""
+
+	todos_url = app.url_path_for("get_todos")
+	token_url = app.url_path_for("generate_token")
+	headers = make_auth_header(test_confirmed_user)
+
+	# Hashing lasts until the reads are done
+	reads_done = threading.Event()
+
+	def check_password(password: str, hashed_password: str, /) -> bool:
+		reads_done.wait(10)
+		return checkpw(password.encode(), hashed_password.encode())
+
+	monkeypatch.setattr(
+		accounts_models, "_check_password", check_password,
+	)
+
+	async def login() -> int:
+		response = await client.post(token_url, data={
+			'phone_number': test_confirmed_user.phone_number,
+			'password': "test-password",
+		})
+		return response.status_code
+
+	async def read_todos() -> None:
+		for _ in range(10):
+			response = await client.get(todos_url, headers=headers)
+			assert response.status_code == status.HTTP_200_OK
+
+	async with client:
+		logins = [asyncio.ensure_future(login()) for _ in range(8)]
+		while not password_hashing_pool.running:
+			await asyncio.sleep(0.01)
+
+		try:
+			await asyncio.wait_for(read_todos(), 5)
+			assert password_hashing_pool.running > 0
+			assert not any(task.done() for task in logins)
+		finally:
+			reads_done.set()
+		results = await asyncio.gather(*logins)
+
+	assert all(code == status.HTTP_200_OK for code in results)
+
+
+@pytest.mark.asyncio
+async def test_load_benchmarks(client: AsyncClient) -> None:
+	users = await seed(random.Random(0), 2, 3, 1)
+	assert len(users) == 2
+	assert await Todo.filter(image_filename__not_isnull=True).count() == 2
+
+	async with client:
+		results = await run_benchmarks(
+			client, users, requests_count=4, concurrency=2,
+		)
+
+	assert list(results) == list(ENDPOINTS)
+	for result in results.values():
+		assert result['requests'] == 4
+		assert result['errors'] == 0
+		assert 0 < result['p50_ms'] <= result['p95_ms'] <= result['p99_ms']
+
+	assert compare(results, results, 0) == []
+
+
+def test_load_benchmarks_compare() -> None:
+	baseline = {'get_todos': {
+		'requests': 100, 'errors': 0, 'rps': 100.0,
+		'p50_ms': 10.0, 'p95_ms': 20.0, 'p99_ms': 30.0,
+	}}
+
+	assert compare({'get_todos': {
+		'requests': 100, 'errors': 0, 'rps': 90.0,
+		'p50_ms': 11.0, 'p95_ms': 22.0, 'p99_ms': 33.0,
+	}}, baseline, 0.25) == []  # type: ignore
+	assert compare({'get_todos': {
+		'requests': 100, 'errors': 1, 'rps': 50.0,
+		'p50_ms': 10.0, 'p95_ms': 40.0, 'p99_ms': 30.0,
+	}}, baseline, 0.25) == [  # type: ignore
+		"get_todos: 1 errors instead of 0",
+		"get_todos: 50.0 rps instead of 100.0",
+		"get_todos: p95_ms 40.00 instead of 20.00",
+	]
@@ -6,8 +6,10 @@ from fastapi import status
 from httpx import AsyncClient
 
 from app import app
+from app.helpers import choose_image_format
 from app.settings import get_settings
 from app.todos.models import Todo
+from app.accounts.models import User
 from .utils import make_auth_header
 
 
@@ -30,3 +32,137 @@ async def test_get_image(client: AsyncClient, test_todo: Todo) -> None:
 	with Image.open(response_image) as image:
 		with Image.open(path) as original_image:
 			assert image == original_image
+
+
+@pytest.mark.asyncio
+async def test_get_image_variant(client: AsyncClient, test_todo: Todo) -> None:
+	url = app.url_path_for("get_image", filename=test_todo.image_filename)
+	headers = make_auth_header(await test_todo.owner)
+	headers['Accept'] = "image/webp,image/*"
+
+	async with client:
+		response = await client.get(url + "?w=100", headers=headers)
+
+	assert response.status_code == status.HTTP_200_OK
+	assert response.headers['content-type'] == "image/webp"
+
+	with Image.open(BytesIO(response.content)) as image:
+		assert image.format == "WEBP"
+		assert image.width == 128
+
+
+@pytest.mark.parametrize("accept, format", [
+	("image/webp,image/*,*/*;q=0.8", "WEBP"),
+	("Image/WebP ; q=0.5", "WEBP"),
+	("image/webp;q=0,image/*", "JPEG"),
+	("image/webp;q=0.0", "JPEG"),
+	("image/*,*/*", "JPEG"),
+	("", "JPEG"),
+])
+def test_choose_image_format(accept: str, format: str) -> None:
+	assert choose_image_format(accept) == format
+
+
+@pytest.mark.asyncio
+async def test_get_image_with_accel_redirect(
+	client: AsyncClient, test_todo: Todo, monkeypatch: pytest.MonkeyPatch,
+) -> None:
+	monkeypatch.setattr(
+		settings, "IMAGES_ACCEL_REDIRECT_PREFIX", "/protected/images/",
+	)
+	url = app.url_path_for("get_image", filename=test_todo.image_filename)
+
+	async with client:
+		response = await client.get(url, headers=make_auth_header(
+			await test_todo.owner,
+		))
+
+	assert response.status_code == status.HTTP_200_OK
+	assert response.headers['x-accel-redirect'] \
+		== "/protected/images/" + test_todo.image_filename
+	assert response.content == b""
+
+
+@pytest.mark.asyncio
+async def test_get_image_not_modified(
+	client: AsyncClient, test_todo: Todo,
+) -> None:
+	url = app.url_path_for("get_image", filename=test_todo.image_filename)
+	headers = make_auth_header(await test_todo.owner)
+
+	async with client:
+		response = await client.get(url, headers=headers)
+		not_modified_response = await client.get(url, headers={
+			**headers, 'If-None-Match': response.headers['etag'],
+		})
+
+	assert "immutable" in response.headers['cache-control']
+	assert not_modified_response.status_code == status.HTTP_304_NOT_MODIFIED
+	assert not_modified_response.content == b""
+
+
+@pytest.mark.asyncio
+async def test_get_image_of_another_user(
+	client: AsyncClient, test_todo: Todo,
+) -> None:
+	another_user = User(
+		phone_number="+13334445566",
+		phone_number_is_confirmed=True,
+	)
+	another_user.set_password("test-password")
+	await another_user.save()
+
+	url = app.url_path_for("get_image", filename=test_todo.image_filename)
+
+	async with client:
+		response = await client.get(
+			url, headers=make_auth_header(another_user),
+		)
+
+	assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_get_database_health(client: AsyncClient) -> None:
+	url = app.url_path_for("get_database_health")
+
+	async with client:
+		response = await client.get(url, headers={
+			'Authorization': "Bearer %s" % settings.HEALTH_TOKEN,
+		})
+		not_found_response = await client.get(url, headers={
+			'Authorization': "Bearer wrong-token",
+		})
+
+	assert not_found_response.status_code == status.HTTP_404_NOT_FOUND
+	# SQLite connections do not collect pool statistics
+	assert response.status_code == status.HTTP_200_OK
+	assert response.json() == {}
+
+
+@pytest.mark.asyncio
+async def test_get_metrics(client: AsyncClient, test_todo: Todo) -> None:
+	url = app.url_path_for("get_metrics")
+
+	async with client:
+		await client.get(
+			app.url_path_for("get_todos"),
+			headers=make_auth_header(await test_todo.owner),
+		)
+		await client.request("BREW", url)
+		response = await client.get(url)
+
+	assert response.status_code == status.HTTP_200_OK
+	assert 'http_request_duration_seconds_count{method="GET",' \
+		'route="get_todos",status="200"}' in response.text
+	assert 'method="other"' in response.text
+	assert 'method="BREW"' not in response.text
+	assert 'db_query_duration_seconds_count{connection="models",' \
+		'operation="select",table="todo"}' in response.text
+	assert 'cache_requests_total{cache="tokens",result="miss"}' \
+		in response.text
+	assert 'cache_size{cache="users"}' in response.text
+	assert 'worker_pool_wait_seconds_total{pool="image_processing"}' \
+		in response.text
+	assert 'worker_pool_max_queued{pool="password_hashing"}' \
+		in response.text
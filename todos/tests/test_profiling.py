@@ -0,0 +1,120 @@
+import json
+import time
+import asyncio
+from pathlib import Path
+
+import pytest
+from httpx import AsyncClient
+from starlette.types import Send, Scope, Receive
+
+from app.profiling import ProfilingMiddleware, main, read_profiles
+
+
+def _busy_wait(seconds: float) -> None:
+	ends_at = time.perf_counter() + seconds
+	while time.perf_counter() < ends_at:
+		pass
+
+
+async def slow_view(scope: Scope, receive: Receive, send: Send) -> None:
+	_busy_wait(0.05)
+	await asyncio.sleep(0.05)
+	await send({
+		'type': "http.response.start", 'status': 200, 'headers': [],
+	})
+	await send({'type': "http.response.body", 'body': b""})
+
+
+async def app(scope: Scope, receive: Receive, send: Send) -> None:
+	scope['endpoint'] = slow_view
+	await slow_view(scope, receive, send)
+
+
+@pytest.mark.asyncio
+async def test_profiling_middleware(tmp_path: Path) -> None:
+	async with AsyncClient(
+		app=ProfilingMiddleware(
+			app,
+			directory=tmp_path,
+			sample_rate=0,
+			header="X-Profile",
+			token="secret",
+			interval=0.001,
+		),
+		base_url="http://test",
+	) as client:
+		await client.get("/")
+		await client.get("/", headers={'X-Profile': "wrong"})
+		await client.get("/", headers={'X-Profile': "secret"})
+
+	profiles = read_profiles(tmp_path)
+	assert list(profiles) == ["slow_view"]
+
+	profiles_count, stacks = profiles['slow_view']
+	assert profiles_count == 1
+	running = sum(
+		count for stack, count in stacks.items()
+		if stack[-1].startswith("_busy_wait ")
+	)
+	awaiting = sum(
+		count for stack, count in stacks.items()
+		if stack[-1] == "[await]"
+		and any(frame.startswith("slow_view ") for frame in stack)
+	)
+	# Code that holds the GIL is sampled every `sys.getswitchinterval()`
+	assert running > 0
+	assert awaiting > running
+
+
+def test_profiling_middleware_in_new_loop(tmp_path: Path) -> None:
+	middleware = ProfilingMiddleware(
+		app,
+		directory=tmp_path,
+		sample_rate=1,
+		header="X-Profile",
+		token=None,
+		interval=0.001,
+	)
+
+	async def request() -> None:
+		client = AsyncClient(app=middleware, base_url="http://test")
+		async with client:
+			await client.get("/")
+
+	asyncio.run(request())
+	first_sampler = middleware._sampler
+	asyncio.run(request())
+
+	assert first_sampler is not None
+	assert middleware._sampler is not first_sampler
+	first_sampler.join(1)
+	assert not first_sampler.is_alive()
+	assert read_profiles(tmp_path)['slow_view'][0] == 2
+
+
+def test_profiling_cli(
+	tmp_path: Path, capsys: pytest.CaptureFixture[str],
+) -> None:
+	for name, text in (
+		("1-a.collapsed", "main (a.py:1);view (a.py:5) 3\nmain (a.py:1) 1\n"),
+		("2-b.collapsed", "main (a.py:1);view (a.py:5) 2\n"),
+	):
+		tmp_path.joinpath("profiles", "get_todos").mkdir(
+			parents=True, exist_ok=True,
+		)
+		tmp_path.joinpath("profiles", "get_todos", name).write_text(text)
+
+	main([str(tmp_path.joinpath("profiles")), "-o", str(tmp_path)])
+
+	output = capsys.readouterr().out
+	assert output.startswith("get_todos: 2 profiles, 6 samples\n")
+	assert " 83.3%  view (a.py:5)" in output
+
+	speedscope = json.loads(
+		tmp_path.joinpath("get_todos.speedscope.json").read_text(),
+	)
+	assert speedscope['shared']['frames'] == [
+		{'name': "main (a.py:1)"}, {'name': "view (a.py:5)"},
+	]
+	assert speedscope['profiles'][0]['samples'] == [[0, 1], [0]]
+	assert speedscope['profiles'][0]['weights'] == [5, 1]
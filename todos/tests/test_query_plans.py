@@ -0,0 +1,96 @@
+"""Checks that the main queries are answered by indexes. Plans are
+captured with `EXPLAIN QUERY PLAN` on SQLite and with `EXPLAIN` on Postgres,
+where sequential scans are disabled so that the planner shows whether
+there is a usable index at all."""
+
+from datetime import datetime
+from typing import List
+
+import pytest
+from httpx import AsyncClient
+from tortoise.queryset import AwaitableQuery
+from tortoise.query_utils import Q
+from tortoise.transactions import in_transaction
+
+from app.todos.models import Todo
+from app.accounts.models import User
+
+
+async def _explain(query: AwaitableQuery) -> List[str]:
+	sql = query.sql()
+	connection = Todo._meta.db
+
+	if connection.capabilities.dialect == "sqlite":
+		rows = await connection.execute_query_dict(
+			"EXPLAIN QUERY PLAN " + sql,
+		)
+		return [row['detail'] for row in rows]
+
+	async with in_transaction(connection.connection_name) as transaction:
+		await transaction.execute_script("SET LOCAL enable_seqscan = off")
+		rows = await transaction.execute_query_dict("EXPLAIN " + sql)
+	return [row['QUERY PLAN'] for row in rows]
+
+
+async def _assert_uses_indexes(query: AwaitableQuery) -> None:
+	plan = await _explain(query)
+	for line in plan:
+		# SQLite
+		assert not line.startswith("SCAN"), plan
+		assert "TEMP B-TREE" not in line, plan
+		# Postgres
+		assert "Seq Scan" not in line, plan
+		assert not line.lstrip(" ->").startswith("Sort"), plan
+
+
+@pytest.mark.asyncio
+async def test_get_todos_query_plans(
+	client: AsyncClient,
+	test_confirmed_user: User,
+) -> None:
+	queryset = test_confirmed_user.todos.all()  # type: ignore
+	await _assert_uses_indexes(queryset.limit(4).offset(4))
+	await _assert_uses_indexes(queryset.count())
+
+	# Cursor mode
+	created_at = datetime.utcnow()
+	await _assert_uses_indexes(
+		queryset.filter(
+			Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=1),
+		).order_by("-created_at", "-id").limit(5),
+	)
+
+
+@pytest.mark.asyncio
+async def test_get_todo_query_plan(
+	client: AsyncClient,
+	test_confirmed_user: User,
+) -> None:
+	await _assert_uses_indexes(
+		test_confirmed_user.todos.all().filter(id=1).limit(2),  # type: ignore
+	)
+
+
+@pytest.mark.asyncio
+async def test_get_image_query_plan(
+	client: AsyncClient,
+	test_confirmed_user: User,
+) -> None:
+	await _assert_uses_indexes(
+		Todo.filter(
+			image_filename="test.jpg", owner_id=test_confirmed_user.id,
+		).exists(),
+	)
+
+
+@pytest.mark.asyncio
+async def test_user_query_plans(
+	client: AsyncClient,
+	test_confirmed_user: User,
+) -> None:
+	await _assert_uses_indexes(
+		User.filter(phone_number="+12223334455", is_active=True).limit(1),
+	)
+	await _assert_uses_indexes(
+		User.filter(id=test_confirmed_user.id, is_active=True).limit(2),
+	)
@@ -0,0 +1,48 @@
+from typing import Any, Dict, List
+
+import pytest
+from httpx import AsyncClient
+from starlette.types import Send, Scope, Receive
+from tortoise.transactions import in_transaction
+
+from app.replicas import REPLICA_CONNECTION, ReplicaRouter, \
+	ReplicaRoutingMiddleware, _read_from_primary
+from app.todos.models import Todo
+
+
+@pytest.mark.asyncio
+async def test_replica_router(client: AsyncClient) -> None:
+	router = ReplicaRouter()
+	assert router.db_for_read(Todo) == REPLICA_CONNECTION
+	assert router.db_for_write(Todo) is None
+
+	async with in_transaction(Todo._meta.default_connection):
+		assert router.db_for_read(Todo) is None
+
+	token = _read_from_primary.set(True)
+	assert router.db_for_read(Todo) is None
+	_read_from_primary.reset(token)
+
+
+@pytest.mark.asyncio
+async def test_replica_routing_middleware() -> None:
+	reads_from_primary: List[bool] = []
+
+	async def app(scope: Scope, receive: Receive, send: Send) -> None:
+		reads_from_primary.append(_read_from_primary.get())
+		await send({
+			'type': "http.response.start", 'status': 200, 'headers': [],
+		})
+		await send({'type': "http.response.body", 'body': b""})
+
+	async with AsyncClient(
+		app=ReplicaRoutingMiddleware(app, stickiness=5),
+		base_url="http://test",
+	) as client:
+		await client.get("/")
+		response = await client.post("/")
+		cookies: Dict[str, Any] = dict(response.cookies)
+		await client.get("/", cookies=cookies)
+
+	assert reads_from_primary == [False, True, True]
+	assert ReplicaRoutingMiddleware.cookie_name in cookies
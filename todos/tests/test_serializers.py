@@ -0,0 +1,27 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app.serializers import SerializationMismatchError, make_response
+from app.todos.schemas import TodoOut
+
+
+def test_make_response_checks_serialization() -> None:
+	content = {
+		'id': 1,
+		'created_at': datetime(2026, 10, 18, 12, 0, 0, 1, timezone.utc),
+		'updated_at': datetime(2026, 10, 18, 12, 0, 0, 0, timezone.utc),
+		'image_filename': None,
+		'title': "test-title  \"\\",
+		'text': "test-text \u0001 é",
+	}
+
+	assert make_response(content, TodoOut).body \
+		== b'{"id":1,"created_at":"2026-10-18T12:00:00.000001+00:00",' \
+		b'"updated_at":"2026-10-18T12:00:00+00:00","image_filename":null,' \
+		+ '"title":"test-title  \\"\\\\",'.encode() \
+		+ '"text":"test-text \\u0001 é"}'.encode()
+
+	# Keys in another order than in the schema
+	with pytest.raises(SerializationMismatchError):
+		make_response({'text': content.pop("text"), **content}, TodoOut)
@@ -0,0 +1,118 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+
+from app import app
+from app.sms.models import SmsStatus, SmsMessage
+from app.sms.worker import SmsOutboxWorker
+from app.sms.transports import (
+	FakeSmsTransport, SmsTransportError, TwilioSmsTransport,
+)
+from app.accounts.models import User
+from .utils import make_auth_header
+from .sms_stub import app as sms_stub_app
+
+
+class _FailingSmsTransport(FakeSmsTransport):
+	async def send(self, to: str, body: str, /) -> None:
+		raise SmsTransportError("Provider is unavailable.")
+
+
+class _BrokenSmsTransport(FakeSmsTransport):
+	async def send(self, to: str, body: str, /) -> None:
+		if body == "broken-message":
+			raise RuntimeError("Bug in the transport.")
+		await super().send(to, body)
+
+
+@pytest.mark.asyncio
+async def test_ask_confirm_phone_number_sends_sms(
+	client: AsyncClient, test_user: User,
+) -> None:
+	url = app.url_path_for("ask_confirm_phone_number")
+
+	async with client:
+		response = await client.post(url, headers=make_auth_header(test_user))
+
+	assert response.status_code == status.HTTP_200_OK
+
+	message = await SmsMessage.get(to=test_user.phone_number)
+	assert message.status == SmsStatus.PENDING
+	assert message.body.startswith("Confirmation code: ")
+
+	transport = FakeSmsTransport()
+	assert await SmsOutboxWorker(transport).drain_once() == 1
+	assert transport.sent == [(test_user.phone_number, message.body)]
+	assert (await SmsMessage.get(id=message.id)).status == SmsStatus.SENT
+
+
+@pytest.mark.asyncio
+async def test_sms_outbox_retry(client: AsyncClient) -> None:
+	message = await SmsMessage.enqueue("+12223334455", "test-message")
+
+	assert await SmsOutboxWorker(_FailingSmsTransport()).drain_once() == 1
+
+	message = await SmsMessage.get(id=message.id)
+	assert message.status == SmsStatus.PENDING
+	assert message.attempts == 1
+	assert message.last_error == "Provider is unavailable."
+	assert message.send_after > datetime.now(timezone.utc)
+
+	# It is not sent again until the backoff passes
+	assert await SmsOutboxWorker(FakeSmsTransport()).drain_once() == 0
+
+
+@pytest.mark.asyncio
+async def test_sms_outbox_unexpected_error(client: AsyncClient) -> None:
+	broken = await SmsMessage.enqueue("+12223334455", "broken-message")
+	message = await SmsMessage.enqueue("+12223334455", "test-message")
+
+	transport = _BrokenSmsTransport()
+	assert await SmsOutboxWorker(transport).drain_once() == 2
+
+	# The error is recorded and the other message stays sent
+	assert transport.sent == [("+12223334455", "test-message")]
+	assert (await SmsMessage.get(id=message.id)).status == SmsStatus.SENT
+
+	broken = await SmsMessage.get(id=broken.id)
+	assert broken.status == SmsStatus.PENDING
+	assert broken.attempts == 1
+	assert broken.last_error == "Bug in the transport."
+
+
+@pytest.mark.asyncio
+async def test_sms_outbox_reclaims_stale_messages(client: AsyncClient) -> None:
+	message = await SmsMessage.enqueue("+12223334455", "test-message")
+	# Claimed by a worker that stopped before sending it
+	await SmsMessage.filter(id=message.id).update(
+		status=SmsStatus.SENDING, attempts=1,
+	)
+
+	transport = FakeSmsTransport()
+	assert await SmsOutboxWorker(transport).drain_once() == 1
+	assert transport.sent == [("+12223334455", "test-message")]
+
+	message = await SmsMessage.get(id=message.id)
+	assert message.status == SmsStatus.SENT
+	assert message.attempts == 2
+
+
+@pytest.mark.asyncio
+async def test_twilio_sms_transport() -> None:
+	sms_stub_app.state.messages.clear()
+	transport = TwilioSmsTransport(app=sms_stub_app)
+
+	try:
+		await transport.send("+12223334455", "test-message")
+		with pytest.raises(SmsTransportError):
+			# The stub requires a recipient
+			await transport.send("", "test-message")
+	finally:
+		await transport.close()
+
+	assert [
+		(message['to'], message['body'])
+		for message in sms_stub_app.state.messages
+	] == [("+12223334455", "test-message")]
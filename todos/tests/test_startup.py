@@ -0,0 +1,47 @@
+import os
+import sys
+import subprocess
+from typing import Set, Dict, Optional
+
+from app.settings import get_settings
+
+
+settings = get_settings()
+
+
+def get_imported_modules(
+	code: str, env: Optional[Dict[str, str]] = None,
+) -> Set[str]:
+	""":return: Modules imported by the code run in a new interpreter"""
+
+	process = subprocess.run(
+		(sys.executable, "-X", "importtime", "-c", code),
+		cwd=settings.BASE_DIR.parent,
+		env={**os.environ, **(env or {})},
+		capture_output=True,
+		text=True,
+		check=True,
+	)
+	# Lines are like "import time: 12 | 345 |   package.module"
+	return {
+		line.rsplit("|", 1)[1].strip()
+		for line in process.stderr.splitlines()
+		if line.startswith("import time:") and "|" in line
+	}
+
+
+def test_package_import_makes_no_app() -> None:
+	for code in ("import app", "import app.settings"):
+		modules = get_imported_modules(code)
+		assert "fastapi" not in modules
+		assert "tortoise" not in modules
+
+
+def test_app_import_skips_heavy_modules() -> None:
+	modules = get_imported_modules(
+		"from app import app", {'METRICS_ENABLED': "false"},
+	)
+	assert "app.todos.views" in modules
+	assert "PIL" not in modules
+	assert "prometheus_client" not in modules
+	assert "tortoise.contrib.pydantic" not in modules
@@ -1,14 +1,22 @@
-from io import BytesIO
+import csv
+import json
+import asyncio
+import threading
+from io import BytesIO, StringIO
 
 import pytest
 from fastapi import status
+from tortoise import timezone
+from tortoise.backends.base.client import Capabilities
 from httpx import AsyncClient
 
-from app import app
+from app import app, helpers
+from app.helpers import WorkerPool
 from app.settings import get_settings
 from app.todos.models import Todo
+from app.todos.search import search_todos
 from app.accounts.models import User
-from .utils import make_auth_header
+from .utils import make_auth_header, create_test_user
 
 
 settings = get_settings()
@@ -46,6 +54,43 @@ async def test_get_todos(
 	assert json['results'][3]['title'] == "3-title"
 
 
+@pytest.mark.asyncio
+async def test_get_todos_by_cursor(
+	client: AsyncClient,
+	test_confirmed_user: User,
+) -> None:
+	todos_for_create = []
+	for i in range(1, 11):
+		todos_for_create.append(Todo(
+			owner=test_confirmed_user,
+			title=str(i) + "-title",
+			text=str(i) + "-text",
+		))
+	await Todo.bulk_create(todos_for_create)
+
+	url = app.url_path_for("get_todos")
+	headers = make_auth_header(test_confirmed_user)
+
+	async with client:
+		response = await client.get(url + "?cursor=", headers=headers)
+		first_page = response.json()
+		response = await client.get(
+			first_page['next_page_url'], headers=headers,
+		)
+		second_page = response.json()
+		response = await client.get(
+			second_page['previous_page_url'], headers=headers,
+		)
+
+	assert response.status_code == status.HTTP_200_OK
+
+	assert first_page['pages_count'] is None
+	assert first_page['previous_cursor'] is None
+	assert [todo['title'] for todo in second_page['results']] \
+		== ["6-title", "5-title", "4-title", "3-title"]
+	assert response.json()['results'] == first_page['results']
+
+
 @pytest.mark.asyncio
 async def test_create_todo(
 	client: AsyncClient, test_confirmed_user: User, test_image_io: BytesIO,
@@ -69,6 +114,38 @@ async def test_create_todo(
 	assert settings.IMAGES_DIR.joinpath(created_todo.image_filename).exists()
 
 
+@pytest.mark.asyncio
+async def test_create_todo_when_images_pool_is_full(
+	client: AsyncClient,
+	test_confirmed_user: User,
+	test_image_io: BytesIO,
+	monkeypatch: pytest.MonkeyPatch,
+) -> None:
+	pool = WorkerPool(1, max_queue_size=0)
+	monkeypatch.setattr(helpers, "image_processing_pool", pool)
+
+	# Occupy the only worker
+	event = threading.Event()
+	busy_job = asyncio.ensure_future(pool.run(event.wait))
+	await asyncio.sleep(0)
+
+	url = app.url_path_for("create_todo")
+	data = {'title': "test-todo-title", 'text': "test-todo-text"}
+	files = {'image': ("test-image.jpg", test_image_io)}
+	headers = make_auth_header(test_confirmed_user)
+
+	async with client:
+		response \
+			= await client.post(url, data=data, files=files, headers=headers)
+
+	event.set()
+	await busy_job
+	pool.shutdown()
+
+	assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+	assert await Todo.first() is None
+
+
 @pytest.mark.asyncio
 async def test_get_todo(client: AsyncClient, test_todo: Todo) -> None:
 	url = app.url_path_for("get_todo", id=test_todo.id)  # type: ignore
@@ -81,6 +158,32 @@ async def test_get_todo(client: AsyncClient, test_todo: Todo) -> None:
 	assert response.json()['title'] == test_todo.title
 
 
+@pytest.mark.asyncio
+async def test_get_todo_not_modified(
+	client: AsyncClient, test_todo: Todo,
+) -> None:
+	url = app.url_path_for("get_todo", id=test_todo.id)  # type: ignore
+	headers = make_auth_header(await test_todo.owner)
+
+	async with client:
+		response = await client.get(url, headers=headers)
+		etag = response.headers['etag']
+		not_modified_response = await client.get(
+			url, headers={**headers, 'If-None-Match': etag},
+		)
+
+		test_todo.title = "updated-title"  # type: ignore
+		await test_todo.save()
+		modified_response = await client.get(
+			url, headers={**headers, 'If-None-Match': etag},
+		)
+
+	assert not_modified_response.status_code == status.HTTP_304_NOT_MODIFIED
+	assert not_modified_response.content == b""
+	assert modified_response.status_code == status.HTTP_200_OK
+	assert modified_response.json()['title'] == "updated-title"
+
+
 @pytest.mark.asyncio
 async def test_update_todo(client: AsyncClient, test_todo: Todo) -> None:
 	"""I have not done any image-related tests here. The reason for this
@@ -103,6 +206,42 @@ async def test_update_todo(client: AsyncClient, test_todo: Todo) -> None:
 	assert updated_todo.text == "updated-text"
 
 
+@pytest.mark.asyncio
+async def test_update_todo_when_images_pool_is_full(
+	client: AsyncClient,
+	test_todo: Todo,
+	test_image_io: BytesIO,
+	monkeypatch: pytest.MonkeyPatch,
+) -> None:
+	pool = WorkerPool(1, max_queue_size=0)
+	monkeypatch.setattr(helpers, "image_processing_pool", pool)
+
+	# Occupy the only worker
+	event = threading.Event()
+	busy_job = asyncio.ensure_future(pool.run(event.wait))
+	await asyncio.sleep(0)
+
+	url = app.url_path_for("update_todo", id=test_todo.id)  # type: ignore
+	data = {'title': "updated-title", 'text': "updated-text"}
+	files = {'image': ("test-image.jpg", test_image_io)}
+	headers = make_auth_header(await test_todo.owner)
+
+	async with client:
+		response \
+			= await client.put(url, data=data, files=files, headers=headers)
+
+	event.set()
+	await busy_job
+	pool.shutdown()
+
+	assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+	todo = await Todo.get(id=test_todo.id)
+	assert todo.title == test_todo.title
+	assert todo.image_filename == test_todo.image_filename
+	assert settings.IMAGES_DIR.joinpath(todo.image_filename).exists()
+
+
 @pytest.mark.asyncio
 async def test_delete_todo(client: AsyncClient, test_todo: Todo) -> None:
 	url = app.url_path_for("delete_todo", id=test_todo.id)  # type: ignore
@@ -115,3 +254,196 @@ async def test_delete_todo(client: AsyncClient, test_todo: Todo) -> None:
 
 	assert await Todo.get_or_none(id=test_todo.id) is None
 	assert not settings.IMAGES_DIR.joinpath(test_todo.image_filename).exists()
+
+
+@pytest.mark.asyncio
+async def test_todos_batch(
+	client: AsyncClient, test_todo: Todo, test_confirmed_user: User,
+) -> None:
+	headers = make_auth_header(test_confirmed_user)
+
+	async with client:
+		create_response = await client.post(
+			app.url_path_for("create_todos_batch"),
+			headers=headers,
+			json={'todos': [
+				{'title': "%d-title" % i, 'text': "%d-text" % i}
+				for i in range(1, 4)
+			]},
+		)
+		created = create_response.json()['results']
+
+		update_response = await client.put(
+			app.url_path_for("update_todos_batch"),
+			headers=headers,
+			json={'todos': [
+				{'id': todo['id'], 'title': "updated-title", 'text': "text2"}
+				for todo in created[:2]
+			]},
+		)
+
+		delete_url = app.url_path_for("delete_todos_batch")
+		ids = [test_todo.id, created[2]['id']]
+		delete_response = await client.post(
+			delete_url, headers=headers, json={'ids': ids},
+		)
+		missing_delete_response = await client.post(
+			delete_url, headers=headers, json={'ids': [created[0]['id'], *ids]},
+		)
+
+	assert create_response.status_code == status.HTTP_201_CREATED
+	assert [todo['title'] for todo in created] \
+		== ["1-title", "2-title", "3-title"]
+
+	assert update_response.status_code == status.HTTP_200_OK
+	assert [todo['title'] for todo in update_response.json()['results']] \
+		== ["updated-title", "updated-title"]
+
+	assert delete_response.status_code == status.HTTP_204_NO_CONTENT
+	assert not settings.IMAGES_DIR.joinpath(test_todo.image_filename).exists()
+
+	# Nothing is deleted if some of the todos do not exist
+	assert missing_delete_response.status_code == status.HTTP_404_NOT_FOUND
+	assert [todo.title for todo in await Todo.all().order_by("id")] \
+		== ["updated-title", "updated-title"]
+
+
+@pytest.mark.asyncio
+async def test_create_todos_batch_at_the_same_time(
+	client: AsyncClient,
+	test_confirmed_user: User,
+	monkeypatch: pytest.MonkeyPatch,
+) -> None:
+	now = timezone.now()
+	monkeypatch.setattr(timezone, "now", lambda: now)
+	other_todo = await Todo.create(
+		owner=test_confirmed_user,
+		title="other-title",
+		text="other-text",
+		created_at=now,
+	)
+
+	todos = await Todo.create_batch(test_confirmed_user.id, [
+		{'title': "%d-title" % i, 'text': "%d-text" % i} for i in range(1, 4)
+	])
+
+	# The other todo created at the same time is not among them
+	assert [todo.title for todo in todos] == ["1-title", "2-title", "3-title"]
+	assert other_todo.id not in {todo.id for todo in todos}
+	for todo in todos:
+		assert (await Todo.get(id=todo.id)).title == todo.title
+	# Listed newest first in the order of the batch
+	listed = await Todo.filter(id__in=[todo.id for todo in todos])
+	assert [todo.title for todo in listed] == ["1-title", "2-title", "3-title"]
+
+
+@pytest.mark.asyncio
+async def test_todos_batch_is_limited_to_owner(
+	client: AsyncClient, test_todo: Todo,
+) -> None:
+	other_user = await create_test_user(
+		phone_number="+23334445566", phone_number_is_confirmed=True,
+	)
+
+	async with client:
+		response = await client.put(
+			app.url_path_for("update_todos_batch"),
+			headers=make_auth_header(other_user),
+			json={'todos': [
+				{'id': test_todo.id, 'title': "updated-title", 'text': "text2"},
+			]},
+		)
+
+	assert response.status_code == status.HTTP_404_NOT_FOUND
+	assert (await Todo.get(id=test_todo.id)).title == test_todo.title
+
+
+@pytest.mark.asyncio
+async def test_search_todos(
+	client: AsyncClient,
+	test_confirmed_user: User,
+	monkeypatch: pytest.MonkeyPatch,
+) -> None:
+	monkeypatch.setattr(settings, "TODOS_SEARCH_PER_PAGE", 2)
+	await Todo.bulk_create([
+		Todo(owner=test_confirmed_user, title="Buy milk", text="Go to shop"),
+		Todo(owner=test_confirmed_user, title="Call mom", text="About milk"),
+		Todo(owner=test_confirmed_user, title="Fix bike", text="Buy tyres"),
+	])
+	await Todo.create(
+		owner=test_confirmed_user, title="Buy more milk", text="Buying milk",
+	)
+
+	url = app.url_path_for("search_todos_view")
+	headers = make_auth_header(test_confirmed_user)
+
+	async with client:
+		response = await client.get(url, params={'q': "milk"}, headers=headers)
+		first_page = response.json()
+		response = await client.get(
+			first_page['next_page_url'], headers=headers,
+		)
+		second_page = response.json()
+
+		await Todo.filter(title="Fix bike").update(text="Some milk")
+		response = await client.get(
+			url, params={'q': "bike milk"}, headers=headers,
+		)
+
+	# Todos with the word in their titles and several times go first
+	assert [todo['title'] for todo in first_page['results']] \
+		== ["Buy more milk", "Buy milk"]
+	assert [todo['title'] for todo in second_page['results']] \
+		== ["Call mom"]
+	assert second_page['next_page_url'] is None
+
+	# The index follows updates
+	assert [todo['title'] for todo in response.json()['results']] \
+		== ["Fix bike"]
+
+
+@pytest.mark.asyncio
+async def test_search_todos_on_unsupported_database(
+	client: AsyncClient,
+	test_confirmed_user: User,
+	monkeypatch: pytest.MonkeyPatch,
+) -> None:
+	connection = Todo._choose_db()
+	monkeypatch.setattr(
+		connection, "capabilities", Capabilities("mysql"),
+	)
+
+	with pytest.raises(RuntimeError, match="not mysql"):
+		await search_todos(test_confirmed_user.id, "milk", None, 1)
+
+
+@pytest.mark.asyncio
+async def test_export_todos(
+	client: AsyncClient,
+	test_confirmed_user: User,
+	monkeypatch: pytest.MonkeyPatch,
+) -> None:
+	monkeypatch.setattr(settings, "TODOS_EXPORT_CHUNK_SIZE", 3)
+	await Todo.bulk_create([
+		Todo(owner=test_confirmed_user, title=str(i) + "-title", text="text")
+		for i in range(1, 11)
+	])
+
+	url = app.url_path_for("export_todos_view")
+	headers = make_auth_header(test_confirmed_user)
+
+	async with client:
+		response = await client.get(url, headers=headers)
+		csv_response = await client.get(
+			url, params={'format': "csv"}, headers=headers,
+		)
+
+	assert response.status_code == status.HTTP_200_OK
+	assert response.headers['content-type'] == "application/x-ndjson"
+	todos = [json.loads(line) for line in response.text.splitlines()]
+	assert [todo['title'] for todo in todos] \
+		== [str(i) + "-title" for i in range(10, 0, -1)]
+
+	rows = list(csv.DictReader(StringIO(csv_response.text)))
+	assert [row['title'] for row in rows] == [todo['title'] for todo in todos]
+	assert rows[0]['created_at'] == todos[0]['created_at']
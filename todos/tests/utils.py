@@ -7,8 +7,10 @@ def make_auth_header(user: User) -> Dict[str, str]:
 	return {'Authorization': "Bearer " + user.generate_token()}
 
 
-async def create_test_user(**kwargs: Any) -> User:
-	rv = User(phone_number="+12223334455", **kwargs)
+async def create_test_user(
+	phone_number: str = "+12223334455", **kwargs: Any,
+) -> User:
+	rv = User(phone_number=phone_number, **kwargs)
 	rv.set_password("test-password")
 	await rv.save()
 